@@ -0,0 +1,338 @@
+## =========================================================
+## Copyright 2019 Dietrich Bollmann
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##      http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+## ---------------------------------------------------------
+
+"""benchmarks/bench_filters.py:
+
+Microbenchmarks of the html, latex, markdown and html_paragraphs
+filters and of the resolution of nested paths by get_path_value().
+
+The filters are called directly - with the jinja2 context and the
+variables they get when a template is rendered - on the corpora of
+filter_corpora.py.  Every case reports
+
+  - ns_per_call:         the best time per call of '--repeat' runs,
+  - peak_bytes_per_call: the peak of the memory allocated during a
+                         call - measured with tracemalloc,
+  - retained_bytes_per_call, retained_blocks_per_call:
+                         the memory still allocated after the calls,
+                         e.g. by caches - reported as 0 below the noise
+                         floor of 64 bytes per call.
+
+The filters are measured without filter cache ('uncached') and - with
+'--filter-cache' - with a filter cache returning the cached results
+('cached').
+
+Usage - from the root of the repository:
+
+  python -m benchmarks.bench_filters -o results.json
+  python -m benchmarks.bench_filters -c latex -c paths --filter-cache
+  python -m benchmarks.bench_filters -b baseline.json --threshold 0.1
+
+"""
+
+import gc
+import sys
+import time
+import tempfile
+import tracemalloc
+
+import click
+
+from benchmarks.filter_corpora import corpus_settings, corpora, PATHS
+from benchmarks.results import make_results, save_results, load_results, \
+    compare_results, print_comparison, DEFAULT_THRESHOLD
+
+## =========================================================
+## Benchmark settings
+## ---------------------------------------------------------
+
+# The filters, the extension of the template file they are used in
+# and whether they are called with the context or the environment
+FILTERS = {
+    'html':            ('html', 'context'),
+    'latex':           ('tex',  'context'),
+    'markdown':        ('md',   'context'),
+    'html_paragraphs': ('html', 'environment'),
+}
+
+# The benchmarked components: the filters and the nested paths
+COMPONENTS = sorted(FILTERS) + ['paths']
+
+# Minimal duration of a measurement in seconds
+DEFAULT_MIN_TIME = 0.2
+
+# Number of calls measured with tracemalloc
+_TRACED_CALLS = 20
+
+# Memory retained per call below this number of bytes - or released,
+# e.g. by a cache evicting entries - is reported as 0: the free lists
+# and caches of the interpreter make these numbers noise
+_RETAINED_NOISE_FLOOR = 64
+
+# Resetting the peak of the traced memory needs python 3.9 -
+# with older versions the peak of a call is the peak so far
+_reset_peak = getattr(tracemalloc, 'reset_peak', lambda: None)
+
+# The metrics compared with a baseline
+COMPARED_METRICS = ['ns_per_call', 'peak_bytes_per_call']
+
+## =========================================================
+## Filter calls
+## ---------------------------------------------------------
+
+def _get_filter(name):
+    """Import and return the filter function of the given name.
+    """
+    if name == 'html':
+        from newskylabs.temple.templates.filters.html import html_filter
+        return html_filter
+    elif name == 'latex':
+        from newskylabs.temple.templates.filters.latex import latex_filter
+        return latex_filter
+    elif name == 'markdown':
+        from newskylabs.temple.templates.filters.markdown import markdown_filter
+        return markdown_filter
+    else:
+        from newskylabs.temple.templates.filters.html_paragraphs import html_paragraph_filter
+        return html_paragraph_filter
+
+def _template_variables(extension):
+    """Return the variables of a template file with the given extension
+    - prepared like by the template engine.
+    """
+    from newskylabs.temple.templates.jinja import template_variables
+    from newskylabs.temple.utils.flat_index import FlatIndex
+    from newskylabs.temple.utils.views import hyphen_to_underscore_view, read_only
+
+    variables = hyphen_to_underscore_view(corpus_settings())
+    return template_variables('bench.{}'.format(extension), variables,
+                              index=FlatIndex(read_only(variables)))
+
+def _filter_call(name, text, work_dir, filter_cache=False):
+    """Return a function calling the given filter on the given text.
+    """
+    from newskylabs.temple.templates.jinja import EnvironmentRegistry
+    from newskylabs.temple.templates.cache import FilterCache
+
+    extension, argument = FILTERS[name]
+
+    cache = FilterCache(directory=work_dir) if filter_cache else None
+    registry = EnvironmentRegistry(work_dir, filter_cache=cache)
+    env = registry.get_environment(registry.profile_for('bench.{}'.format(extension)))
+
+    function = _get_filter(name)
+    if argument == 'environment':
+        return lambda: function(env, text)
+
+    context = env.from_string('').new_context(_template_variables(extension))
+
+    # Without filter cache the text is converted every time
+    # - instead of being taken from the memory cache of the converted
+    #   markdown texts
+    if name == 'markdown' and not filter_cache:
+        from newskylabs.temple.templates.filters.markdown import convert
+
+        def call():
+            convert.cache_clear()
+            return function(context, text)
+
+        return call
+
+    return lambda: function(context, text)
+
+def _path_call(path):
+    """Return a function resolving the given nested path.
+    """
+    from newskylabs.temple.templates.filters.nested_paths import get_path_value
+
+    variables = _template_variables('tex')
+    return lambda: get_path_value(variables, path)
+
+## =========================================================
+## Measurements
+## ---------------------------------------------------------
+
+def _time_calls(call, loops):
+    start = time.perf_counter()
+    for _ in range(loops):
+        call()
+    return time.perf_counter() - start
+
+def measure_time(call, repeat=5, min_time=DEFAULT_MIN_TIME):
+    """Return the best time per call in nanoseconds.
+
+    The number of calls of a measurement is increased
+    until it takes at least 'min_time' seconds.
+    """
+    loops = 1
+    while True:
+        seconds = _time_calls(call, loops)
+        if seconds >= min_time:
+            break
+        loops *= 10 if seconds < min_time / 10 else 2
+
+    best = seconds
+    for _ in range(repeat - 1):
+        best = min(best, _time_calls(call, loops))
+
+    return best / loops * 1e9
+
+def measure_memory(call, calls=_TRACED_CALLS):
+    """Return the peak of the memory allocated during a call
+    and the memory and number of blocks retained after the calls.
+    """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        baseline = tracemalloc.get_traced_memory()[0]
+
+        peak = 0
+        for _ in range(calls):
+            current = tracemalloc.get_traced_memory()[0]
+            _reset_peak()
+            call()
+            peak = max(peak, tracemalloc.get_traced_memory()[1] - current)
+
+        gc.collect()
+        retained = tracemalloc.get_traced_memory()[0] - baseline
+        blocks = sum(stat.count_diff for stat in
+                     tracemalloc.take_snapshot().compare_to(before, 'filename'))
+
+    finally:
+        tracemalloc.stop()
+
+    retained /= calls
+    if retained < _RETAINED_NOISE_FLOOR:
+        retained, blocks = 0, 0
+
+    return {
+        'peak_bytes_per_call':      peak,
+        'retained_bytes_per_call':  retained,
+        'retained_blocks_per_call': max(blocks, 0) / calls,
+    }
+
+def measure(call, repeat=5, min_time=DEFAULT_MIN_TIME):
+    """Return the measurements of the given call.
+    """
+    # Warm up: import modules, fill caches
+    call()
+
+    measurements = {'ns_per_call': measure_time(call, repeat=repeat, min_time=min_time)}
+    measurements.update(measure_memory(call))
+    return measurements
+
+## =========================================================
+## Cases
+## ---------------------------------------------------------
+
+def run_cases(components, repeat=5, min_time=DEFAULT_MIN_TIME, filter_cache=False, out=None):
+    """Run the benchmarks of the given components
+    and return the results of the cases.
+    """
+    out = out or sys.stdout
+    texts = corpora()
+
+    results = {}
+    with tempfile.TemporaryDirectory(prefix='temple-bench-') as work_dir:
+        for component in components:
+
+            if component == 'paths':
+                for corpus, path in sorted(PATHS.items()):
+                    case = 'paths/{}'.format(corpus)
+                    results[case] = {
+                        'params':   {'path': path},
+                        'uncached': measure(_path_call(path), repeat=repeat, min_time=min_time),
+                    }
+                    _print_case(case, results[case], out)
+                continue
+
+            for corpus, text in sorted(texts.items()):
+                case = '{}/{}'.format(component, corpus)
+                results[case] = {'params': {'characters': len(text)}}
+
+                phases = ['uncached']
+                if filter_cache and FILTERS[component][1] == 'context':
+                    phases.append('cached')
+
+                for phase in phases:
+                    call = _filter_call(component, text, work_dir,
+                                        filter_cache=(phase == 'cached'))
+                    results[case][phase] = measure(call, repeat=repeat, min_time=min_time)
+
+                _print_case(case, results[case], out)
+
+    return results
+
+def _print_case(case, result, file):
+    for phase, measurements in sorted(result.items()):
+        if phase == 'params':
+            continue
+        print('{:<24} {:<8} {:>12.0f} ns/call  {:>10.0f} B peak/call  {:>8.1f} B retained/call'.format(
+            case, phase, measurements['ns_per_call'], measurements['peak_bytes_per_call'],
+            measurements['retained_bytes_per_call']), file=file)
+
+## =========================================================
+## Command line
+## ---------------------------------------------------------
+
+@click.command()
+@click.option('-c', '--component', 'components', multiple=True,
+              type=click.Choice(COMPONENTS),
+              help='Filter to benchmark - or paths for the nested paths; '
+              'can be given several times (default: all).')
+@click.option('-r', '--repeat', type=click.IntRange(min=1), default=5, show_default=True,
+              help='Number of measurements of each case - the best one is reported.')
+@click.option('--min-time', type=click.FloatRange(min=0), default=DEFAULT_MIN_TIME,
+              show_default=True, help='Minimal duration of a measurement in seconds.')
+@click.option('--filter-cache', is_flag=True,
+              help='Measure the filters with a filter cache as well.')
+@click.option('-o', '--output', 'results_file', type=click.Path(dir_okay=False),
+              default=None, help="Save the results as json - '-' for stdout.")
+@click.option('-b', '--baseline', 'baseline_file', type=click.Path(exists=True, dir_okay=False),
+              default=None, help='Compare the results with the given baseline results.')
+@click.option('-t', '--threshold', type=float, default=DEFAULT_THRESHOLD, show_default=True,
+              help='Relative change of a metric considered a regression.')
+def main(components, repeat, min_time, filter_cache, results_file, baseline_file, threshold):
+    """Microbenchmark the text filters and the nested paths.
+    """
+
+    # Print the report to stderr
+    # when the results are written to stdout
+    out = sys.stderr if results_file == '-' else sys.stdout
+
+    results = run_cases(components or COMPONENTS, repeat=repeat, min_time=min_time,
+                        filter_cache=filter_cache, out=out)
+
+    results = make_results('filters', results)
+    if results_file:
+        save_results(results, results_file)
+
+    # Compare with the baseline
+    if baseline_file:
+        print('', file=out)
+        comparison = compare_results(results, load_results(baseline_file),
+                                     COMPARED_METRICS, threshold=threshold)
+        if print_comparison(comparison, threshold=threshold, file=out):
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
+
+## =========================================================
+## =========================================================
+
+## fin.
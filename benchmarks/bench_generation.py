@@ -0,0 +1,336 @@
+## =========================================================
+## Copyright 2019 Dietrich Bollmann
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##      http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+## ---------------------------------------------------------
+
+"""benchmarks/bench_generation.py:
+
+End-to-end benchmarks of TemplateEngine.generate() on synthetic
+template trees - see synthetic_tree.py.
+
+Every scenario is generated
+
+  - cold: in a fresh process with empty bytecode cache, filter cache
+    and tree index,
+  - warm: in another fresh process reusing the caches of the cold run,
+
+and the best of '--repeat' runs is reported: the duration, files/s,
+MB/s of generated output and the peak RSS of the generating process.
+
+Usage - from the root of the repository:
+
+  python -m benchmarks.bench_generation -o results.json
+  python -m benchmarks.bench_generation -s small -s filters --repeat 5
+  python -m benchmarks.bench_generation --files 2000 --depth 6 -s custom
+  python -m benchmarks.bench_generation -b baseline.json --threshold 0.1
+
+With '--baseline', the results are compared with the baseline results
+and the exit status is 1 when a metric got worse by more than the
+threshold.
+
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import resource
+import multiprocessing
+
+from contextlib import redirect_stdout
+
+import click
+import yaml
+
+from benchmarks.synthetic_tree import TreeSpec, synthesize_tree
+from benchmarks.results import make_results, save_results, load_results, \
+    compare_results, print_comparison, DEFAULT_THRESHOLD
+
+## =========================================================
+## Scenarios
+## ---------------------------------------------------------
+
+SCENARIOS = {
+    # Many small text files
+    'small':    TreeSpec(files=200, depth=2, file_size=2 * 1024),
+
+    # A larger tree with deeper directories
+    'large':    TreeSpec(files=2000, depth=5, file_size=8 * 1024),
+
+    # Mostly binary assets which are copied
+    'assets':   TreeSpec(files=300, depth=3, file_size=256 * 1024, binary_share=0.8),
+
+    # LaTeX templates
+    'latex':    TreeSpec(files=300, depth=3, file_size=8 * 1024, tex_share=0.8),
+
+    # Templates using the html, latex and markdown filters heavily
+    'filters':  TreeSpec(files=300, depth=3, file_size=8 * 1024, filter_density=0.6),
+
+    # File and directory names containing jinja delimiters
+    'templated': TreeSpec(files=500, depth=4, file_size=1024, templated_share=0.5),
+
+    # A few large files
+    'big-files': TreeSpec(files=20, depth=1, file_size=4 * 1024 * 1024, binary_share=0.0,
+                          tex_share=0.0, filter_density=0.0),
+
+    # Parameterized with the command line options only
+    'custom':   TreeSpec(),
+}
+
+# The scenarios run by default
+DEFAULT_SCENARIOS = ['small', 'large', 'assets', 'latex', 'filters', 'templated']
+
+# The project type and name used for the benchmarks
+_PROJECT_TYPE = 'bench-project'
+_PROJECT_NAME = 'bench'
+
+# The metrics compared with a baseline
+COMPARED_METRICS = ['seconds', 'peak_rss_mb']
+
+## =========================================================
+## Benchmark settings
+## ---------------------------------------------------------
+
+def _write_settings(work_dir, template_dir, project_dir):
+    """Write the settings used to generate the benchmark project
+    and return the path of the settings file.
+
+    The caches are kept in the working directory.
+    """
+    cache_dir = os.path.join(work_dir, 'cache')
+    settings = {
+        'author': {
+            'first-name':  'Bench',
+            'family-name': 'Mark',
+        },
+        'bytecode-cache': {
+            'enabled':   True,
+            'directory': os.path.join(cache_dir, 'bytecode'),
+        },
+        'filter-cache': {
+            'enabled':   True,
+            'directory': os.path.join(cache_dir, 'filters'),
+        },
+        'tree-index': {
+            'enabled':   True,
+            'directory': os.path.join(cache_dir, 'index'),
+        },
+        _PROJECT_TYPE: {
+            'template-dir':       template_dir,
+            'project-dir':        project_dir,
+            'delimiter-profiles': {'tex': 'latex'},
+        },
+    }
+
+    settings_file = os.path.join(work_dir, 'settings.yaml')
+    with open(settings_file, 'w') as fh:
+        yaml.safe_dump(settings, fh)
+
+    return settings_file
+
+## =========================================================
+## Measuring a generation
+## ---------------------------------------------------------
+
+def _peak_rss_mb():
+    """Return the peak RSS of this process and its children in MB.
+    """
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+
+    # ru_maxrss is given in bytes on macOS and in kilobytes elsewhere
+    if sys.platform == 'darwin':
+        return peak / (1024 * 1024)
+    return peak / 1024
+
+def _output_size(project_dir):
+    """Return the number of files and bytes of the generated project.
+    """
+    files = 0
+    size  = 0
+    for dirpath, dirnames, filenames in os.walk(project_dir):
+        for filename in filenames:
+            if filename.startswith('.temple-'):
+                continue
+            files += 1
+            size  += os.path.getsize(os.path.join(dirpath, filename))
+
+    return files, size
+
+def _generate(settings_file, project_dir, jobs):
+    """Generate the benchmark project - run in a fresh process.
+    Return the measurements of the generation.
+    """
+    from newskylabs.temple.defaults import DEFAULT_SETTINGS_FILE
+    from newskylabs.temple.utils.settings_loader import TempleSettings
+    from newskylabs.temple.templates.engine import TemplateEngine
+
+    # The settings are not taken from snapshots
+    settings = TempleSettings(DEFAULT_SETTINGS_FILE, settings_file, snapshot_dir=None)
+
+    # Silence the messages of the engine
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        start = time.perf_counter()
+        engine = TemplateEngine(_PROJECT_TYPE, _PROJECT_NAME, settings)
+        engine.generate(verbose=False, jobs=jobs)
+        seconds = time.perf_counter() - start
+
+    files, size = _output_size(project_dir)
+
+    return {
+        'seconds':     seconds,
+        'files':       files,
+        'bytes':       size,
+        'files_per_s': files / seconds,
+        'mb_per_s':    size / (1024 * 1024) / seconds,
+        'peak_rss_mb': _peak_rss_mb(),
+    }
+
+def _generate_in_fresh_process(settings_file, project_dir, jobs):
+    """Generate the benchmark project in a fresh python process
+    - so no module, template or filter result is kept in memory.
+    """
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(1) as pool:
+        return pool.apply(_generate, (settings_file, project_dir, jobs))
+
+def run_scenario(spec, work_dir, repeat=3, jobs=1):
+    """Generate the tree of the given TreeSpec cold and warm 'repeat'
+    times and return the best measurements of both phases.
+    """
+    template_dir = os.path.join(work_dir, 'templates')
+    output_dir   = os.path.join(work_dir, 'output')
+    cache_dir    = os.path.join(work_dir, 'cache')
+    project_dir  = os.path.join(output_dir, _PROJECT_NAME)
+
+    counts = synthesize_tree(spec, template_dir)
+    settings_file = _write_settings(work_dir, template_dir, output_dir)
+
+    best = {}
+    for run in range(repeat):
+        for phase in ['cold', 'warm']:
+
+            # The cold run starts with empty caches,
+            # the warm run reuses them
+            if phase == 'cold':
+                shutil.rmtree(cache_dir, ignore_errors=True)
+            shutil.rmtree(output_dir, ignore_errors=True)
+
+            measurements = _generate_in_fresh_process(settings_file, project_dir, jobs)
+            if phase not in best or measurements['seconds'] < best[phase]['seconds']:
+                best[phase] = measurements
+
+    params = spec.as_dict()
+    params['jobs'] = jobs
+    params['counts'] = counts
+
+    return dict(best, params=params)
+
+## =========================================================
+## Command line
+## ---------------------------------------------------------
+
+def _print_scenario(name, result, file):
+    print('{}:'.format(name), file=file)
+    for phase in ['cold', 'warm']:
+        measurements = result[phase]
+        print('  {:<4}  {:8.3f} s  {:9.1f} files/s  {:8.2f} MB/s  {:8.1f} MB peak RSS'.format(
+            phase, measurements['seconds'], measurements['files_per_s'],
+            measurements['mb_per_s'], measurements['peak_rss_mb']), file=file)
+
+@click.command()
+@click.option('-s', '--scenario', 'scenarios', multiple=True,
+              type=click.Choice(sorted(SCENARIOS)),
+              help='Scenario to run - can be given several times '
+              '(default: {}).'.format(', '.join(DEFAULT_SCENARIOS)))
+@click.option('--files', type=click.IntRange(min=1), default=None,
+              help='Number of files of the template trees.')
+@click.option('--depth', type=click.IntRange(min=0), default=None,
+              help='Maximal depth of the directories.')
+@click.option('--file-size', type=click.IntRange(min=1), default=None,
+              help='Approximate size of the files in bytes.')
+@click.option('--binary-share', type=click.FloatRange(0, 1), default=None,
+              help='Share of binary assets.')
+@click.option('--tex-share', type=click.FloatRange(0, 1), default=None,
+              help='Share of .tex templates.')
+@click.option('--templated-share', type=click.FloatRange(0, 1), default=None,
+              help='Share of file and directory names containing jinja delimiters.')
+@click.option('--filter-density', type=click.FloatRange(0, 1), default=None,
+              help='Share of the paragraphs passed through a filter.')
+@click.option('-r', '--repeat', type=click.IntRange(min=1), default=3, show_default=True,
+              help='Number of runs of each scenario - the best run is reported.')
+@click.option('-j', '--jobs', type=click.IntRange(min=1), default=1, show_default=True,
+              help='Number of worker processes generating the files.')
+@click.option('-o', '--output', 'results_file', type=click.Path(dir_okay=False),
+              default=None, help="Save the results as json - '-' for stdout.")
+@click.option('-b', '--baseline', 'baseline_file', type=click.Path(exists=True, dir_okay=False),
+              default=None, help='Compare the results with the given baseline results.')
+@click.option('-t', '--threshold', type=float, default=DEFAULT_THRESHOLD, show_default=True,
+              help='Relative change of a metric considered a regression.')
+@click.option('--keep', type=click.Path(file_okay=False), default=None,
+              help='Keep the template trees and generated projects in the given directory.')
+def main(scenarios, files, depth, file_size, binary_share, tex_share, templated_share,
+         filter_density, repeat, jobs, results_file, baseline_file, threshold, keep):
+    """Benchmark the generation of projects from synthetic template trees.
+    """
+    overrides = {
+        'files':           files,
+        'depth':           depth,
+        'file_size':       file_size,
+        'binary_share':    binary_share,
+        'tex_share':       tex_share,
+        'templated_share': templated_share,
+        'filter_density':  filter_density,
+    }
+    overrides = {key: value for key, value in overrides.items() if value is not None}
+
+    # Print the report to stderr
+    # when the results are written to stdout
+    out = sys.stderr if results_file == '-' else sys.stdout
+
+    results = {}
+    for name in scenarios or DEFAULT_SCENARIOS:
+        spec = SCENARIOS[name].replace(**overrides)
+
+        if keep:
+            work_dir = os.path.join(keep, name)
+            shutil.rmtree(work_dir, ignore_errors=True)
+            os.makedirs(work_dir)
+            results[name] = run_scenario(spec, work_dir, repeat=repeat, jobs=jobs)
+        else:
+            with tempfile.TemporaryDirectory(prefix='temple-bench-') as work_dir:
+                results[name] = run_scenario(spec, work_dir, repeat=repeat, jobs=jobs)
+
+        _print_scenario(name, results[name], out)
+
+    results = make_results('generation', results)
+    if results_file:
+        save_results(results, results_file)
+
+    # Compare with the baseline
+    if baseline_file:
+        print('', file=out)
+        comparison = compare_results(results, load_results(baseline_file),
+                                     COMPARED_METRICS, threshold=threshold)
+        if print_comparison(comparison, threshold=threshold, file=out):
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
+
+## =========================================================
+## =========================================================
+
+## fin.
@@ -0,0 +1,157 @@
+## =========================================================
+## Copyright 2019 Dietrich Bollmann
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##      http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+## ---------------------------------------------------------
+
+"""benchmarks/filter_corpora.py:
+
+Corpora for the filter microbenchmarks:
+
+  - inline:  short inline fragments,
+  - long:    long multi-paragraph bodies,
+  - nested:  deeply nested <i><b><sc> markup,
+  - vars:    many <temple var> tags with nested paths,
+
+the variables the <temple var> tags refer to and the paths used to
+benchmark the resolution of nested paths.
+
+"""
+
+import random
+
+## =========================================================
+## Corpora settings
+## ---------------------------------------------------------
+
+# The words used to fill the texts
+_WORDS = ('lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod '
+          'tempor incididunt ut labore et dolore magna aliqua enim ad minim veniam '
+          'quis nostrud exercitation ullamco laboris nisi aliquip ex ea commodo').split()
+
+# Seed of the random generator
+# - the corpora are the same for every run
+_SEED = 0
+
+# Depth of the nested markup
+NESTING_DEPTH = 12
+
+## =========================================================
+## Variables
+## ---------------------------------------------------------
+
+def corpus_settings():
+    """Return the settings the <temple var> tags of the corpora refer to
+    - as they are given in a settings file.
+    """
+    return {
+        'author': {
+            'first-name':  'Bench',
+            'family-name': 'Mark',
+        },
+        'address-type': 'private',
+        'email': {
+            'private': {
+                'tex':  'bench@private.example',
+                'html': 'bench@private.example',
+            },
+            'work': {
+                'tex':  'bench@work.example',
+                'html': 'bench@work.example',
+            },
+        },
+        'some': {
+            'path':  'another',
+            'other': {'path': 'path'},
+        },
+        'another': {'path': 'a'},
+        'also':    {'a': {'path': 'value'}},
+    }
+
+# The paths used to benchmark the resolution of nested paths
+PATHS = {
+    # A plain path
+    'flat':      'author.first-name',
+
+    # A path with a nested path
+    'nested':    'email.{address-type}.tex',
+
+    # A path depending on the template file
+    # - which is not indexed
+    'template':  'email.{address-type}.{temple.template.file-extension}',
+
+    # Recursively nested paths
+    'recursive': 'also.{{some.path}.{some.other.path}}.path',
+}
+
+## =========================================================
+## Corpora
+## ---------------------------------------------------------
+
+def _words(rng, count):
+    return ' '.join(rng.choice(_WORDS) for _ in range(count))
+
+def _inline(rng):
+    """A short inline fragment.
+    """
+    return '{} <em>{}</em> {} <sc>{}</sc><em-dash/>{}'.format(
+        _words(rng, 3), _words(rng, 2), _words(rng, 2), _words(rng, 1), _words(rng, 3))
+
+def _long(rng, paragraphs=20):
+    """A long multi-paragraph body with some markup.
+    """
+    body = []
+    for _ in range(paragraphs):
+        sentences = []
+        for _ in range(5):
+            sentences.append('{} <em>{}</em> {} <b>{}</b> {}.'.format(
+                _words(rng, 6), _words(rng, 2), _words(rng, 5), _words(rng, 1), _words(rng, 4)))
+        body.append(' '.join(sentences))
+    return '\n\n'.join(body)
+
+def _nested(rng, depth=NESTING_DEPTH):
+    """Deeply nested <i><b><sc> markup.
+    """
+    tags = ['i', 'b', 'sc']
+    opening = ''
+    closing = ''
+    for level in range(depth):
+        tag = tags[level % len(tags)]
+        opening += '<{}>{} '.format(tag, _words(rng, 2))
+        closing = ' {}</{}>'.format(_words(rng, 2), tag) + closing
+    return opening + _words(rng, 3) + closing
+
+def _vars(rng, tags=40):
+    """Many <temple var> tags with nested paths.
+    """
+    parts = []
+    for _ in range(tags):
+        parts.append('{} <temple var="{}"/>'.format(
+            _words(rng, 3), rng.choice(list(PATHS.values()))))
+    return ' '.join(parts)
+
+def corpora():
+    """Return a dictionary of the corpora.
+    """
+    rng = random.Random(_SEED)
+    return {
+        'inline': _inline(rng),
+        'long':   _long(rng),
+        'nested': _nested(rng),
+        'vars':   _vars(rng),
+    }
+
+## =========================================================
+## =========================================================
+
+## fin.
@@ -0,0 +1,171 @@
+## =========================================================
+## Copyright 2019 Dietrich Bollmann
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##      http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+## ---------------------------------------------------------
+
+"""benchmarks/results.py:
+
+Benchmark results: saving them as json and comparing them with the
+results of a baseline.
+
+The results of a benchmark run are a dictionary:
+
+  {
+    'version':     format version,
+    'benchmark':   name of the benchmark suite,
+    'environment': python version, platform, temple version...,
+    'results': {
+      <case>: {
+        'params':  parameters of the case,
+        <phase>: {<metric>: value, ...},
+        ...
+      },
+      ...
+    },
+  }
+
+Only the metrics given to compare_results() are compared - all of them
+lower-is-better, like durations or memory.
+
+"""
+
+import sys
+import json
+import time
+import platform
+
+from newskylabs.temple.__about__ import __version__
+
+## =========================================================
+## Results settings
+## ---------------------------------------------------------
+
+# Version of the results format
+RESULTS_FORMAT_VERSION = 1
+
+# Default regression threshold:
+# a metric 10% worse than the baseline is a regression
+DEFAULT_THRESHOLD = 0.10
+
+## =========================================================
+## Saving and loading results
+## ---------------------------------------------------------
+
+def environment():
+    """Return a description of the environment the benchmarks run in.
+    """
+    return {
+        'python':         platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform':       platform.platform(),
+        'machine':        platform.machine(),
+        'temple':         __version__,
+        'time':           time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+def make_results(benchmark, results):
+    """Return the results of the given benchmark suite
+    with a description of the environment.
+    """
+    return {
+        'version':     RESULTS_FORMAT_VERSION,
+        'benchmark':   benchmark,
+        'environment': environment(),
+        'results':     results,
+    }
+
+def save_results(results, results_file):
+    """Save the given results as json - to stdout when 'results_file' is '-'.
+    """
+    if results_file == '-':
+        json.dump(results, sys.stdout, indent=2, sort_keys=True)
+        print()
+    else:
+        with open(results_file, 'w') as fh:
+            json.dump(results, fh, indent=2, sort_keys=True)
+            fh.write('\n')
+
+def load_results(results_file):
+    """Load results saved with save_results().
+    """
+    with open(results_file) as fh:
+        results = json.load(fh)
+
+    if results.get('version') != RESULTS_FORMAT_VERSION:
+        raise ValueError('Unsupported results format in {}'.format(results_file))
+
+    return results
+
+## =========================================================
+## Comparing results
+## ---------------------------------------------------------
+
+def compare_results(results, baseline, metrics, threshold=DEFAULT_THRESHOLD):
+    """Compare the given results with the results of a baseline.
+
+    Return a list of (case, phase, metric, baseline_value, value,
+    change, regression) tuples - where 'change' is the relative
+    change of the value and 'regression' tells whether the change
+    exceeds the threshold.  Cases and phases missing in one of the
+    results are ignored.
+    """
+    comparison = []
+    for case, case_results in sorted(results['results'].items()):
+        baseline_case = baseline['results'].get(case)
+        if baseline_case is None:
+            continue
+
+        for phase, phase_results in sorted(case_results.items()):
+            baseline_phase = baseline_case.get(phase)
+            if phase == 'params' or not isinstance(baseline_phase, dict):
+                continue
+
+            for metric in metrics:
+                value          = phase_results.get(metric)
+                baseline_value = baseline_phase.get(metric)
+                if value is None or not baseline_value:
+                    continue
+
+                change = (value - baseline_value) / baseline_value
+                comparison.append((case, phase, metric, baseline_value, value,
+                                   change, change > threshold))
+
+    return comparison
+
+def print_comparison(comparison, threshold=DEFAULT_THRESHOLD, file=None):
+    """Print a comparison returned by compare_results().
+    Return the number of regressions.
+    """
+    file = file or sys.stdout
+
+    print('Comparison with the baseline (threshold: {:+.0%}):'.format(threshold), file=file)
+    print('', file=file)
+
+    regressions = 0
+    for case, phase, metric, baseline_value, value, change, regression in comparison:
+        if regression:
+            regressions += 1
+        print('  {:<6} {:<28} {:<6} {:<16} {:>12.4g} -> {:>12.4g}  {:+7.1%}'.format(
+            'WORSE' if regression else 'ok', case, phase, metric,
+            baseline_value, value, change), file=file)
+
+    print('', file=file)
+    print('{} regressions'.format(regressions), file=file)
+
+    return regressions
+
+## =========================================================
+## =========================================================
+
+## fin.
@@ -0,0 +1,206 @@
+## =========================================================
+## Copyright 2019 Dietrich Bollmann
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##      http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+## ---------------------------------------------------------
+
+"""benchmarks/synthetic_tree.py:
+
+Synthetic template trees for the benchmarks.
+
+A tree is described by a TreeSpec:
+
+  - files:          number of files,
+  - depth:          maximal depth of the directories,
+  - file_size:      approximate size of the files in bytes,
+  - binary_share:   share of binary assets (copied, not rendered),
+  - tex_share:      share of .tex templates (latex delimiters and filter),
+  - templated_share: share of file and directory names containing
+                    jinja delimiters,
+  - filter_density: share of the paragraphs of a template passed
+                    through the html, latex or markdown filter,
+  - seed:           seed of the random generator.
+
+The same spec always results in the same tree.
+
+"""
+
+import os
+import random
+
+## =========================================================
+## Tree settings
+## ---------------------------------------------------------
+
+# Number of subdirectories of each directory
+_BRANCHING = 4
+
+# The words used to fill the templates
+_WORDS = ('lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod '
+          'tempor incididunt ut labore et dolore magna aliqua enim ad minim veniam '
+          'quis nostrud exercitation ullamco laboris nisi aliquip ex ea commodo').split()
+
+# Number of words of a paragraph
+_PARAGRAPH_WORDS = 30
+
+## =========================================================
+## class TreeSpec
+## ---------------------------------------------------------
+
+class TreeSpec():
+    """The parameters of a synthetic template tree.
+    """
+
+    def __init__(self, files=100, depth=3, file_size=4096, binary_share=0.1,
+                 tex_share=0.1, templated_share=0.05, filter_density=0.1, seed=0):
+        """
+        """
+        self.files           = files
+        self.depth           = depth
+        self.file_size       = file_size
+        self.binary_share    = binary_share
+        self.tex_share       = tex_share
+        self.templated_share = templated_share
+        self.filter_density  = filter_density
+        self.seed            = seed
+
+    def replace(self, **params):
+        """Return a copy of the spec with the given parameters replaced.
+        """
+        spec = self.as_dict()
+        spec.update(params)
+        return TreeSpec(**spec)
+
+    def as_dict(self):
+        return {
+            'files':           self.files,
+            'depth':           self.depth,
+            'file_size':       self.file_size,
+            'binary_share':    self.binary_share,
+            'tex_share':       self.tex_share,
+            'templated_share': self.templated_share,
+            'filter_density':  self.filter_density,
+            'seed':            self.seed,
+        }
+
+## =========================================================
+## Template contents
+## ---------------------------------------------------------
+
+def _sentence(rng):
+    """Return a random sentence with some markup of the temple filters.
+    """
+    words = [rng.choice(_WORDS) for _ in range(_PARAGRAPH_WORDS)]
+    words[rng.randrange(len(words))] = '<em>{}</em>'.format(rng.choice(_WORDS))
+    words[rng.randrange(len(words))] = '<sc>{}</sc>'.format(rng.choice(_WORDS))
+    words[rng.randrange(len(words))] = '<em-dash/>'
+    words[rng.randrange(len(words))] = '<temple var="author.name"/>'
+    return ' '.join(words)
+
+def _plain(rng):
+    """Return a random paragraph without markup.
+    """
+    return ' '.join(rng.choice(_WORDS) for _ in range(_PARAGRAPH_WORDS))
+
+def _text_template(rng, spec, kind):
+    """Return the content of a template of the given kind:
+    'html', 'md', 'tex' or 'txt'.
+    """
+    if kind == 'tex':
+        expression = '<< {} >>'
+    else:
+        expression = '{{{{ {} }}}}'
+
+    paragraphs = []
+    size = 0
+    while size < spec.file_size:
+
+        if rng.random() < spec.filter_density:
+
+            # A paragraph passed through a filter
+            if kind == 'tex':
+                paragraph = expression.format("'{}' | latex".format(_sentence(rng)))
+            elif kind == 'md':
+                paragraph = expression.format(
+                    "'## {}\\n\\n{} *{}*' | markdown".format(
+                        rng.choice(_WORDS), _plain(rng), rng.choice(_WORDS)))
+            else:
+                paragraph = expression.format("'{}' | html".format(_sentence(rng)))
+
+        else:
+            # A paragraph with some variables
+            paragraph = '{} {} - {} {}'.format(
+                _plain(rng), expression.format('project.name'),
+                expression.format('author.name'), _plain(rng))
+
+        paragraphs.append(paragraph)
+        size += len(paragraph) + 2
+
+    return '\n\n'.join(paragraphs) + '\n'
+
+## =========================================================
+## synthesize_tree()
+## ---------------------------------------------------------
+
+def synthesize_tree(spec, directory):
+    """Write the template tree described by the given TreeSpec
+    to the given directory
+    and return the number of files of each kind.
+    """
+    rng = random.Random(spec.seed)
+    counts = {'binary': 0, 'tex': 0, 'html': 0, 'md': 0, 'txt': 0, 'templated': 0}
+
+    for index in range(spec.files):
+
+        # The directory of the file
+        parts = []
+        for level in range(rng.randint(0, spec.depth)):
+            name = 'dir{}'.format(rng.randrange(_BRANCHING))
+            if rng.random() < spec.templated_share:
+                name = '{{{{ project.name }}}}-{}'.format(name)
+            parts.append(name)
+
+        # The kind of the file
+        draw = rng.random()
+        if draw < spec.binary_share:
+            kind = 'binary'
+        elif draw < spec.binary_share + spec.tex_share:
+            kind = 'tex'
+        else:
+            kind = rng.choice(['html', 'md', 'txt'])
+        counts[kind] += 1
+
+        # The name of the file
+        extension = 'png' if kind == 'binary' else kind
+        name = 'file{}.{}'.format(index, extension)
+        if rng.random() < spec.templated_share:
+            name = '{{{{ project.name }}}}-{}'.format(name)
+            counts['templated'] += 1
+
+        file_dir = os.path.join(directory, *parts)
+        os.makedirs(file_dir, exist_ok=True)
+        path = os.path.join(file_dir, name)
+
+        if kind == 'binary':
+            with open(path, 'wb') as fh:
+                fh.write(rng.getrandbits(8 * spec.file_size).to_bytes(spec.file_size, 'little'))
+        else:
+            with open(path, 'w') as fh:
+                fh.write(_text_template(rng, spec, kind))
+
+    return counts
+
+## =========================================================
+## =========================================================
+
+## fin.
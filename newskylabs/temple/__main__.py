@@ -42,6 +42,10 @@ from newskylabs.temple.__about__ import (
  
 from newskylabs.temple.scripts.temple import cli
 
+# Make 'python -m newskylabs.temple' work as well
+if __name__ == '__main__':
+    cli()
+
 ## =========================================================
 ## =========================================================
 
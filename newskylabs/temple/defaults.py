@@ -0,0 +1,134 @@
+## =========================================================
+## Copyright 2019 Dietrich Bollmann
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##      http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+## ---------------------------------------------------------
+
+"""newskylabs/temple/defaults.py:
+
+Choices and default values shared by the command line script and the
+temple modules.
+
+They are defined in a module without dependencies on the other
+modules so that the options of the command line script can be defined
+without importing the modules implementing them.
+
+"""
+
+from pathlib import Path
+
+## =========================================================
+## Settings
+## ---------------------------------------------------------
+
+# The default settings
+DEFAULT_SETTINGS_FILE = Path(__file__).parent / 'scripts' / 'default_settings.yaml'
+
+## =========================================================
+## Copy modes
+## ---------------------------------------------------------
+
+# Copy the data with the generic python implementation
+COPY_MODE_COPY            = 'copy'
+
+# Share the data blocks on copy-on-write filesystems (btrfs, xfs, ...)
+COPY_MODE_REFLINK         = 'reflink'
+
+# Copy the data inside the kernel
+COPY_MODE_COPY_FILE_RANGE = 'copy-file-range'
+COPY_MODE_SENDFILE        = 'sendfile'
+
+# Link to the source file instead of copying it
+COPY_MODE_HARDLINK        = 'hardlink'
+COPY_MODE_SYMLINK         = 'symlink'
+
+# Use the fastest strategy available - falling back
+# from reflink to copy-file-range, sendfile and copy
+COPY_MODE_AUTO            = 'auto'
+
+COPY_MODES = [
+    COPY_MODE_AUTO,
+    COPY_MODE_COPY,
+    COPY_MODE_REFLINK,
+    COPY_MODE_COPY_FILE_RANGE,
+    COPY_MODE_SENDFILE,
+    COPY_MODE_HARDLINK,
+    COPY_MODE_SYMLINK,
+]
+
+DEFAULT_COPY_MODE = COPY_MODE_AUTO
+
+## =========================================================
+## Archive formats
+## ---------------------------------------------------------
+
+# Archive formats and the corresponding tarfile stream modes
+# ('zip' archives are written with zipfile)
+ARCHIVE_FORMATS = {
+    'tar':     'w|',
+    'tar.gz':  'w|gz',
+    'tar.bz2': 'w|bz2',
+    'tar.xz':  'w|xz',
+    'zip':     None,
+}
+
+# The archive format used when streaming to stdout
+DEFAULT_ARCHIVE_FORMAT = 'tar'
+
+## =========================================================
+## Server settings
+## ---------------------------------------------------------
+
+# The unix socket the server listens on by default
+# - only the user can connect to it
+DEFAULT_SOCKET = '~/.newskylabs/temple/server.sock'
+
+# The port the server listens on with 'temple serve --tcp'
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+
+## =========================================================
+## Watcher settings
+## ---------------------------------------------------------
+
+# Seconds to wait for further modifications
+# before reporting a burst of modifications
+DEFAULT_DEBOUNCE = 0.2
+
+## =========================================================
+## Profiling settings
+## ---------------------------------------------------------
+
+# Number of the slowest templates reported by 'temple generate --profile'
+DEFAULT_PROFILE_TOP = 10
+
+## =========================================================
+## Generation messages
+## ---------------------------------------------------------
+
+# The formats of the messages printed by 'temple generate':
+# the usual text or the generation events as json lines
+LOG_FORMATS = ['text', 'json']
+DEFAULT_LOG_FORMAT = 'text'
+
+## =========================================================
+## Data files
+## ---------------------------------------------------------
+
+# Extensions of json data files
+JSON_EXTENSIONS = ['.json']
+
+## =========================================================
+## =========================================================
+
+## fin.
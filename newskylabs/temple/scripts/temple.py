@@ -25,58 +25,66 @@ import os
 import click
 
 from pathlib import Path
+from contextlib import redirect_stdout
 
-from newskylabs.utils.settings import Settings
-from newskylabs.temple.templates.engine \
-    import TemplateEngine, UndefinedProjectTypeError
+# Only the defaults used by the options are imported here:
+# The modules implementing the commands - and jinja2, yaml etc. -
+# are imported by the commands using them
+# so 'temple --help' and simple commands start fast
+from newskylabs.temple.defaults import DEFAULT_SETTINGS_FILE, COPY_MODES, \
+    ARCHIVE_FORMATS, DEFAULT_ARCHIVE_FORMAT, DEFAULT_SOCKET, DEFAULT_HOST, DEFAULT_PORT, \
+    DEFAULT_DEBOUNCE, JSON_EXTENSIONS, DEFAULT_PROFILE_TOP, LOG_FORMATS, DEFAULT_LOG_FORMAT
 
 ## =========================================================
-## Entry point of console script 'temple'
-## ---------------------------------------------------------
-
-## =========================================================
-## Group:
-## ---------------------------------------------------------
-
-@click.group(context_settings={'help_option_names': ['-h', '--help']})
-# Version options: -V, --version
-###@click.version_option(get_version_long(), '-V', '--version')
-def cli():
-    """
-    temple - a simple tool to generate project sceletons from templates.
-    """
-
-## =========================================================
-## Command: generate
+## Utilities
 ## ---------------------------------------------------------
 
-@cli.command(name="generate")
-@click.argument('type', type=str)
-@click.argument('name', type=str, required=False)
-def command_generate(type, name):
-    """Generate a project of the given TYPE with the given name.
-    When TYPE is a yaml file, interpret it as project data file
-    and merge the data into the temple settings.
+def settings_files():
+    """Return the paths of the default settings file
+    and of the user settings file.
     """
 
-    # Get the directory of this file 
-    this_dir = Path(__file__).parent;
-
-    # Calculate the path of the default settings file
-    default_settings_file = this_dir / 'default_settings.yaml'
+    # The default settings file
+    # is located in the directory of this file 
+    default_settings_file = DEFAULT_SETTINGS_FILE
     
     # Calculate the path of the user setting file
     user_settings_file = Path.home() / '.newskylabs/temple/settings.yaml'
 
+    return default_settings_file, user_settings_file
+
+def load_settings(project_settings_file=None):
+    """Load the temple settings
+    - merged with the given project settings file.
+    """
+    from newskylabs.temple.utils.settings_loader import TempleSettings
+
+    default_settings_file, user_settings_file = settings_files()
+
     # Settings
     # The settings are calculated by 
     # overwriting the default settings with and the user settings
-    settings = Settings(default_settings_file, user_settings_file)
+    # - and the project settings when given
+    settings_files_ = [default_settings_file, user_settings_file]
+    if project_settings_file:
+        settings_files_.append(project_settings_file)
+
+    return TempleSettings(*settings_files_)
+
+def load_project_settings(type):
+    """Load the temple settings for a project of the given TYPE.
+
+    When TYPE is a yaml or json file, interpret it as project data file
+    and merge the data into the temple settings.
+
+    Return the settings and the project type.
+    """
 
-    # when TYPE is a yaml file (has one of the extensions '.yaml' or '.yml'),
-    # interpret it as a project settings file
+    # when TYPE is a yaml file (has one of the extensions '.yaml' or '.yml')
+    # or a json file, interpret it as a project settings file
     if type[-5:] == '.yaml' or \
-       type[-4:] == '.yml':
+       type[-4:] == '.yml' or \
+       os.path.splitext(type)[1] in JSON_EXTENSIONS:
 
         settings_file = type
 
@@ -86,7 +94,7 @@ def command_generate(type, name):
             sys.exit(1)
 
         # Merge in the given project settings
-        settings.merge_settings_file(settings_file)
+        settings = load_settings(settings_file)
 
         # DEBUG
         #| print('DEBUG Settings:', settings.get_settings())
@@ -100,12 +108,207 @@ def command_generate(type, name):
             print("ERROR A 'project' entry has to be defined in the settings!")
             sys.exit(1)
 
+    else:
+        # Settings
+        settings = load_settings()
+
+    return settings, type
+
+## =========================================================
+## Entry point of console script 'temple'
+## ---------------------------------------------------------
+
+## =========================================================
+## Group:
+## ---------------------------------------------------------
+
+@click.group(context_settings={'help_option_names': ['-h', '--help']})
+# Version options: -V, --version
+###@click.version_option(get_version_long(), '-V', '--version')
+def cli():
+    """
+    temple - a simple tool to generate project sceletons from templates.
+    """
+
+## =========================================================
+## Command: generate
+## ---------------------------------------------------------
+
+@cli.command(name="generate")
+@click.argument('type', type=str)
+@click.argument('name', type=str, required=False)
+@click.option('--bytecode-cache/--no-bytecode-cache', default=None,
+              help='Cache the compiled templates on disk '
+              '(default: the bytecode-cache settings).')
+@click.option('--filter-cache/--no-filter-cache', default=None,
+              help='Cache the results of the html, latex and markdown filters on disk '
+              '(default: the filter-cache settings).')
+@click.option('--tree-index/--no-tree-index', default=None,
+              help='Persist the index of the template tree '
+              '(default: the tree-index settings).')
+@click.option('-j', '--jobs', type=click.IntRange(min=1), default=1,
+              help='Number of worker processes rendering and copying the files.')
+@click.option('--copy-mode', type=click.Choice(COPY_MODES), default=None,
+              help='Strategy used to copy the files which are not rendered '
+              '(default: the copy-mode setting of the project type).')
+@click.option('-a', '--archive', type=click.Path(dir_okay=False, allow_dash=True), default=None,
+              help="Write the project into a tar or zip archive instead of the "
+              "project directory - use '-' to stream it to stdout.")
+@click.option('--archive-format', type=click.Choice(list(ARCHIVE_FORMATS)), default=None,
+              help='Format of the archive '
+              '(default: derived from the archive extension, or tar).')
+@click.option('-w', '--watch', is_flag=True,
+              help='Keep watching the templates and settings after the generation '
+              'and update the project when they are modified.')
+@click.option('--debounce', type=click.FloatRange(min=0), default=DEFAULT_DEBOUNCE,
+              show_default=True,
+              help='Seconds to wait for further modifications before updating.')
+@click.option('--profile', is_flag=True,
+              help='Report the wall and CPU time spent in each phase of the generation '
+              'and the slowest templates.')
+@click.option('--profile-top', type=click.IntRange(min=0), default=DEFAULT_PROFILE_TOP,
+              show_default=True, help='Number of the slowest templates reported.')
+@click.option('--profile-trace', type=click.Path(dir_okay=False), default=None,
+              help='Write the phases as Chrome trace-event json timeline '
+              '(implies --profile).')
+@click.option('--profile-memory', is_flag=True,
+              help='Report the peak of the memory allocated for each file with tracemalloc '
+              '(implies --profile).')
+@click.option('-q', '--quiet', is_flag=True,
+              help='Do not print the generated files and messages.')
+@click.option('--log-format', type=click.Choice(LOG_FORMATS), default=DEFAULT_LOG_FORMAT,
+              show_default=True,
+              help='Print the messages as text or the generation events as json lines.')
+@click.option('--progress', is_flag=True,
+              help='Print the number of generated files, the throughput '
+              'and the estimated time left to stderr.')
+@click.option('--metrics-file', type=click.Path(dir_okay=False), default=None,
+              help='Write the statistics of the generation as Prometheus textfile.')
+@click.option('--state', is_flag=True,
+              help="Record the generation state in the file .temple-state.json "
+              "of the project - needed by 'temple update'.")
+def command_generate(type, name, bytecode_cache, filter_cache, tree_index, jobs, copy_mode,
+                     archive, archive_format, watch, debounce,
+                     profile, profile_top, profile_trace, profile_memory,
+                     quiet, log_format, progress, metrics_file, state):
+    """Generate a project of the given TYPE with the given name.
+    When TYPE is a yaml or json file, interpret it as project data file
+    and merge the data into the temple settings.
+    """
+
+    # The observer receiving the generation events
+    observer = get_observer(quiet, log_format, progress)
+
+    # The profiler recording the phases of the generation
+    # - also used to count the compilations and the filter calls
+    profiler = None
+    profile = profile or bool(profile_trace) or profile_memory
+    if profile or metrics_file:
+        from newskylabs.temple.utils.profiling import Profiler
+        latencies = None
+        if metrics_file:
+            from newskylabs.temple.templates.metrics import get_latencies
+            latencies = get_latencies()
+        profiler = Profiler(trace=bool(profile_trace), memory=profile_memory,
+                            latencies=latencies)
+
+    # The observer collecting the metrics
+    metrics = None
+    if metrics_file:
+        from newskylabs.temple.templates.metrics import MetricsObserver
+        from newskylabs.temple.templates.events import ObserverGroup
+        metrics = MetricsObserver(profiler)
+        observer = ObserverGroup(observer.get_observers() + [metrics])
+
+    # Watch mode
+    if watch:
+        if archive:
+            raise click.UsageError('--watch cannot be used together with --archive')
+        if profile:
+            raise click.UsageError('--watch cannot be used together with --profile')
+        if metrics:
+            raise click.UsageError('--watch cannot be used together with --metrics-file')
+        watch_project(type, name, bytecode_cache, filter_cache, tree_index, jobs, copy_mode,
+                      debounce, observer=observer)
+        return
+
+    if archive:
+        from newskylabs.temple.templates.sinks import ArchiveSink
+
+    # When streaming the archive to stdout,
+    # print all messages to stderr
+    if archive == '-':
+        sink = ArchiveSink(sys.stdout.buffer, archive_format)
+        with redirect_stdout(sys.stderr):
+            generate_project(type, name, bytecode_cache, filter_cache, tree_index, jobs,
+                             copy_mode, sink, profiler=profiler, observer=observer,
+                             state=state)
+    elif archive:
+        generate_project(type, name, bytecode_cache, filter_cache, tree_index, jobs, copy_mode,
+                         ArchiveSink(archive, archive_format), profiler=profiler,
+                         observer=observer, state=state)
+    else:
+        generate_project(type, name, bytecode_cache, filter_cache, tree_index, jobs, copy_mode,
+                         profiler=profiler, observer=observer, state=state)
+
+    # Write the metrics
+    if metrics:
+        metrics.save(metrics_file)
+
+    # Report the profile
+    if profile:
+        out = sys.stderr if archive == '-' else sys.stdout
+        profiler.print_report(top=profile_top, file=out)
+        print('', file=out)
+
+        if profile_trace:
+            profiler.save_trace(profile_trace)
+            print('Trace written to {}'.format(profile_trace), file=out)
+            print('', file=out)
+
+def get_observer(quiet=False, log_format=DEFAULT_LOG_FORMAT, progress=False):
+    """Return the observer receiving the generation events
+    - see newskylabs/temple/templates/events.py.
+    """
+    from newskylabs.temple.templates.events import ConsoleObserver, JsonObserver, \
+        ProgressObserver, ObserverGroup
+
+    observers = []
+
+    # The messages
+    if log_format == 'json':
+        observers.append(JsonObserver())
+    elif not quiet:
+        observers.append(ConsoleObserver(verbose=True))
+
+    # The progress
+    if progress:
+        observers.append(ProgressObserver())
+
+    return ObserverGroup(observers)
+
+def generate_project(type, name, bytecode_cache, filter_cache, tree_index, jobs, copy_mode,
+                     sink=None, profiler=None, observer=None, state=False):
+    """Generate a project of the given TYPE with the given name
+    and write it to the given output sink
+    - profiling the generation with the given Profiler
+    and reporting it to the given observer.
+    When 'state' is True, the generation state is recorded.
+    """
+    from newskylabs.temple.templates.engine \
+        import TemplateEngine, TempleException, UndefinedProjectTypeError
+
+    # Settings
+    settings, type = load_project_settings(type)
+
     # Instantiate the TemplateEngine
     try:
         engine = TemplateEngine(type, name, settings)
 
         # Generate the project
-        engine.generate()
+        engine.generate(bytecode_cache=bytecode_cache, filter_cache=filter_cache,
+                        tree_index=tree_index, jobs=jobs, copy_mode=copy_mode, sink=sink,
+                        profiler=profiler, observer=observer, state=state)
 
     except UndefinedProjectTypeError as e:
 
@@ -114,15 +317,560 @@ def command_generate(type, name):
         print('ERROR', e.message)
         sys.exit(1)
 
+    except TempleException as e:
+
+        # Print error message
+        # The template directory does not exist,
+        # the project exists already,
+        # or a file could not be rendered or copied
+        print('ERROR', e.message)
+        sys.exit(1)
+
     finally:
         # Currently nothing to do here
         pass
 
+    # Done
+    if not _is_quiet(observer):
+        print('')
+        print('done.')
+        print('')
+
+def _is_quiet(observer):
+    """Return True when the given observer prints no messages.
+    """
+    from newskylabs.temple.templates.events import ConsoleObserver, ObserverGroup
+
+    if isinstance(observer, ObserverGroup):
+        return not any(isinstance(member, ConsoleObserver) for member in observer.get_observers())
+    return observer is not None and not isinstance(observer, ConsoleObserver)
+
+def _print_watching(template_dir, observer):
+    """Print that the given template directory is watched
+    - unless the observer prints no messages.
+    """
+    if not _is_quiet(observer):
+        print('')
+        print('Watching {} - press Ctrl-C to stop.'.format(template_dir))
+        print('')
+
+def watch_project(type, name, bytecode_cache, filter_cache, tree_index, jobs, copy_mode,
+                  debounce, observer=None):
+    """Generate a project of the given TYPE with the given name
+    and update it whenever its templates or settings are modified
+    - reporting the generations to the given observer.
+    """
+    from newskylabs.temple.templates.engine import TemplateEngine, TempleException
+    from newskylabs.temple.utils.file_watcher import create_watcher, watch
+
+    options = {
+        'bytecode_cache': bytecode_cache,
+        'filter_cache':   filter_cache,
+        'tree_index':     tree_index,
+        'jobs':           jobs,
+        'copy_mode':      copy_mode,
+        'observer':       observer,
+        # Keep the environments and compiled templates
+        # and compile modified templates again
+        'registries':     {},
+        'auto_reload':    True,
+    }
+
+    # Settings
+    settings, project_type = load_project_settings(type)
+
+    try:
+        engine = TemplateEngine(project_type, name, settings)
+
+        # Generate the project
+        # - with the generation state needed by the updates
+        engine.generate(state=True, **options)
+
+    except TempleException as e:
+
+        # Print error message
+        print('ERROR', e.message)
+        sys.exit(1)
+
+    # The settings files
+    watched_settings = set(os.path.abspath(str(path)) for path in settings_files())
+    if project_type != type:
+        watched_settings.add(os.path.abspath(type))
+
+    template_dir = engine.get_template_dir()
+    watcher = create_watcher([template_dir] + list(watched_settings))
+    changes = watch(watcher, debounce=debounce)
+
+    _print_watching(template_dir, observer)
+
+    try:
+        while True:
+            changed = next(changes)
+            try:
+                # Reload modified settings
+                if changed & watched_settings:
+                    settings, project_type = load_project_settings(type)
+                    engine = TemplateEngine(project_type, name, settings)
+
+                    # Watch the new template directory
+                    # when the settings changed it
+                    if engine.get_template_dir() != template_dir:
+                        template_dir = engine.get_template_dir()
+                        watcher.close()
+                        watcher = create_watcher([template_dir] + list(watched_settings))
+                        changes = watch(watcher, debounce=debounce)
+
+                # Re-render the files affected by the modifications
+                engine.update(**options)
+
+            except TempleException as e:
+
+                # Print error message
+                # and keep watching
+                print('ERROR', e.message)
+
+            _print_watching(template_dir, observer)
+
+    except KeyboardInterrupt:
+        pass
+
+    finally:
+        watcher.close()
+
+## =========================================================
+## Command: update
+## ---------------------------------------------------------
+
+@cli.command(name="update")
+@click.argument('type', type=str)
+@click.argument('name', type=str, required=False)
+@click.option('-f', '--force', is_flag=True,
+              help='Overwrite files which have been modified since their generation.')
+@click.option('--remove-obsolete', is_flag=True,
+              help='Remove the files which are not generated any more '
+              'and have not been modified since their generation.')
+@click.option('--bytecode-cache/--no-bytecode-cache', default=None,
+              help='Cache the compiled templates on disk '
+              '(default: the bytecode-cache settings).')
+@click.option('--filter-cache/--no-filter-cache', default=None,
+              help='Cache the results of the html, latex and markdown filters on disk '
+              '(default: the filter-cache settings).')
+@click.option('--tree-index/--no-tree-index', default=None,
+              help='Persist the index of the template tree '
+              '(default: the tree-index settings).')
+@click.option('-j', '--jobs', type=click.IntRange(min=1), default=1,
+              help='Number of worker processes rendering and copying the files.')
+@click.option('--copy-mode', type=click.Choice(COPY_MODES), default=None,
+              help='Strategy used to copy the files which are not rendered '
+              '(default: the copy-mode setting of the project type).')
+def command_update(type, name, force, remove_obsolete, bytecode_cache, filter_cache, tree_index,
+                   jobs, copy_mode):
+    """Update a project generated with 'temple generate'.
+    Only the files whose templates, included templates
+    or variables have changed are rendered again.
+    """
+    from newskylabs.temple.templates.engine import TemplateEngine, TempleException
+
+    # Settings
+    settings, type = load_project_settings(type)
+
+    try:
+        engine = TemplateEngine(type, name, settings)
+
+        # Update the project
+        outcomes = engine.update(force=force, bytecode_cache=bytecode_cache,
+                                 filter_cache=filter_cache,
+                                 tree_index=tree_index, jobs=jobs, copy_mode=copy_mode,
+                                 remove_obsolete=remove_obsolete)
+
+    except TempleException as e:
+
+        # Print error message
+        print('ERROR', e.message)
+        sys.exit(1)
+
+    # Summary
+    print('')
+    print('{} updated, {} unchanged, {} conflicts, {} obsolete'.format(
+        len(outcomes['updated']), len(outcomes['unchanged']),
+        len(outcomes['conflict']), len(outcomes['obsolete'])))
+    if outcomes['removed']:
+        print('{} obsolete files removed'.format(len(outcomes['removed'])))
+
+    if outcomes['conflict']:
+        print('')
+        print("Modified files have not been overwritten - use '--force' to overwrite them.")
+
+    if outcomes['obsolete']:
+        print('')
+        if remove_obsolete:
+            print('Obsolete files modified since their generation have been kept.')
+        else:
+            print("Obsolete files have been kept - "
+                  "use '--remove-obsolete' to remove the unmodified ones.")
+
+    # Done
+    print('')
+    print('done.')
+    print('')
+
+## =========================================================
+## Command: serve
+## ---------------------------------------------------------
+
+@cli.command(name="serve")
+@click.option('--socket', 'socket_path', type=click.Path(dir_okay=False),
+              default=DEFAULT_SOCKET, show_default=True,
+              help='Unix socket to listen on.')
+@click.option('--tcp', is_flag=True,
+              help='Listen on a localhost port instead of the unix socket.')
+@click.option('--host', type=str, default=DEFAULT_HOST, show_default=True,
+              help='Host to listen on with --tcp.')
+@click.option('--port', type=int, default=DEFAULT_PORT, show_default=True,
+              help='Port to listen on with --tcp.')
+@click.option('-q', '--quiet', is_flag=True,
+              help='Do not log the requests.')
+def command_serve(socket_path, tcp, host, port, quiet):
+    """Run a temple server generating projects on request.
+    The settings and the compiled templates are kept in memory
+    and reloaded only when they have been modified.
+    Use 'temple client' to send requests.
+    """
+    from newskylabs.temple.templates.server import TempleService, serve
+
+    service = TempleService(load_settings, settings_files())
+    serve(service, host=host, port=port, socket_path=None if tcp else socket_path,
+          verbose=not quiet)
+
+## =========================================================
+## Command: client
+## ---------------------------------------------------------
+
+def parse_overrides(overrides):
+    """Parse a list of PATH=VALUE settings overrides into a nested
+    dictionary.  The values are parsed as yaml.
+    """
+    import yaml
+
+    settings = {}
+    for override in overrides:
+        path, separator, value = override.partition('=')
+        if not separator or not path:
+            raise click.BadParameter("'{}' is not of the form PATH=VALUE".format(override))
+
+        keys = path.split('.')
+        target = settings
+        for key in keys[:-1]:
+            target = target.setdefault(key, {})
+        target[keys[-1]] = yaml.safe_load(value)
+
+    return settings
+
+@cli.command(name="client")
+@click.argument('type', type=str)
+@click.argument('name', type=str, required=False)
+@click.option('-s', '--set', 'overrides', multiple=True, metavar='PATH=VALUE',
+              help='Overwrite a setting, for example: -s author.first-name=Me')
+@click.option('--socket', 'socket_path', type=click.Path(dir_okay=False),
+              default=DEFAULT_SOCKET, show_default=True,
+              help='Unix socket of the temple server.')
+@click.option('--tcp', is_flag=True,
+              help='Connect to a localhost port instead of the unix socket.')
+@click.option('--host', type=str, default=DEFAULT_HOST, show_default=True,
+              help='Host of the temple server with --tcp.')
+@click.option('--port', type=int, default=DEFAULT_PORT, show_default=True,
+              help='Port of the temple server with --tcp.')
+@click.option('-j', '--jobs', type=click.IntRange(min=1), default=None,
+              help='Number of worker processes rendering and copying the files.')
+@click.option('--copy-mode', type=click.Choice(COPY_MODES), default=None,
+              help='Strategy used to copy the files which are not rendered.')
+@click.option('-a', '--archive', type=click.Path(dir_okay=False, allow_dash=True), default=None,
+              help="Write the project into a tar or zip archive instead of the "
+              "project directory - use '-' to stream it to stdout.")
+@click.option('--archive-format', type=click.Choice(list(ARCHIVE_FORMATS)), default=None,
+              help='Format of the archive '
+              '(default: derived from the archive extension, or tar).')
+def command_client(type, name, overrides, socket_path, tcp, host, port, jobs, copy_mode,
+                   archive, archive_format):
+    """Generate a project of the given TYPE with a running temple server.
+    When TYPE is a yaml or json file, it is interpreted as project data file.
+    """
+    from newskylabs.temple.templates.sinks import archive_format_for
+    from newskylabs.temple.templates.server import request_generate
+
+    # The request
+    request = {
+        'name':     name,
+        'settings': parse_overrides(overrides),
+        'cwd':      os.getcwd(),
+        'options':  {},
+    }
+
+    if type[-5:] == '.yaml' or \
+       type[-4:] == '.yml' or \
+       os.path.splitext(type)[1] in JSON_EXTENSIONS:
+        request['data'] = os.path.abspath(type)
+    else:
+        request['type'] = type
+
+    if jobs is not None:
+        request['options']['jobs'] = jobs
+    if copy_mode is not None:
+        request['options']['copy_mode'] = copy_mode
+
+    if archive:
+        if archive_format is None and archive != '-':
+            archive_format = archive_format_for(archive)
+        request['archive_format'] = archive_format or DEFAULT_ARCHIVE_FORMAT
+
+    # Messages are printed to stderr
+    # when the archive is streamed to stdout
+    out = sys.stderr if archive == '-' else sys.stdout
+
+    try:
+        result, data = request_generate(request, host=host, port=port,
+                                        socket_path=None if tcp else socket_path)
+
+    except OSError as e:
+        print('ERROR Unable to connect to the temple server: {}'.format(e), file=out)
+        sys.exit(1)
+
+    print(result['output'], end='', file=out)
+
+    if not result['success']:
+        print('ERROR', result['message'], file=out)
+        sys.exit(1)
+
+    # Write the archive
+    if archive == '-':
+        sys.stdout.buffer.write(data)
+        sys.stdout.buffer.flush()
+    elif archive:
+        with open(archive, 'wb') as fh:
+            fh.write(data)
+
+    # Done
+    print('', file=out)
+    print('done.', file=out)
+    print('', file=out)
+
+## =========================================================
+## Command: generate-batch
+## ---------------------------------------------------------
+
+@cli.command(name="generate-batch")
+@click.argument('manifest', type=click.Path(exists=True, dir_okay=False))
+@click.option('--bytecode-cache/--no-bytecode-cache', default=None,
+              help='Cache the compiled templates on disk '
+              '(default: the bytecode-cache settings).')
+@click.option('--filter-cache/--no-filter-cache', default=None,
+              help='Cache the results of the html, latex and markdown filters on disk '
+              '(default: the filter-cache settings).')
+@click.option('--tree-index/--no-tree-index', default=None,
+              help='Persist the index of the template trees '
+              '(default: the tree-index settings).')
+@click.option('-j', '--jobs', type=click.IntRange(min=1), default=1,
+              help='Number of worker processes generating the projects.')
+@click.option('--copy-mode', type=click.Choice(COPY_MODES), default=None,
+              help='Strategy used to copy the files which are not rendered '
+              '(default: the copy-mode setting of the project type).')
+def command_generate_batch(manifest, bytecode_cache, filter_cache, tree_index, jobs, copy_mode):
+    """Generate all projects listed in the MANIFEST yaml file.
+    Each entry of the manifest defines the project 'type' or a
+    project 'data' file, and optionally the project 'name' and 
+    'settings' overwriting the temple settings.
+    """
+    from newskylabs.temple.templates.engine import TempleException
+    from newskylabs.temple.templates.batch import generate_batch
+
+    # Settings
+    # loaded only once for all projects
+    settings = load_settings()
+
+    try:
+        results = generate_batch(manifest, settings, jobs=jobs,
+                                 bytecode_cache=bytecode_cache,
+                                 filter_cache=filter_cache,
+                                 tree_index=tree_index,
+                                 copy_mode=copy_mode)
+
+    except TempleException as e:
+
+        # Print error message
+        # The manifest could not be read
+        print('ERROR', e.message)
+        sys.exit(1)
+
+    # Print a summary
+    failures = [result for result in results if not result.success]
+
+    print('')
+    print('Summary:')
+    print('')
+    for result in results:
+        if result.success:
+            print('  ok      {}'.format(result.label))
+        else:
+            print('  FAILED  {}: {}'.format(result.label, result.message))
+    print('')
+    print('{} projects generated, {} failed.'.format(len(results) - len(failures), len(failures)))
+    print('')
+
+    if failures:
+        sys.exit(1)
+
+## =========================================================
+## Command: compile
+## ---------------------------------------------------------
+
+@cli.command(name="compile")
+@click.argument('template_dir', type=click.Path(exists=True, file_okay=False))
+@click.option('-o', '--output', 'pack_file', type=click.Path(dir_okay=False),
+              required=True, help='The template pack to write.')
+@click.option('-p', '--delimiter-profile', 'delimiter_profiles', multiple=True,
+              metavar='EXT=PROFILE',
+              help='Use the delimiter PROFILE for files with the extension EXT '
+              '(default: tex=latex).')
+def command_compile(template_dir, pack_file, delimiter_profiles):
+    """Compile the templates in TEMPLATE_DIR ahead of time into a template pack.
+    The pack can be used as 'template-dir' of a project type.
+    """
+    from jinja2 import TemplateError
+    from newskylabs.temple.templates.packs import compile_pack
+
+    # Parse the delimiter profiles
+    extension_profiles = {}
+    for delimiter_profile in delimiter_profiles:
+        extension, sep, profile = delimiter_profile.partition('=')
+        if not sep:
+            print('ERROR Ill-formed delimiter profile: {}'.format(delimiter_profile))
+            sys.exit(1)
+        extension_profiles[extension] = profile
+
+    try:
+        compile_pack(template_dir, pack_file, extension_profiles=extension_profiles)
+
+    except (ValueError, TemplateError) as e:
+
+        # Print error message
+        # Undefined delimiter profile or template syntax error
+        print('ERROR', e)
+        sys.exit(1)
+
     # Done
     print('')
     print('done.')
     print('')
 
+## =========================================================
+## Group: cache
+## ---------------------------------------------------------
+
+@cli.group(name="cache")
+def command_cache():
+    """Manage the caches: the bytecode cache of the compiled templates,
+    the cache of the filter results and the index of the template trees.
+    """
+
+def _get_bytecode_cache():
+    """Get the bytecode cache as configured in the settings.
+    """
+    from newskylabs.temple.templates.cache import get_bytecode_cache
+
+    settings = load_settings()
+    return get_bytecode_cache(settings.get_settings().get('bytecode-cache'))
+
+def _get_filter_cache():
+    """Get the filter cache as configured in the settings.
+    """
+    from newskylabs.temple.templates.cache import get_filter_cache
+
+    settings = load_settings()
+    return get_filter_cache(settings.get_settings().get('filter-cache'))
+
+def _get_tree_index_dir():
+    """Get the directory of the tree indices as configured in the settings.
+    """
+    from newskylabs.temple.templates.tree import TREE_INDEX_DIR
+
+    settings = load_settings()
+    index_settings = settings.get_settings().get('tree-index')
+    if isinstance(index_settings, dict):
+        return index_settings.get('directory', TREE_INDEX_DIR)
+    else:
+        return TREE_INDEX_DIR
+
+@command_cache.command(name="stats")
+def command_cache_stats():
+    """Print statistics about the caches.
+    """
+    from newskylabs.temple.templates.tree import tree_index_stats
+    from newskylabs.temple.utils.file_utilities import format_size
+    from newskylabs.temple.utils.settings_loader import settings_snapshot_stats
+
+    stats = _get_bytecode_cache().stats()
+
+    print('bytecode cache:')
+    print('  directory: {}'.format(stats['directory']))
+    print('  entries:   {}'.format(stats['entries']))
+    print('  size:      {}'.format(format_size(stats['size'])))
+    print('  max size:  {}'.format(format_size(stats['max_size'])))
+
+    stats = _get_filter_cache().stats()
+
+    print('filter cache:')
+    print('  directory: {}'.format(stats['directory']))
+    print('  entries:   {}'.format(stats['entries']))
+    print('  size:      {}'.format(format_size(stats['size'])))
+    print('  max size:  {}'.format(format_size(stats['max_size'])))
+    print('  hits:      {}'.format(stats['hits']))
+    print('  misses:    {}'.format(stats['misses']))
+
+    stats = tree_index_stats(_get_tree_index_dir())
+
+    print('tree index:')
+    print('  directory: {}'.format(stats['directory']))
+    print('  entries:   {}'.format(stats['entries']))
+    print('  size:      {}'.format(format_size(stats['size'])))
+
+    stats = settings_snapshot_stats()
+
+    print('settings snapshots:')
+    print('  directory: {}'.format(stats['directory']))
+    print('  entries:   {}'.format(stats['entries']))
+    print('  size:      {}'.format(format_size(stats['size'])))
+
+@command_cache.command(name="clear")
+def command_cache_clear():
+    """Remove all entries from the caches.
+    """
+    from newskylabs.temple.templates.tree import tree_index_stats, clear_tree_indices
+    from newskylabs.temple.utils.settings_loader import settings_snapshot_stats, \
+        clear_settings_snapshots
+
+    cache = _get_bytecode_cache()
+    entries = cache.stats()['entries']
+    cache.clear()
+
+    print('Removed {} entries from {}'.format(entries, cache.get_directory()))
+
+    cache = _get_filter_cache()
+    entries = cache.stats()['entries']
+    cache.clear()
+
+    print('Removed {} entries from {}'.format(entries, cache.get_directory()))
+
+    index_dir = _get_tree_index_dir()
+    entries = tree_index_stats(index_dir)['entries']
+    clear_tree_indices(index_dir)
+
+    print('Removed {} entries from {}'.format(entries, Path(index_dir).expanduser()))
+
+    stats = settings_snapshot_stats()
+    clear_settings_snapshots()
+
+    print('Removed {} entries from {}'.format(stats['entries'], stats['directory']))
+
 ## =========================================================
 ## =========================================================
 
@@ -0,0 +1,247 @@
+## =========================================================
+## Copyright 2019 Dietrich Bollmann
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##      http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+## ---------------------------------------------------------
+
+"""newskylabs/temple/templates/batch.py:
+
+Generating many projects from a single manifest file.
+
+Example manifest:
+
+  projects:
+
+    # A project of the type 'python-project'
+    # defined in the temple settings
+    - type: python-project
+      name: my-project
+
+    # Settings can be overwritten for single projects
+    - type: python-project
+      name: my-other-project
+      settings:
+        author:
+          first-name: Other
+
+    # A project data file
+    # (interpreted like 'temple generate project-data.yaml')
+    - data: project-data.yaml
+      name: my-data-project
+
+Relative paths of data files are interpreted relative to the
+directory of the manifest.
+
+"""
+
+import os
+import io
+import copy
+import yaml
+
+from contextlib import redirect_stdout
+from concurrent.futures import ProcessPoolExecutor
+
+from newskylabs.temple.templates.engine import TemplateEngine, TempleException
+from newskylabs.temple.utils.generic import merge_dicts
+
+## =========================================================
+## Exceptions
+## ---------------------------------------------------------
+
+class ManifestError(TempleException):
+    """Exception raised when a batch manifest is ill-formed.
+
+    Attributes:
+        manifest_file -- the manifest file
+        message -- explanation of the error
+    """
+
+    def __init__(self, manifest_file, message):
+        super().__init__(manifest_file, message)
+        self.manifest_file = manifest_file
+        self.message       = message
+
+## =========================================================
+## Manifest
+## ---------------------------------------------------------
+
+def read_manifest(manifest_file):
+    """Read a batch manifest and return the list of its project entries.
+    """
+
+    try:
+        with open(manifest_file) as fh:
+            manifest = yaml.safe_load(fh)
+
+    except (OSError, yaml.YAMLError) as e:
+        msg = "Unable to read the manifest '{}': {}".format(manifest_file, e)
+        raise ManifestError(manifest_file, msg)
+
+    # The projects can be given as list
+    # or as list in the 'projects' entry
+    if isinstance(manifest, dict):
+        projects = manifest.get('projects')
+    else:
+        projects = manifest
+
+    if not isinstance(projects, list):
+        msg = "The manifest '{}' does not define a list of projects!".format(manifest_file)
+        raise ManifestError(manifest_file, msg)
+
+    # Check the entries
+    for i, entry in enumerate(projects):
+        if not isinstance(entry, dict) \
+           or not ('type' in entry or 'data' in entry) \
+           or not isinstance(entry.get('settings', {}), dict):
+            msg = ("Ill-formed project entry {} in the manifest '{}': ".format(i + 1, manifest_file) +
+                   "an entry has to define a 'type' or 'data' file "
+                   "and optionally 'name' and 'settings'.")
+            raise ManifestError(manifest_file, msg)
+
+    return projects
+
+def _entry_label(entry):
+    """Return a label identifying the project of a manifest entry.
+    """
+    project_type = entry.get('type', entry.get('data'))
+    project_name = entry.get('name')
+    if project_name:
+        return '{} {}'.format(project_type, project_name)
+    else:
+        return project_type
+
+## =========================================================
+## class BatchResult
+## ---------------------------------------------------------
+
+class BatchResult():
+    """The result of generating a single project of a batch.
+    """
+
+    def __init__(self, label, success, message=None, output=None):
+        self.label   = label
+        self.success = success
+        self.message = message
+        self.output  = output
+
+## =========================================================
+## Generation
+## ---------------------------------------------------------
+
+def generate_project(settings, entry, manifest_dir='.', registries=None, **kwargs):
+    """Generate the project described by a manifest entry.
+
+    The given settings are not modified: the entry's data file and
+    settings are merged into a copy of them.  'registries' is used to
+    share the compiled templates between the projects; any other
+    keyword arguments are passed to TemplateEngine.generate().
+    """
+    label = _entry_label(entry)
+
+    try:
+        project_settings = copy.deepcopy(settings)
+
+        project_type = entry.get('type')
+
+        # Merge in the project data file
+        data_file = entry.get('data')
+        if data_file:
+            data_file = os.path.join(manifest_dir, os.path.expanduser(data_file))
+            if not os.path.isfile(data_file):
+                raise TempleException('Project settings file not found: {}'.format(data_file))
+            project_settings.merge_settings_file(data_file)
+
+        # Merge in the settings given in the entry
+        merge_dicts(project_settings.get_settings(), entry.get('settings') or {})
+
+        # A project data file defines the 'project' entry
+        if data_file and not project_type:
+            if 'project' not in project_settings.get_settings():
+                raise TempleException("A 'project' entry has to be defined in the settings!")
+            project_type = 'project'
+
+        engine = TemplateEngine(project_type, entry.get('name'), project_settings)
+        engine.generate(registries=registries, **kwargs)
+
+    except Exception as e:
+        message = getattr(e, 'message', None) or str(e) or e.__class__.__name__
+        return BatchResult(label, False, message)
+
+    return BatchResult(label, True)
+
+def generate_batch(manifest_file, settings, jobs=1, **kwargs):
+    """Generate all projects of a manifest file
+    and return the list of their BatchResult objects.
+
+    The settings are loaded only once and the templates of each
+    template tree are compiled only once.  With jobs > 1, the projects
+    are generated by a pool of worker processes; their output is
+    printed in the order of the manifest.
+    """
+    projects = read_manifest(manifest_file)
+    manifest_dir = os.path.dirname(os.path.abspath(manifest_file))
+
+    results = []
+
+    if jobs > 1:
+        with ProcessPoolExecutor(max_workers=jobs,
+                                 initializer=_init_worker,
+                                 initargs=(settings, manifest_dir, kwargs)) as executor:
+            for result in executor.map(_generate_project_in_worker, projects):
+                print(result.output, end='')
+                results.append(result)
+
+    else:
+        registries = {}
+        for entry in projects:
+            results.append(generate_project(settings, entry, manifest_dir,
+                                            registries=registries, **kwargs))
+
+    return results
+
+## =========================================================
+## Worker processes
+## ---------------------------------------------------------
+
+# The state of a worker process:
+# the settings, the manifest directory, the keyword arguments
+# passed to TemplateEngine.generate()
+# and the environment registries shared by its projects
+_worker_state = {}
+
+def _init_worker(settings, manifest_dir, kwargs):
+    """Initialize a worker process.
+    """
+    _worker_state['settings']     = settings
+    _worker_state['manifest_dir'] = manifest_dir
+    _worker_state['kwargs']       = kwargs
+    _worker_state['registries']   = {}
+
+def _generate_project_in_worker(entry):
+    """Generate the project of a manifest entry in a worker process.
+    The output is captured and returned with the result.
+    """
+    output = io.StringIO()
+    with redirect_stdout(output):
+        result = generate_project(_worker_state['settings'], entry,
+                                  _worker_state['manifest_dir'],
+                                  registries=_worker_state['registries'],
+                                  **_worker_state['kwargs'])
+    result.output = output.getvalue()
+    return result
+
+## =========================================================
+## =========================================================
+
+## fin.
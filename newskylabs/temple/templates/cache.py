@@ -0,0 +1,689 @@
+## =========================================================
+## Copyright 2019 Dietrich Bollmann
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##      http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+## ---------------------------------------------------------
+
+"""newskylabs/temple/templates/cache.py:
+
+Persistent on-disk caches:
+
+  - TempleBytecodeCache: the bytecode of compiled templates
+    and the analyses of their sources - see state.py,
+
+  - FilterCache: the results of the html, latex and markdown filters.
+
+"""
+
+import os
+import json
+import time
+import sqlite3
+import tempfile
+
+from collections import OrderedDict
+from collections.abc import Mapping
+
+from hashlib import sha1
+from pathlib import Path
+
+from jinja2.bccache import BytecodeCache, Bucket
+
+from newskylabs.temple.templates.filters.nested_paths import get_path_value, PathError
+from newskylabs.temple.utils.views import json_default
+
+## =========================================================
+## Cache settings
+## ---------------------------------------------------------
+
+# The base directory of all temple caches
+CACHE_BASE_DIR = Path.home() / '.newskylabs/temple/cache'
+
+# The directory of the bytecode cache
+BYTECODE_CACHE_DIR = CACHE_BASE_DIR / 'bytecode'
+
+# Default maximal size of the bytecode cache in bytes
+BYTECODE_CACHE_MAX_SIZE = 256 * 1024 * 1024
+
+# Extension of the cache files
+_CACHE_FILE_EXTENSION = '.cache'
+
+# Extension of the files caching the analyses of the templates
+_ANALYSIS_FILE_EXTENSION = '.analysis'
+
+# The directory of the filter cache
+FILTER_CACHE_DIR = CACHE_BASE_DIR / 'filters'
+
+# Default maximal size of the filter results stored on disk in bytes
+FILTER_CACHE_MAX_SIZE = 64 * 1024 * 1024
+
+# Default number of filter results kept in memory
+FILTER_CACHE_MEMORY_ENTRIES = 4096
+
+# Name of the database of the filter cache
+_FILTER_CACHE_DATABASE = 'filters.sqlite'
+
+# Seconds to wait for a database locked by another process
+_FILTER_CACHE_TIMEOUT = 10.0
+
+## =========================================================
+## class TempleBytecodeCache
+## ---------------------------------------------------------
+
+class TempleBytecodeCache(BytecodeCache):
+    """A size bounded bytecode cache storing compiled templates on disk.
+
+    The cache entries are keyed by the template path, the hash of the
+    template source and the delimiter profile of the environment.
+    When the cache grows beyond its maximal size, the least recently
+    used entries are evicted.
+
+    Besides the bytecode, the analysis of a template source used to
+    record the generation state of a project is cached with the same
+    key - see load_analysis() and state.py.
+    """
+
+    def __init__(self, directory=BYTECODE_CACHE_DIR, max_size=BYTECODE_CACHE_MAX_SIZE):
+        """
+        """
+        self._directory = Path(directory).expanduser()
+        self._max_size  = max_size
+
+    def get_directory(self):
+        return self._directory
+
+    def get_max_size(self):
+        return self._max_size
+
+    def _get_key(self, environment, name, filename, checksum):
+        """Return the cache key of the given template.
+        """
+
+        # The delimiter profile of the environment
+        profile = environment.temple.get('profile', '')
+
+        # The cache key:
+        # template path, source checksum and delimiter profile
+        return sha1('{}\0{}\0{}'.format(profile, filename or name, checksum) \
+                    .encode('utf-8')).hexdigest()
+
+    def get_bucket(self, environment, name, filename, source):
+        """Return a cache bucket for the given template.
+        """
+        checksum = self.get_source_checksum(source)
+        key = self._get_key(environment, name, filename, checksum)
+
+        bucket = Bucket(environment, key, checksum)
+        self.load_bytecode(bucket)
+
+        return bucket
+
+    def _get_cache_file(self, bucket):
+        return self._directory / '{}{}'.format(bucket.key, _CACHE_FILE_EXTENSION)
+
+    def _get_analysis_file(self, environment, name, filename, source):
+        key = self._get_key(environment, name, filename, self.get_source_checksum(source))
+        return self._directory / '{}{}'.format(key, _ANALYSIS_FILE_EXTENSION)
+
+    def load_analysis(self, environment, name, filename, source):
+        """Return the cached analysis of the given template source
+        - or None when it has not been cached.
+        """
+        analysis_file = self._get_analysis_file(environment, name, filename, source)
+        try:
+            with open(analysis_file) as fh:
+                analysis = json.load(fh)
+
+        except (OSError, ValueError):
+            # Not cached yet
+            return None
+
+        # Mark the entry as recently used
+        try:
+            os.utime(analysis_file)
+        except OSError:
+            pass
+
+        return analysis
+
+    def dump_analysis(self, environment, name, filename, source, analysis):
+        """Cache the analysis of the given template source.
+        """
+        analysis_file = self._get_analysis_file(environment, name, filename, source)
+        try:
+            self._directory.mkdir(parents=True, exist_ok=True)
+        except OSError:
+            return
+
+        # Write to a temporary file first
+        # and rename it afterwards
+        fd, tmp_path = tempfile.mkstemp(dir=str(self._directory), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as fh:
+                json.dump(analysis, fh)
+            os.replace(tmp_path, str(analysis_file))
+
+        except OSError:
+            # The cache is an optimization only
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    def load_bytecode(self, bucket):
+        """
+        """
+        cache_file = self._get_cache_file(bucket)
+        try:
+            with open(cache_file, 'rb') as fh:
+                bucket.load_bytecode(fh)
+
+        except OSError:
+            # Not cached yet
+            return
+
+        # Mark the entry as recently used
+        try:
+            os.utime(cache_file)
+        except OSError:
+            pass
+
+    def dump_bytecode(self, bucket):
+        """
+        """
+        self._directory.mkdir(parents=True, exist_ok=True)
+
+        # Write to a temporary file first
+        # and rename it afterwards
+        # to never leave partially written cache files behind
+        fd, tmp_path = tempfile.mkstemp(dir=str(self._directory), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as fh:
+                bucket.write_bytecode(fh)
+            os.replace(tmp_path, str(self._get_cache_file(bucket)))
+
+        except OSError:
+            # The cache is an optimization only
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    def _entries(self):
+        """Return a list of (path, size, mtime) tuples - one per cache entry.
+        """
+        entries = []
+        try:
+            with os.scandir(str(self._directory)) as it:
+                for entry in it:
+                    if entry.name.endswith((_CACHE_FILE_EXTENSION, _ANALYSIS_FILE_EXTENSION)):
+                        try:
+                            stat = entry.stat()
+                        except OSError:
+                            continue
+                        entries.append((entry.path, stat.st_size, stat.st_mtime))
+
+        except FileNotFoundError:
+            pass
+
+        return entries
+
+    def stats(self):
+        """Return a dictionary with statistics about the cache.
+        """
+        entries = self._entries()
+        return {
+            'directory': str(self._directory),
+            'entries':   len(entries),
+            'size':      sum(size for path, size, mtime in entries),
+            'max_size':  self._max_size,
+        }
+
+    def prune(self):
+        """Evict the least recently used entries
+        until the size of the cache is within its bounds.
+        Return the number of evicted entries.
+        """
+        entries = self._entries()
+        size = sum(size for path, size, mtime in entries)
+
+        evicted = 0
+        for path, entry_size, mtime in sorted(entries, key=lambda entry: entry[2]):
+            if size <= self._max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            size -= entry_size
+            evicted += 1
+
+        return evicted
+
+    def clear(self):
+        """Remove all entries from the cache.
+        """
+        for path, size, mtime in self._entries():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+## =========================================================
+## get_bytecode_cache()
+## ---------------------------------------------------------
+
+def get_bytecode_cache(cache_settings=None):
+    """Return a bytecode cache configured by the given 'bytecode-cache'
+    settings.  Hyphens in the keys of the settings can be given as
+    hyphens or underscores.
+    """
+
+    # 'bytecode-cache: true' is a valid setting as well
+    if not isinstance(cache_settings, Mapping):
+        cache_settings = {}
+
+    def get(key, default):
+        return cache_settings.get(key, cache_settings.get(key.replace('-', '_'), default))
+
+    directory = get('directory', BYTECODE_CACHE_DIR)
+    max_size  = get('max-size',  BYTECODE_CACHE_MAX_SIZE)
+
+    return TempleBytecodeCache(directory=directory, max_size=int(max_size))
+
+def bytecode_cache_enabled(cache_settings=None):
+    """Is the bytecode cache enabled by the given 'bytecode-cache' settings?
+    """
+    if isinstance(cache_settings, Mapping):
+        return bool(cache_settings.get('enabled', False))
+    else:
+        return bool(cache_settings)
+
+## =========================================================
+## class FilterCache
+## ---------------------------------------------------------
+
+# The tables of the filter cache:
+# 
+#   - paths:    the variable paths dereferenced when filtering a text
+#               - by the hash of the filter name and the text,
+#   - results:  the filter results - by the hash of the filter name,
+#               the text and the values of the dereferenced paths,
+#   - counters: the hits and misses of all runs.
+_FILTER_CACHE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS paths (
+    key   TEXT PRIMARY KEY,
+    paths TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS results (
+    key      TEXT PRIMARY KEY,
+    text_key TEXT NOT NULL,
+    value    TEXT NOT NULL,
+    size     INTEGER NOT NULL,
+    atime    REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_atime ON results (atime);
+CREATE TABLE IF NOT EXISTS counters (
+    name  TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO counters VALUES ('hits', 0), ('misses', 0);
+"""
+
+# Marker of the values of undefined paths
+_UNDEFINED = '<undefined>'
+
+def _hash(*parts):
+    return sha1('\0'.join(parts).encode('utf-8')).hexdigest()
+
+def _fingerprint(variables, paths):
+    """Return a hash of the values of the given paths.
+    """
+    values = []
+    for path in paths:
+        try:
+            value = get_path_value(variables, path)
+        except PathError:
+            value = _UNDEFINED
+        values.append(json.dumps(value, sort_keys=True, default=json_default))
+
+    return _hash(*values)
+
+class FilterCache():
+    """A size bounded cache of the results of the html, latex and
+    markdown filters.
+
+    The results are keyed by the filter name, the filtered text and
+    the values of the variables the filter dereferenced - for example
+    via <temple var="..."/> elements.  The paths of these variables
+    are recorded together with the result; a lookup resolves them
+    against the current variables and only returns a result computed
+    with the same values.
+
+    The most recently used results are kept in memory; all results are
+    stored in a sqlite database.  When the database grows beyond its
+    maximal size, prune() evicts the least recently used results.
+    A corrupted database is replaced by an empty one.
+
+    The cache can be pickled - e.g. to be used in worker processes -
+    and opens its own database connection in each process.
+    """
+
+    def __init__(self, directory=FILTER_CACHE_DIR, max_size=FILTER_CACHE_MAX_SIZE,
+                 memory_entries=FILTER_CACHE_MEMORY_ENTRIES):
+        """
+        """
+        self._directory      = Path(directory).expanduser()
+        self._max_size       = max_size
+        self._memory_entries = memory_entries
+        self._reset()
+
+    def _reset(self):
+        self._connection = None
+        self._paths      = OrderedDict()
+        self._results    = OrderedDict()
+        self._touched    = set()
+
+        # The hits and misses of this process
+        # and those not yet added to the counters in the database
+        self._hits           = 0
+        self._misses         = 0
+        self._pending_hits   = 0
+        self._pending_misses = 0
+
+    def __getstate__(self):
+        """Neither the database connection
+        nor the entries in memory are pickled.
+        """
+        return {
+            '_directory':      self._directory,
+            '_max_size':       self._max_size,
+            '_memory_entries': self._memory_entries,
+        }
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._reset()
+
+    def get_directory(self):
+        return self._directory
+
+    def get_max_size(self):
+        return self._max_size
+
+    def _get_database(self):
+        return self._directory / _FILTER_CACHE_DATABASE
+
+    def _open_database(self):
+        connection = sqlite3.connect(str(self._get_database()),
+                                     timeout=_FILTER_CACHE_TIMEOUT,
+                                     isolation_level=None,
+                                     check_same_thread=False)
+        try:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.executescript(_FILTER_CACHE_SCHEMA)
+        except sqlite3.Error:
+            connection.close()
+            raise
+
+        return connection
+
+    def _remove_database(self):
+        database = str(self._get_database())
+        for path in [database, database + '-wal', database + '-shm']:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _connect(self):
+        """Return the connection to the database
+        - creating the database when it does not exist yet.
+        """
+        if self._connection is None:
+            self._directory.mkdir(parents=True, exist_ok=True)
+            try:
+                connection = self._open_database()
+
+            except sqlite3.OperationalError:
+                # For example locked by another process
+                raise
+
+            except sqlite3.DatabaseError:
+                # The database is corrupted:
+                # the cache is an optimization only - start with a new one
+                self._remove_database()
+                connection = self._open_database()
+
+            self._connection = connection
+
+        return self._connection
+
+    def _remember(self, entries, key, value):
+        """Keep an entry in memory
+        - forgetting the least recently used ones.
+        """
+        entries[key] = value
+        entries.move_to_end(key)
+        while len(entries) > self._memory_entries:
+            entries.popitem(last=False)
+
+    def _get_paths(self, text_key):
+        paths = self._paths.get(text_key)
+        if paths is None:
+            row = self._connect().execute('SELECT paths FROM paths WHERE key = ?',
+                                          (text_key,)).fetchone()
+            if row is None:
+                return None
+            paths = json.loads(row[0])
+        self._remember(self._paths, text_key, paths)
+        return paths
+
+    def _get_result(self, key):
+        result = self._results.get(key)
+        if result is None:
+            row = self._connect().execute('SELECT value FROM results WHERE key = ?',
+                                          (key,)).fetchone()
+            if row is None:
+                return None
+            result = row[0]
+        self._remember(self._results, key, result)
+
+        # The access times are updated by flush()
+        self._touched.add(key)
+        return result
+
+    def get(self, filter_name, text, variables):
+        """Return the cached result of filtering the given text
+        with the given variables - or None when there is none.
+        """
+        text_key = _hash(filter_name, str(text))
+        try:
+            paths = self._get_paths(text_key)
+            if paths is not None:
+                result = self._get_result(_hash(text_key, _fingerprint(variables, paths)))
+                if result is not None:
+                    self._hits         += 1
+                    self._pending_hits += 1
+                    return result
+
+        except sqlite3.Error:
+            # The cache is an optimization only
+            pass
+
+        self._misses         += 1
+        self._pending_misses += 1
+        return None
+
+    def put(self, filter_name, text, variables, paths, result):
+        """Store the result of filtering the given text.
+
+        'paths' are the paths of the variables dereferenced by the
+        filter.
+        """
+        text_key = _hash(filter_name, str(text))
+        paths    = sorted(set(paths))
+        key      = _hash(text_key, _fingerprint(variables, paths))
+
+        self._remember(self._paths,   text_key, paths)
+        self._remember(self._results, key,      result)
+
+        try:
+            connection = self._connect()
+            with connection:
+                connection.execute('INSERT OR REPLACE INTO paths VALUES (?, ?)',
+                                   (text_key, json.dumps(paths)))
+                connection.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)',
+                                   (key, text_key, result, len(result.encode('utf-8')),
+                                    time.time()))
+        except sqlite3.Error:
+            pass
+
+    def flush(self):
+        """Write the access times of the used results
+        and the hits and misses to the database.
+        """
+        if not (self._touched or self._pending_hits or self._pending_misses):
+            return
+
+        try:
+            connection = self._connect()
+            with connection:
+                now = time.time()
+                connection.executemany('UPDATE results SET atime = ? WHERE key = ?',
+                                       [(now, key) for key in self._touched])
+                connection.executemany('UPDATE counters SET value = value + ? WHERE name = ?',
+                                       [(self._pending_hits,   'hits'),
+                                        (self._pending_misses, 'misses')])
+        except sqlite3.Error:
+            return
+
+        self._touched        = set()
+        self._pending_hits   = 0
+        self._pending_misses = 0
+
+    def counters(self):
+        """Return the hits and misses of all runs.
+        """
+        self.flush()
+        if not self._get_database().exists():
+            return {'hits': 0, 'misses': 0}
+
+        rows = self._connect().execute('SELECT name, value FROM counters').fetchall()
+        return dict(rows)
+
+    def stats(self):
+        """Return a dictionary with statistics about the cache.
+        """
+        stats = {
+            'directory': str(self._directory),
+            'entries':   0,
+            'size':      0,
+            'max_size':  self._max_size,
+        }
+        stats.update(self.counters())
+
+        if self._get_database().exists():
+            entries, size = self._connect().execute(
+                'SELECT COUNT(*), TOTAL(size) FROM results').fetchone()
+            stats['entries'] = entries
+            stats['size']    = int(size)
+
+        return stats
+
+    def prune(self):
+        """Evict the least recently used results
+        until the size of the cache is within its bounds.
+        Return the number of evicted results.
+        """
+        self.flush()
+        if not self._get_database().exists():
+            return 0
+
+        connection = self._connect()
+        size = connection.execute('SELECT TOTAL(size) FROM results').fetchone()[0]
+        if size <= self._max_size:
+            return 0
+
+        evicted = []
+        for key, entry_size in connection.execute(
+                'SELECT key, size FROM results ORDER BY atime'):
+            if size <= self._max_size:
+                break
+            evicted.append((key,))
+            size -= entry_size
+
+        with connection:
+            connection.executemany('DELETE FROM results WHERE key = ?', evicted)
+
+            # Forget the paths of texts without results
+            connection.execute('DELETE FROM paths WHERE key NOT IN '
+                               '(SELECT text_key FROM results)')
+
+        for (key,) in evicted:
+            self._results.pop(key, None)
+
+        return len(evicted)
+
+    def clear(self):
+        """Remove all entries from the cache and reset its counters.
+        """
+        self._paths.clear()
+        self._results.clear()
+        self._touched = set()
+        if not self._get_database().exists():
+            return
+
+        connection = self._connect()
+        with connection:
+            connection.execute('DELETE FROM results')
+            connection.execute('DELETE FROM paths')
+            connection.execute('UPDATE counters SET value = 0')
+
+## =========================================================
+## get_filter_cache()
+## ---------------------------------------------------------
+
+def get_filter_cache(cache_settings=None):
+    """Return a filter cache configured by the given 'filter-cache'
+    settings.  Hyphens in the keys of the settings can be given as
+    hyphens or underscores.
+    """
+
+    # 'filter-cache: true' is a valid setting as well
+    if not isinstance(cache_settings, Mapping):
+        cache_settings = {}
+
+    def get(key, default):
+        return cache_settings.get(key, cache_settings.get(key.replace('-', '_'), default))
+
+    directory      = get('directory',      FILTER_CACHE_DIR)
+    max_size       = get('max-size',       FILTER_CACHE_MAX_SIZE)
+    memory_entries = get('memory-entries', FILTER_CACHE_MEMORY_ENTRIES)
+
+    return FilterCache(directory=directory, max_size=int(max_size),
+                       memory_entries=int(memory_entries))
+
+def filter_cache_enabled(cache_settings=None):
+    """Is the filter cache enabled by the given 'filter-cache' settings?
+    """
+    if isinstance(cache_settings, Mapping):
+        return bool(cache_settings.get('enabled', False))
+    else:
+        return bool(cache_settings)
+
+## =========================================================
+## =========================================================
+
+## fin.
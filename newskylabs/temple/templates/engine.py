@@ -21,16 +21,34 @@ Definition of class TemplateEngine.
 """
 
 import os
-import sys
-from shutil import copyfile
+import time
 
 from pathlib import Path
 from datetime import datetime
+from functools import lru_cache
+from collections.abc import Mapping
 
-from newskylabs.temple.templates.jinja import generate_file_from_template, jinja_str
-from newskylabs.utils.generic import get_recursively
-from newskylabs.temple.utils.string_utilities import hyphen_to_underscore_in_keys, \
-    hyphen_to_underscore_string
+from jinja2 import TemplateError
+from newskylabs.temple.templates.jinja import jinja_str, render_file, \
+    STREAM_THRESHOLD, STREAM_BUFFER_SIZE
+from newskylabs.temple.templates.state import ProjectState, VariablesFingerprint, \
+    analyse_template, get_analysis, dependencies_changed, hash_file, stamp_file
+from newskylabs.temple.templates.tree import TemplateDirectory, TREE_INDEX_DIR, \
+    ACTION_COPY, ACTION_RENDER, ACTION_SKIP
+from newskylabs.temple.templates.packs import TemplatePack, is_template_pack
+from newskylabs.temple.templates.cache import get_bytecode_cache, bytecode_cache_enabled, \
+    get_filter_cache, filter_cache_enabled
+from newskylabs.temple.templates.sinks import FileSystemSink
+from newskylabs.temple.templates.events import ConsoleObserver, GenerationStarted, \
+    TasksPlanned, DirectoryCreated, FileRendered, FileCopied, FileConflict, FileObsolete, \
+    FileRemoved, GenerationFinished, DebugMessage, flush_observer
+from newskylabs.temple.utils.file_utilities import COPY_MODES, DEFAULT_COPY_MODE
+from newskylabs.temple.utils.flat_index import FlatIndex
+from newskylabs.temple.utils.views import read_only, hyphen_to_underscore_view
+from newskylabs.temple.utils import profiling
+from newskylabs.temple.utils.settings_loader import load_data_file
+from newskylabs.temple.defaults import DEFAULT_SETTINGS_FILE
+from newskylabs.temple.utils.string_utilities import hyphen_to_underscore_string
 
 ## =========================================================
 ## Exceptions
@@ -52,6 +70,95 @@ class UndefinedProjectTypeError(TempleException):
         self.projecttype = projecttype
         self.message     = message
 
+class TemplateDirectoryNotFoundError(TempleException):
+    """Exception raised when the template directory does not exist.
+
+    Attributes:
+        template_dir -- the template directory
+        message -- explanation of the error
+    """
+
+    def __init__(self, template_dir, message):
+        super().__init__(template_dir, message)
+        self.template_dir = template_dir
+        self.message      = message
+
+class ProjectExistsError(TempleException):
+    """Exception raised when the project directory exists already.
+
+    Attributes:
+        project_dir -- the project directory
+        message -- explanation of the error
+    """
+
+    def __init__(self, project_dir, message):
+        super().__init__(project_dir, message)
+        self.project_dir = project_dir
+        self.message     = message
+
+class ProjectNotFoundError(TempleException):
+    """Exception raised when the project to update does not exist.
+
+    Attributes:
+        project_dir -- the project directory
+        message -- explanation of the error
+    """
+
+    def __init__(self, project_dir, message):
+        super().__init__(project_dir, message)
+        self.project_dir = project_dir
+        self.message     = message
+
+class ProjectStateNotFoundError(TempleException):
+    """Exception raised when the project to update has no generation state.
+
+    Attributes:
+        project_dir -- the project directory
+        message -- explanation of the error
+    """
+
+    def __init__(self, project_dir, message):
+        super().__init__(project_dir, message)
+        self.project_dir = project_dir
+        self.message     = message
+
+class GenerationError(TempleException):
+    """Exception raised when a file could not be generated.
+
+    Attributes:
+        template_file -- the template file
+        message -- explanation of the error
+    """
+
+    def __init__(self, template_file, message):
+        super().__init__(template_file, message)
+        self.template_file = template_file
+        self.message       = "Unable to generate '{}': {}".format(template_file, message)
+
+    def __str__(self):
+        return self.message
+
+## =========================================================
+## Settings
+## ---------------------------------------------------------
+
+@lru_cache(maxsize=None)
+def _default_settings_index():
+    """Return the flat index of the default settings.
+    The default settings are only loaded when needed.
+    """
+    default_settings = load_data_file(DEFAULT_SETTINGS_FILE) or {}
+
+    return FlatIndex(default_settings)
+
+def _create_index(variables):
+    """Return the flat index of the given variables.
+
+    The index is shared by all templates - so its values are
+    read-only views of the variables.
+    """
+    return FlatIndex(read_only(variables))
+
 ## =========================================================
 ## Template engine
 ## ---------------------------------------------------------
@@ -78,6 +185,14 @@ class TemplateEngine():
         if not 'project' in variables:
             variables['project'] = {}
 
+        # Check that the project type is valid
+        if not self.templates_defined(project_type):
+
+            # Throw an error
+            # in the case of undefined project types
+            msg = "No templated defined for project type '{}'.".format(project_type)
+            raise UndefinedProjectTypeError(project_type, msg)
+        
         # project_name
         # When no project name has been given ('project_name' is None),
         # use the one given in the project type settings;
@@ -93,14 +208,6 @@ class TemplateEngine():
         # Use the project name
         variables['project']['name'] = project_name
 
-        # Check that the project type is valid
-        if not self.templates_defined(project_type):
-
-            # Throw an error
-            # in the case of undefined project types
-            msg = "No templated defined for project type '{}'.".format(project_type)
-            raise UndefinedProjectTypeError(project_type, msg)
-        
         # Convenience alias defintions
         variables['author']['name'] = \
             '{} {}'.format(variables['author']['first-name'],
@@ -123,10 +230,18 @@ class TemplateEngine():
 
         # Convert hyphens to underscores
         # to faciliate usage of variables in the jinja2 templates
-        variables = hyphen_to_underscore_in_keys(variables)
+        # - with a read-only view translating the keys on access
+        #   instead of copying the settings;
+        #   the templates get copy-on-write views of it
+        #   and can modify them with the 'do' statement
+        variables = hyphen_to_underscore_view(variables)
         self._project_type = hyphen_to_underscore_string(project_type)
         self._variables = variables
 
+        # Index the dotted paths of the variables
+        # - the paths are indexed when first looked up
+        self._index = _create_index(variables)
+
     def templates_defined(self, project_type):
         """
         """
@@ -136,191 +251,870 @@ class TemplateEngine():
                 and 'template-dir' in settings[project_type].keys())
 
     def get_setting(self, variable):
-        """Retrive a variable"""
+        """Retrive the value of a variable given by its dotted path
+        - with hyphens or underscores: 'author.first-name' or
+        'author.first_name'.
+        """
 
         # When defined use the user settings
-        value = get_recursively(_settings, keychain)
-        if value != None:
+        value = self._index.get(variable)
+        if value is not None:
             return value
 
         # When the user has not overwritten a setting use the default
         # settings
-        value = get_recursively(_default_settings, keychain)
-        if value != None:
-            return value
-
-            # When a setting has neither been defined in the user settings nor
-            # in the default settings return None
-        else:
-            return None
+        #
+        # When a setting has neither been defined in the user settings nor
+        # in the default settings return None
+        return _default_settings_index().get(variable)
 
-    def generate(self, verbose=True, debug=False):
+    def generate(self, verbose=True, debug=False, bytecode_cache=None, jobs=1,
+                 registries=None, tree_index=None, copy_mode=None, sink=None,
+                 auto_reload=False, filter_cache=None, profiler=None, observer=None,
+                 state=False):
         """Generate a project of the given project type...
+
+        The template directory can be a directory of templates or a
+        template pack compiled with 'temple compile'.
+
+        When 'bytecode_cache' is True, the compiled templates are
+        cached on disk and reused by later runs; when it is None, the
+        'bytecode-cache' settings decide.
+
+        When 'filter_cache' is True, the results of the html, latex
+        and markdown filters are cached on disk and reused by later
+        runs; when it is None, the 'filter-cache' settings decide.
+
+        When 'jobs' is greater than one, the files are rendered and
+        copied by a pool of 'jobs' worker processes.
+
+        'registries' is an optional dictionary used to share the jinja2
+        environments and their compiled templates between the
+        generation of several projects from the same template tree.
+        When 'auto_reload' is True, the shared templates are compiled
+        again when they have been modified - as needed by long-running
+        processes.
+
+        When 'tree_index' is True, the index of the template tree is
+        persisted and reused by later runs to avoid walking the whole
+        tree again; when it is None, the 'tree-index' settings decide.
+
+        'copy_mode' is the strategy used to copy the files which are
+        not rendered - one of COPY_MODES; when it is None, the
+        'copy-mode' setting of the project type decides.
+
+        'sink' is the output sink the project is written to - by
+        default a FileSystemSink writing to the project directory.
+        Other sinks are always written sequentially.
+
+        When 'state' is True and the project is written to the
+        filesystem, the generation state of the project is recorded in
+        the file '.temple-state.json' of the project base directory
+        for later updates with update().
+
+        'profiler' is an optional Profiler recording the time spent in
+        the phases of the generation - see utils/profiling.py.
+
+        'observer' is an optional callable receiving the events of the
+        generation - see events.py.  By default the events are printed
+        by a ConsoleObserver: the generated directories and files only
+        when 'verbose' is True.
         """
+
+        if observer is None:
+            observer = ConsoleObserver(verbose=verbose)
+
+        if profiler is not None:
+            profiling.activate(profiler)
+        try:
+            self._generate(observer, debug, bytecode_cache, jobs, registries, tree_index,
+                           copy_mode, sink, auto_reload, filter_cache, state)
+        finally:
+            if profiler is not None:
+                profiling.deactivate()
+            flush_observer(observer)
+
+    def _generate(self, observer, debug, bytecode_cache, jobs, registries, tree_index,
+                  copy_mode, sink, auto_reload, filter_cache, state):
+        """Generate the project - see generate().
+        """
+
+        if sink is None:
+            sink = FileSystemSink()
+
+        # The generation state can only be recorded in the filesystem
+        record_state = state and sink.writes_to_filesystem
+
+        project_base_path = self._get_project_base_path()
+
+        # Check if the project directory exists already 
+        # (either in form of a file or as a directory)
+        # If raise an error
+        # to avoid overwriting of existing files
+        if sink.exists(project_base_path):
+            msg = ('The path {} exists already!\n'.format(project_base_path) +
+                   'Exiting to avoid overwriting of existing files.')
+            raise ProjectExistsError(str(project_base_path), msg)
+
+        template_base_path, tree, registry = \
+            self._prepare(bytecode_cache, tree_index, registries, auto_reload, filter_cache)
+
+        observer(GenerationStarted('generate', self._project_name,
+                                   str(template_base_path), str(project_base_path)))
         
+        # Plan the generation:
+        # the directories to create 
+        # and the files to render or copy
+        directories, tasks, skipped = self._plan(tree, project_base_path, registry,
+                                                 observer=observer, debug=debug)
+        observer(TasksPlanned(len(directories) + 1, len(tasks), skipped))
+
+        # The paths written to the sink
+        # are relative to the project root
+        sink.open(self._get_project_root())
+        try:
+
+            # Create project base dir
+            sink.mkdir(project_base_path, parents=True)
+            observer(DirectoryCreated(str(project_base_path)))
+
+            # Create the directories first
+            # so that the files can be generated in any order
+            for project_dir in directories:
+
+                # Create the corresponding project directory
+                sink.mkdir(project_dir)
+                observer(DirectoryCreated(project_dir))
+
+            # Render and copy the files
+            records = self._execute(tasks, tree, registry, project_base_path, sink, observer,
+                                    jobs=jobs, copy_mode=copy_mode, analyse=record_state,
+                                    debug=debug)
+
+        finally:
+            sink.close()
+
+        # Record the generation state
+        if record_state:
+            with profiling.phase('state'):
+                state = ProjectState(project_base_path)
+                for (action, path, project_file), record in zip(tasks, records):
+                    state.set_record(path, record)
+                state.save()
+
+        self._finish(registry)
+
+    def update(self, verbose=True, debug=False, force=False, bytecode_cache=None, jobs=1,
+               registries=None, tree_index=None, copy_mode=None, auto_reload=False,
+               filter_cache=None, observer=None, remove_obsolete=False):
+        """Update a project generated earlier with generate().
+
+        Only the files whose inputs have changed since the last
+        generation are re-rendered or copied again: files whose
+        template, included templates, or variables have changed, and
+        files which are new or have been deleted.
+
+        Files which have been modified since their generation are not
+        overwritten - unless 'force' is True.
+
+        The project has to be generated with 'state' - see generate().
+
+        Files which are not generated any more - as their templates
+        have been removed or their paths have changed - are obsolete.
+        They are kept and reported by every update until they are
+        removed; when 'remove_obsolete' is True, the obsolete files
+        which have not been modified since their generation are
+        removed.
+
+        Return a dictionary mapping the outcomes 'updated', 'unchanged',
+        'conflict', 'obsolete' and 'removed' to the lists of the
+        concerned project files.
+
+        The other arguments are the same as for generate().
+        """
+        if observer is None:
+            observer = ConsoleObserver(verbose=verbose)
+
+        try:
+            return self._update(observer, debug, force, bytecode_cache, jobs, registries,
+                                tree_index, copy_mode, auto_reload, filter_cache,
+                                remove_obsolete)
+        finally:
+            flush_observer(observer)
+
+    def _update(self, observer, debug, force, bytecode_cache, jobs, registries,
+                tree_index, copy_mode, auto_reload, filter_cache, remove_obsolete):
+        """Update the project - see update().
+        """
+
+        project_base_path = self._get_project_base_path()
+
+        # Check that the project exists
+        if not project_base_path.is_dir():
+            msg = ("The project {} does not exist!\n".format(project_base_path) +
+                   "Use 'temple generate' to generate it.")
+            raise ProjectNotFoundError(str(project_base_path), msg)
+
+        # Check that the generation state has been recorded
+        if not ProjectState.exists(project_base_path):
+            msg = ("The project {} has no generation state!\n".format(project_base_path) +
+                   "Generate it with 'temple generate --state' to update it later.")
+            raise ProjectStateNotFoundError(str(project_base_path), msg)
+
+        template_base_path, tree, registry = \
+            self._prepare(bytecode_cache, tree_index, registries, auto_reload, filter_cache)
+
+        observer(GenerationStarted('update', self._project_name,
+                                   str(template_base_path), str(project_base_path)))
+
+        # Plan the generation
+        directories, tasks, skipped = self._plan(tree, project_base_path, registry,
+                                                 observer=observer, debug=debug)
+
+        # Create the missing directories
+        for project_dir in directories:
+            if not os.path.isdir(project_dir):
+                os.mkdir(project_dir)
+                observer(DirectoryCreated(project_dir))
+
+        # Compare the tasks with the recorded state
+        state = ProjectState.load(project_base_path)
+        fingerprint = VariablesFingerprint(self._variables)
+
+        outcomes = {
+            'updated':   [],
+            'unchanged': [],
+            'conflict':  [],
+            'obsolete':  [],
+            'removed':   [],
+        }
+        pending = []
+
+        # The recorded analyses of the templates
+        # whose sources have not changed
+        analyses = {}
+
+        for task in tasks:
+            action, path, project_file = task
+            record = state.get_record(path)
+
+            outcome = _task_outcome(task, record, tree, registry, fingerprint,
+                                    project_base_path, force, analyses)
+            if outcome == 'updated':
+                pending.append(task)
+            else:
+                outcomes[outcome].append(project_file)
+                if outcome == 'conflict':
+                    observer(FileConflict(project_file))
+
+        # Render and copy the files whose inputs have changed
+        # The unchanged and conflicting files are skipped as well
+        skipped += len(outcomes['unchanged']) + len(outcomes['conflict'])
+        observer(TasksPlanned(len(directories), len(pending), skipped))
+        records = self._execute(pending, tree, registry, project_base_path, FileSystemSink(),
+                                observer, jobs=jobs, copy_mode=copy_mode, analyses=analyses,
+                                debug=debug)
+
+        for (action, path, project_file), record in zip(pending, records):
+
+            # The file generated before under another path is obsolete
+            previous = state.get_record(path)
+            if previous is not None and previous['project_file'] != record['project_file']:
+                state.add_obsolete(previous)
+
+            state.set_record(path, record)
+            outcomes['updated'].append(project_file)
+
+        # The files whose templates have been removed are obsolete
+        current_paths = set(path for action, path, project_file in tasks)
+        for path in state.get_paths():
+            if path not in current_paths:
+                state.add_obsolete(state.get_record(path))
+                state.remove_record(path)
+
+        # The obsolete files are kept
+        # - unless they should be removed and have not been modified
+        current_files = set(_relative_path(project_file, project_base_path)
+                            for action, path, project_file in tasks)
+        for relative_file, record in sorted(state.get_obsolete().items()):
+            project_file = os.path.join(str(project_base_path), *relative_file.split('/'))
+
+            # Files generated again or deleted are not obsolete any more
+            if relative_file in current_files or not os.path.lexists(project_file):
+                state.remove_obsolete(relative_file)
+
+            elif remove_obsolete and not _modified_since_generation(record, project_file):
+                os.remove(project_file)
+                state.remove_obsolete(relative_file)
+                outcomes['removed'].append(project_file)
+                observer(FileRemoved(project_file))
+
+            else:
+                outcomes['obsolete'].append(project_file)
+                observer(FileObsolete(project_file))
+
+        state.save()
+
+        self._finish(registry)
+
+        return outcomes
+
+    def get_template_dir(self):
+        """Return the path of the template directory or template pack.
+        """
+
         # Get settings
         # corresponding to the given project type
         project_variables = self._variables[self._project_type]
 
-        project_name      = self._project_name
-        variables         = self._variables
-
         template_dir = project_variables[hyphen_to_underscore_string('template-dir')]
-        project_dir  = project_variables[hyphen_to_underscore_string('project-dir')]
+
+        return Path(template_dir).expanduser().resolve()
+
+    def _get_project_root(self):
+        """Return the directory the project is generated in.
+        """
+        project_variables = self._variables[self._project_type]
+        project_dir       = project_variables[hyphen_to_underscore_string('project-dir')]
+
+        return Path(project_dir).expanduser().resolve()
+
+    def _get_project_base_path(self):
+        """Return the base path of the project.
+        """
+        project_name = self._project_name
+
+        # Calculate the project base path
+        return (self._get_project_root() /
+                '{}'.format(project_name) /
+                '{}.git'.format(project_name))
+
+    def _prepare(self, bytecode_cache=None, tree_index=None, registries=None, auto_reload=False,
+                 filter_cache=None):
+        """Return the template base path, the template tree
+        and the environment registry used to render the templates.
+        """
 
         # Get the template base path
-        template_base_path = Path(template_dir).expanduser().resolve()
-        
+        template_base_path = self.get_template_dir()
+        template_dir = str(template_base_path)
+
         # Check that the template directory exists
         if not template_base_path.exists():
-            print("ERROR The template directory '{}' does not exist!\n".format(template_dir))
-            sys.exit(-1)
+            msg = "The template directory '{}' does not exist!".format(template_dir)
+            raise TemplateDirectoryNotFoundError(template_dir, msg)
 
-        # Calculate the project base path
-        project_base_path = (
-            Path(project_dir).expanduser().resolve() /
-                 '{}'.format(project_name) /
-                 '{}.git'.format(project_name))
+        with profiling.phase('prepare'):
 
-        # Check if the project directory exists already 
-        # (either in form of a file or as a directory)
-        # If inform user 
-        # and exit to avoid overwriting of existing files
-        if project_base_path.exists():
-            print('ERROR The path {} exists already!\n'.format(project_base_path) +
-                  'Exiting to avoid overwriting of existing files.')
-            sys.exit(-1)
-
-        # Print a header
-        print("\n"
-              "Generating Python project '{}'...\n".format(project_name) +
-              "\n"
-              "  - template dir: {}\n".format(template_base_path) +
-              "  - project dir:  {}\n".format(project_base_path))
-        
-        # INFO
-        if verbose:
-            print('mkdir {}'.format(project_base_path))
-                
-        # Create project base dir
-        project_base_path.mkdir(parents=True, exist_ok=False)
-
-        # Dirs and files to exclude
-        exclude_dirs  = ['.git', 'backup']
-        exclude_files = []
-        
-        # Walk the templates...
-        for template_path, directories, filenames in os.walk(template_base_path):
+            # The template tree:
+            # a template directory or a compiled template pack
+            tree = self._get_template_tree(template_base_path, tree_index)
+
+            # The jinja2 environments - one per delimiter profile - 
+            # shared by all templates of the template tree
+            registry = self._get_registry(tree, bytecode_cache, registries, auto_reload,
+                                          filter_cache)
+
+        return template_base_path, tree, registry
+
+    def _finish(self, registry):
+        """Clean up after generating or updating a project.
+        """
+
+        # Keep the bytecode cache within its size bounds
+        cache = registry.get_bytecode_cache()
+        if cache:
+            cache.prune()
+
+        # Keep the filter cache within its size bounds
+        cache = registry.get_filter_cache()
+        if cache:
+            cache.prune()
+
+    def _get_template_tree(self, template_base_path, tree_index=None):
+        """Return the template tree of the given template directory
+        or template pack.
+
+        When 'tree_index' is True, the index of a template directory
+        is persisted and reused by later runs; when it is None, the
+        'tree-index' settings decide.
+        """
+        if is_template_pack(template_base_path):
+            return TemplatePack(template_base_path)
+
+        index_settings = self._variables.get(hyphen_to_underscore_string('tree-index'))
+        if not isinstance(index_settings, Mapping):
+            index_settings = {'enabled': bool(index_settings)}
+        if tree_index is None:
+            tree_index = index_settings.get('enabled', False)
+
+        index_dir = index_settings.get('directory', TREE_INDEX_DIR) if tree_index else None
+        return TemplateDirectory(template_base_path, index_dir=index_dir)
+
+    def _get_registry(self, tree, bytecode_cache=None, registries=None, auto_reload=False,
+                      filter_cache=None):
+        """Return the environment registry used to render the templates.
+
+        When a 'registries' dictionary is given, a registry created
+        earlier for the same template tree and configuration is reused.
+        """
+        project_variables = self._variables[self._project_type]
+        variables         = self._variables
+
+        extension_profiles = project_variables.get(
+            hyphen_to_underscore_string('delimiter-profiles')) or {}
+        cache_settings = variables.get(hyphen_to_underscore_string('bytecode-cache'))
+        if bytecode_cache is None:
+            bytecode_cache = bytecode_cache_enabled(cache_settings)
+        cache = get_bytecode_cache(cache_settings) if bytecode_cache else None
+
+        filter_cache_settings = variables.get(hyphen_to_underscore_string('filter-cache'))
+        if filter_cache is None:
+            filter_cache = filter_cache_enabled(filter_cache_settings)
+        filter_cache = get_filter_cache(filter_cache_settings) if filter_cache else None
+
+        # The key identifying equivalent registries
+        key = (tree.registry_key(),
+               tuple(sorted(extension_profiles.items())),
+               str(cache.get_directory()) if cache else None,
+               str(filter_cache.get_directory()) if filter_cache else None,
+               auto_reload)
+
+        if registries is not None and key in registries:
+            return registries[key]
+
+        registry = tree.create_registry(extension_profiles=extension_profiles,
+                                        bytecode_cache=cache,
+                                        auto_reload=auto_reload,
+                                        filter_cache=filter_cache)
+
+        if registries is not None:
+            registries[key] = registry
+
+        return registry
+
+    def _plan(self, tree, project_base_path, registry, observer, debug=False):
+        """Return the list of directories to create,
+        the list of (action, path, project_file) tasks
+        to generate the files of the project 
+        from the files of the given template tree
+        and the number of skipped template files.
+        """
+
+        variables = self._variables
+
+        with profiling.phase('walk'):
+            directories, files = tree.walk()
+
+        # DEBUG
+        if debug:
+            observer(DebugMessage('DEBUG\n'
+                                  '  - template tree: {}\n'.format(tree.get_base_path()) +
+                                  '  - directories:   {}\n'.format(directories) +
+                                  '  - files:         {}\n'.format(files)))
+
+        project_directories = []
+        for path in directories:
+
+            # Resolve the paths
+            project_dir = os.path.join(project_base_path, *path.split('/'))
+
+            # When the project_dir contains jinja delimiters, 
+            # render it based on the given variables
+            if '{' in project_dir:
+                with profiling.phase('path-names'):
+                    project_dir = jinja_str(project_dir, variables, registry=registry)
+
+            project_directories.append(project_dir)
+
+        # Does the project base path itself contain jinja delimiters?
+        base_templated = '{' in str(project_base_path)
+
+        tasks = []
+        skipped = 0
+        for action, path, size, templated in files:
+
+            # Skip files with a name containing '.jinja.' or ending on '.jinja'
+            if action == ACTION_SKIP:
+                skipped += 1
+                continue
+
+            # Resolve the files
+            project_file = os.path.join(project_base_path, *path.split('/'))
+
+            # When the project_file contains jinja delimiters, 
+            # render it based on the given variables
+            if templated or base_templated:
+                with profiling.phase('path-names'):
+                    project_file = jinja_str(project_file, variables, registry=registry)
 
             # DEBUG
-            #| for d in [d for d in directories if d in exclude_dirs]:
-            #|     print('DEBUG skip {}'.format(d))
-            #| for f in [f for f in filenames if f in exclude_files]:
-            #|     print('DEBUG skip {}'.format(f))
+            if debug:
+                observer(DebugMessage('DEBUG\n'
+                                      '  - template_file: {}\n'.format(tree.template_file(path)) +
+                                      '  - project_file:  {}\n'.format(project_file)))
+
+            tasks.append((action, path, project_file))
+
+        return project_directories, tasks, skipped
+
+    def _get_copy_mode(self, copy_mode=None):
+        """Return the strategy used to copy files.
+        """
+        if copy_mode is None:
+            project_variables = self._variables[self._project_type]
+            copy_mode = project_variables.get(hyphen_to_underscore_string('copy-mode')) \
+                or DEFAULT_COPY_MODE
+
+        if copy_mode not in COPY_MODES:
+            msg = "Unknown copy mode '{}' - use one of: {}".format(copy_mode, ', '.join(COPY_MODES))
+            raise TempleException(msg)
 
-            # Skip the directories in the exclude list 
-            directories[:] = [d for d in directories if d not in exclude_dirs]
+        return copy_mode
 
-            # Skip the files in the exclude list 
-            filenames[:] = [f for f in filenames if f not in exclude_files]
+    def _get_task_options(self, copy_mode=None, analyse=True, analyses=None):
+        """Return the options used to execute the tasks:
+        the copy mode, the streaming settings, whether the templates
+        are analysed for the generation state and the analyses
+        recorded earlier by template path.
+        """
+        stream_settings = self._variables.get('streaming') or {}
 
-            # Skip temporary files
-            filenames[:] = [f for f in filenames 
-                            if not (f[0] == '#' or 
-                                    f[-1] == '~' or
-                                    (len(f) >= 2 and f[:2] == '.#'))]
+        # The worker processes profile the tasks
+        # with the options of the active profiler
+        profiler = profiling.get_profiler()
 
-            # Calculate the relative path 
-            # by "subtracting" the base path from the absolute path
-            rel_path = os.path.relpath(template_path, template_base_path)
-            project_path = os.path.abspath(os.path.join(project_base_path, rel_path))
+        return {
+            'copy_mode':        self._get_copy_mode(copy_mode),
+            'stream_threshold': stream_settings.get('threshold', STREAM_THRESHOLD),
+            'buffer_size':      stream_settings.get(hyphen_to_underscore_string('buffer-size'),
+                                                    STREAM_BUFFER_SIZE),
+            'profile':          profiler.get_options() if profiler else None,
+            'analyse':          analyse,
+            'analyses':         analyses or {},
+        }
+
+    def _execute(self, tasks, tree, registry, project_base_path, sink, observer,
+                 jobs=1, copy_mode=None, analyse=True, analyses=None, debug=False):
+        """Render and copy the files of the given tasks to the given sink
+        reporting the generated files to the given observer
+        and return the list of their state records.
+
+        When 'analyse' is True, the templates are analysed for the
+        generation state - 'analyses' are the analyses recorded
+        earlier of templates whose sources have not changed.
+        """
+        options = self._get_task_options(copy_mode, analyse, analyses)
+        copy_mode = options['copy_mode']
+
+        start = time.perf_counter()
+
+        # The hits and misses of the filter cache before the run
+        filter_cache = registry.get_filter_cache()
+        if filter_cache:
+            counters = filter_cache.counters()
+
+        # Only the filesystem can be written by several processes
+        if jobs > 1 and len(tasks) > 1 and sink.writes_to_filesystem:
+            results = self._run_tasks_parallel(tasks, tree, registry, project_base_path,
+                                               sink, jobs, options, observer)
+        else:
+            results = self._run_tasks(tasks, tree, registry, project_base_path,
+                                      sink, options, observer, debug=debug)
+
+        # The bytes written, copied and shared
+        generated    = [event for record, event in results]
+        copied       = [event for event in generated if isinstance(event, FileCopied)]
+        bytes_copied = sum(event.bytes for event in copied)
+        bytes_shared = sum(event.bytes_shared for event in copied)
+
+        # The hits and misses of the filter cache
+        # - including those of the worker processes
+        hits = misses = None
+        if filter_cache:
+            counters_after = filter_cache.counters()
+            hits   = counters_after['hits']   - counters['hits']
+            misses = counters_after['misses'] - counters['misses']
+
+        observer(GenerationFinished(len(generated), sum(event.bytes for event in generated),
+                                    time.perf_counter() - start, copy_mode,
+                                    bytes_copied, bytes_shared, hits, misses))
+
+        return [record for record, event in results]
+
+    def _run_tasks(self, tasks, tree, registry, project_base_path, sink, options, observer,
+                   debug=False):
+        """Render and copy the files one after the other.
+        """
+        # The fingerprints are taken lazily while rendering:
+        # the templates only modify their copy-on-write views
+        # so the fingerprints are the ones of the variables as given
+        # - and the ones compared by update()
+        fingerprint = VariablesFingerprint(self._variables)
+
+        results = []
+        for task in tasks:
+            action, path, project_file = task
 
             # DEBUG
             if debug:
-                print('DEBUG\n'
-                      '  - template_path: {}\n'.format(template_path) +
-                      '  - rel_path:      {}\n'.format(rel_path) +
-                      '  - project_path:  {}\n'.format(project_path) +
-                      '  - directories:   {}\n'.format(directories) +
-                      '  - filenames:     {}\n'.format(filenames))
-            
-            for directory in directories:
-
-                # DEBUG
-                #| print('DEBUG directory:', directory)
-
-                # Resolve the paths
-                template_dir = os.path.join(template_path, directory)
-                project_dir = os.path.join(project_path, directory)
-
-                # When the project_dir contains jinja delimiters, 
-                # render it based on the given variables
-                if '{' in project_dir:
-                    project_dir = jinja_str(project_dir, variables)
-
-                # DEBUG
-                if debug:
-                    print('DEBUG\n'
-                          '  - template_dir: {}\n'.format(template_dir) +
-                          '  - project_dir:  {}\n'.format(project_dir))
-
-                # INFO
-                if verbose:
-                    print('mkdir {}'.format(project_dir))
-                
-                # Create the corresponding project directory
-                os.mkdir(project_dir)
+                observer(DebugMessage('DEBUG\n'
+                                      '  - template_file: {}\n'.format(tree.template_file(path)) +
+                                      '  - project_file:  {}\n'.format(project_file)))
+
+            result = _execute_task(task, tree, registry, self._variables, self._index,
+                                   fingerprint, project_base_path, sink, options)
+            results.append(result)
 
-            for filename in filenames:
+            # Report the generated file
+            record, event = result
+            observer(event)
 
-                # DEBUG
-                #| print('DEBUG filename:', filename)
+        return results
+
+    def _run_tasks_parallel(self, tasks, tree, registry, project_base_path, sink, jobs, options,
+                            observer):
+        """Render and copy the files using a pool of 'jobs' worker processes.
+
+        The results are reported in the order of the tasks, so the
+        output does not depend on the scheduling of the workers.  When a
+        task fails, the pending tasks are cancelled and the error is
+        raised.
+        """
+        # The worker processes are only needed here
+        from concurrent.futures import ProcessPoolExecutor
+
+        initargs = (tree, registry, self._variables, project_base_path, sink, options)
+        with ProcessPoolExecutor(max_workers=jobs,
+                                 initializer=_init_worker,
+                                 initargs=initargs) as executor:
+
+            futures = [executor.submit(_run_task, task) for task in tasks]
+            results = []
+            try:
+                for future in futures:
+                    result, profile = future.result()
+                    results.append(result)
+
+                    # Merge the profile of the task recorded by the worker
+                    profiling.merge(profile)
+
+                    # Report the generated file
+                    record, event = result
+                    observer(event)
+
+            except BaseException:
+                # Abort:
+                # Cancel the tasks which have not been started yet
+                for future in futures:
+                    future.cancel()
+                raise
+
+        return results
+
+## =========================================================
+## Task execution
+## ---------------------------------------------------------
+
+def _relative_path(project_file, project_base_path):
+    """Return the path of a project file
+    relative to the project base path using '/' as separator.
+    """
+    return os.path.relpath(project_file, str(project_base_path)).replace(os.sep, '/')
+
+def _execute_task(task, tree, registry, variables, index, fingerprint, project_base_path,
+                  sink, options):
+    """Execute a single (action, path, project_file) task
+    rendering the templates with the given variables and their flat index
+    writing to the given sink
+    with the given options - see TemplateEngine._get_task_options().
+
+    Return the state record of the generated file
+    and the FileRendered or FileCopied event reporting it.
+    """
+    action, path, project_file = task
 
-                # Get the extension
-                extension = os.path.splitext(filename)[1].lower()
+    start = time.perf_counter()
 
-                # Resolve the files
-                template_file = os.path.join(template_path, filename)
-                project_file = os.path.join(project_path, filename)
+    template_file = tree.template_file(path)
 
-                # When the project_file contains jinja delimiters, 
-                # render it based on the given variables
-                if '{' in project_file:
-                    project_file = jinja_str(project_file, variables)
+    record = {
+        'action':       action,
+        'project_file': _relative_path(project_file, project_base_path),
+    }
 
-                # DEBUG
-                if debug:
-                    print('DEBUG\n'
-                          '  - template_file: {}\n'.format(template_file) +
-                          '  - project_file:  {}\n'.format(project_file))
+    # When profiling, record the time spent for the file
+    with profiling.task(path):
 
-                # Skip files with a name containing '.jinja.' or ending on '.jinja'
-                filename_lower = filename.lower()
-                if filename_lower[-6:] == '.jinja' or \
-                   '.jinja' in filename_lower:
+        try:
+            if action == ACTION_COPY:
 
-                    # DEBUG
-                    #| print('skip  {}'.format(project_file))
-                
-                    # Do nothing
-                    pass
+                # Copy image files etc.
+                with profiling.phase('copy'):
+                    bytes_copied, bytes_shared = \
+                        sink.copy_file(tree, path, project_file, mode=options['copy_mode'])
 
-                # Some files should just be copied
-                elif filename_lower in ['vita.make'] or \
-                   extension in ['.png', '.jpg', '.jpeg', '.sty', '.pdf', '.make']:
+                    if sink.writes_to_filesystem:
+                        record['source_stamp'] = tree.source_stamp(path)
+                        record['output_stamp'] = stamp_file(project_file)
+
+                event = FileCopied(project_file, path, bytes_copied, bytes_shared,
+                                   time.perf_counter() - start)
+
+            else:
+
+                # Generate the corresponding file from the template
+                output_hash, size = render_file(project_file, template_file, variables,
+                                                registry=registry,
+                                                stream_threshold=options['stream_threshold'],
+                                                buffer_size=options['buffer_size'],
+                                                open_file=sink.open_file,
+                                                index=index)
+
+                # Record the inputs of the template
+                # - analysing it only when it has changed
+                if options['analyse']:
+                    with profiling.phase('analyse'):
+                        analysis = options['analyses'].get(path)
+                        if analysis is None:
+                            env = registry.get_environment(registry.profile_for(template_file))
+                            analysis = analyse_template(env, registry.template_name(template_file))
+                        if analysis:
+                            record.update(analysis)
+                            record['variables_hash'] = fingerprint.fingerprint(analysis['variables'])
+
+                record['output_hash'] = output_hash
+
+                event = FileRendered(project_file, path, size, time.perf_counter() - start)
+
+        except (OSError, TemplateError) as e:
+            # Exceptions have to be pickled to be passed from worker 
+            # processes to the main process - which does not work for all
+            # exception classes
+            raise GenerationError(template_file, str(e)) from None
+
+    return record, event
+
+def _modified_since_generation(record, project_file):
+    """Return True when the given generated file has been modified
+    since its generation - or cannot be compared with its state record.
+    """
+    if record['action'] == ACTION_COPY:
+        return not record.get('output_stamp') \
+            or record['output_stamp'] != stamp_file(project_file)
+
+    return not record.get('output_hash') \
+        or record['output_hash'] != hash_file(project_file)
+
+def _task_outcome(task, record, tree, registry, fingerprint, project_base_path, force,
+                  analyses):
+    """Return the outcome of updating the file of a task:
+
+      - 'updated': the file has to be generated again,
+      - 'unchanged': the inputs of the file have not changed,
+      - 'conflict': the file has been modified since its generation
+        and 'force' is not given.
+
+    When only the variables of a template have changed, its recorded
+    analysis is still valid and added to 'analyses'.
+    """
+    action, path, project_file = task
+
+    # Has the file been modified since its generation?
+    # Modified files are only overwritten when forced
+    if os.path.exists(project_file):
+        # Linked files change with their source
+        if record is None \
+           or (action == ACTION_COPY and record.get('output_stamp')
+               and record['output_stamp'] != stamp_file(project_file)
+               and tree.source_stamp(path) != stamp_file(project_file)) \
+           or (action == ACTION_RENDER and record.get('output_hash')
+               and record['output_hash'] != hash_file(project_file)):
+            return 'updated' if force else 'conflict'
+
+    # New files, files generated differently before
+    # and deleted files have to be generated
+    if record is None \
+       or record['action'] != action \
+       or record['project_file'] != _relative_path(project_file, project_base_path) \
+       or not os.path.exists(project_file):
+        return 'updated'
+
+    if action == ACTION_COPY:
+        if record.get('source_stamp') != tree.source_stamp(path):
+            return 'updated'
+        return 'unchanged'
+
+    # Templates which could not be analysed
+    # are always rendered
+    if not record.get('template_hash'):
+        return 'updated'
+
+    template_file = tree.template_file(path)
+    env = registry.get_environment(registry.profile_for(template_file))
+
+    if dependencies_changed(env, {registry.template_name(template_file): record['template_hash']}) \
+       or dependencies_changed(env, record['dependencies']):
+        return 'updated'
+
+    # The sources have not changed
+    # - there is no need to analyse them again
+    if record['variables_hash'] != fingerprint.fingerprint(record['variables']):
+        analyses[path] = get_analysis(record)
+        return 'updated'
+
+    return 'unchanged'
+
+## =========================================================
+## Worker processes
+## ---------------------------------------------------------
+
+# The state of a worker process:
+# the template tree, the environment registry, the variables and their index,
+# the project base path, the output sink and the task options
+_worker_state = {}
+
+def _init_worker(tree, registry, variables, project_base_path, sink, options):
+    """Initialize a worker process.
+    """
+    _worker_state['tree']              = tree
+    _worker_state['registry']          = registry
+    _worker_state['variables']         = variables
+    _worker_state['index']             = _create_index(variables)
+    _worker_state['fingerprint']       = VariablesFingerprint(variables)
+    _worker_state['project_base_path'] = project_base_path
+    _worker_state['sink']              = sink
+    _worker_state['options']           = options
+
+    # Profile the tasks like the main process
+    if options.get('profile'):
+        profiling.activate(profiling.Profiler(**options['profile']))
+
+def _run_task(task):
+    """Execute a single (action, path, project_file) task
+    in a worker process.
+    """
+    result = _execute_task(task,
+                           _worker_state['tree'],
+                           _worker_state['registry'],
+                           _worker_state['variables'],
+                           _worker_state['index'],
+                           _worker_state['fingerprint'],
+                           _worker_state['project_base_path'],
+                           _worker_state['sink'],
+                           _worker_state['options'])
 
-                    # INFO
-                    if verbose:
-                        print('copy  {}'.format(project_file))
-                
-                    # Copy image files
-                    copyfile(template_file, project_file)
+    # Record the hits and misses of the worker
+    # - the workers are terminated without notice
+    filter_cache = _worker_state['registry'].get_filter_cache()
+    if filter_cache:
+        filter_cache.flush()
 
-                else:
+    # Pass the profile of the task to the main process
+    profiler = profiling.get_profiler()
+    profile = profiler.collect() if profiler else None
 
-                    # Generate the corresponding file from the template
-                    generate_file_from_template(project_file, template_file, variables,
-                                                verbose=verbose, debug=debug)
+    return result, profile
 
 ## =========================================================
 ## =========================================================
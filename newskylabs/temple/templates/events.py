@@ -0,0 +1,455 @@
+## =========================================================
+## Copyright 2019 Dietrich Bollmann
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##      http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+## ---------------------------------------------------------
+
+"""newskylabs/temple/templates/events.py:
+
+Events reported by the template engine while generating or updating a
+project - and observers receiving them.
+
+An observer is any callable taking an event:
+
+  engine.generate(observer=lambda event: events.append(event))
+
+The events are:
+
+  - GenerationStarted:  a generation or update starts,
+  - TasksPlanned:       the directories and files have been planned,
+  - DirectoryCreated:   a directory has been created,
+  - FileRendered:       a file has been rendered from a template,
+  - FileCopied:         a file has been copied,
+  - FileConflict:       a modified file has not been overwritten,
+  - FileObsolete:       a file is not generated any more,
+  - FileRemoved:        an obsolete file has been removed,
+  - GenerationFinished: the files have been generated,
+  - DebugMessage:       debugging output.
+
+The observers defined here
+
+  - ConsoleObserver:  print the messages temple always printed,
+  - JsonObserver:     print the events as json lines,
+  - ProgressObserver: print the progress with an estimated time left,
+  - ObserverGroup:    pass the events to several observers,
+
+buffer their output and write it in blocks - so printing does not slow
+down the generation of large template trees.  The engine calls the
+flush() method of an observer, when it has one, at the end of a run.
+
+"""
+
+import sys
+import json
+import time
+
+from newskylabs.temple.utils.file_utilities import format_size
+
+## =========================================================
+## Event settings
+## ---------------------------------------------------------
+
+# Buffered output is written
+# when this number of lines has been collected
+_FLUSH_LINES = 256
+
+# ...or when it has been collected for this number of seconds
+_FLUSH_INTERVAL = 0.2
+
+# Seconds between the updates of the progress
+PROGRESS_INTERVAL = 0.1
+
+# Seconds between the progress lines
+# when the output is not a terminal
+_PROGRESS_LOG_INTERVAL = 5.0
+
+## =========================================================
+## Events
+## ---------------------------------------------------------
+
+class Event():
+    """Base class of the events.
+    'kind' names the event in the json output.
+    """
+
+    kind = None
+
+    def __init__(self):
+        # The time of the event - in seconds since the epoch
+        self.time = time.time()
+
+    def to_dict(self):
+        """Return the event as a json-serializable dictionary.
+        """
+        data = {'event': self.kind}
+        data.update(self.__dict__)
+        return data
+
+    def __repr__(self):
+        fields = ', '.join('{}={!r}'.format(key, value) for key, value in self.__dict__.items()
+                           if key != 'time')
+        return '{}({})'.format(self.__class__.__name__, fields)
+
+class GenerationStarted(Event):
+    """A generation ('generate') or update ('update') starts.
+    """
+
+    kind = 'generation-started'
+
+    def __init__(self, operation, project_name, template_dir, project_dir):
+        super().__init__()
+        self.operation    = operation
+        self.project_name = project_name
+        self.template_dir = template_dir
+        self.project_dir  = project_dir
+
+class TasksPlanned(Event):
+    """The number of directories and files to generate
+    and the number of skipped template files - like included
+    '.jinja' templates or, when updating, the unchanged files.
+    """
+
+    kind = 'tasks-planned'
+
+    def __init__(self, directories, files, skipped=0):
+        super().__init__()
+        self.directories = directories
+        self.files       = files
+        self.skipped     = skipped
+
+class DirectoryCreated(Event):
+
+    kind = 'directory-created'
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+
+class FileRendered(Event):
+    """A file has been rendered from a template:
+    'bytes' is the size of the file,
+    'duration' the seconds needed to render and write it.
+    """
+
+    kind = 'file-rendered'
+
+    def __init__(self, path, template, bytes, duration):
+        super().__init__()
+        self.path     = path
+        self.template = template
+        self.bytes    = bytes
+        self.duration = duration
+
+class FileCopied(Event):
+    """A file has been copied:
+    'bytes' is the number of bytes copied,
+    'bytes_shared' the number of bytes shared with the source file
+    - see the copy modes.
+    """
+
+    kind = 'file-copied'
+
+    def __init__(self, path, template, bytes, bytes_shared, duration):
+        super().__init__()
+        self.path         = path
+        self.template     = template
+        self.bytes        = bytes
+        self.bytes_shared = bytes_shared
+        self.duration     = duration
+
+class FileConflict(Event):
+    """A file modified since its generation has not been overwritten.
+    """
+
+    kind = 'file-conflict'
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+
+class FileObsolete(Event):
+    """A generated file is not generated any more:
+    its template has been removed or its path has changed.
+    """
+
+    kind = 'file-obsolete'
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+
+class FileRemoved(Event):
+    """An obsolete generated file has been removed.
+    """
+
+    kind = 'file-removed'
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+
+class GenerationFinished(Event):
+    """The files have been generated:
+    the number of files, the bytes written, the seconds needed,
+    the bytes copied and shared by the copy mode
+    and the hits and misses of the filter cache - or None.
+    """
+
+    kind = 'generation-finished'
+
+    def __init__(self, files, bytes, duration, copy_mode, bytes_copied, bytes_shared,
+                 filter_cache_hits=None, filter_cache_misses=None):
+        super().__init__()
+        self.files               = files
+        self.bytes               = bytes
+        self.duration            = duration
+        self.copy_mode           = copy_mode
+        self.bytes_copied        = bytes_copied
+        self.bytes_shared        = bytes_shared
+        self.filter_cache_hits   = filter_cache_hits
+        self.filter_cache_misses = filter_cache_misses
+
+class DebugMessage(Event):
+
+    kind = 'debug'
+
+    def __init__(self, message):
+        super().__init__()
+        self.message = message
+
+## =========================================================
+## Observers
+## ---------------------------------------------------------
+
+class Observer():
+    """Base class of the observers:
+    an event is passed to the on_<kind>() method of the observer
+    - with the hyphens of the kind replaced by underscores.
+    """
+
+    def __call__(self, event):
+        method = getattr(self, 'on_' + event.kind.replace('-', '_'), None)
+        if method is not None:
+            method(event)
+
+    def flush(self):
+        """Write buffered output.
+        """
+
+class _BufferedObserver(Observer):
+    """An observer writing buffered lines
+    to the given file - by default to the current sys.stdout.
+    """
+
+    def __init__(self, file=None):
+        self._file  = file
+        self._lines = []
+        self._flushed = time.monotonic()
+
+    def write(self, line):
+        """Write a line - buffered.
+        """
+        self._lines.append(line)
+        if len(self._lines) >= _FLUSH_LINES \
+           or time.monotonic() - self._flushed >= _FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        self._flushed = time.monotonic()
+        if self._lines:
+            # sys.stdout is looked up when writing
+            # - it might be redirected
+            file = self._file or sys.stdout
+            file.write('\n'.join(self._lines) + '\n')
+            file.flush()
+            self._lines = []
+
+class ConsoleObserver(_BufferedObserver):
+    """Print the messages of the engine.
+    When 'verbose' is False, only the headers are printed.
+    """
+
+    # The labels of the generated files
+    _LABELS = {
+        FileRendered.kind: 'jinja',
+        FileCopied.kind:   'copy ',
+    }
+
+    def __init__(self, verbose=True, file=None):
+        super().__init__(file)
+        self._verbose = verbose
+
+    def on_generation_started(self, event):
+        if event.operation == 'update':
+            title = "Updating project '{}'...".format(event.project_name)
+        else:
+            title = "Generating Python project '{}'...".format(event.project_name)
+
+        self.write("\n" +
+                   "{}\n".format(title) +
+                   "\n"
+                   "  - template dir: {}\n".format(event.template_dir) +
+                   "  - project dir:  {}\n".format(event.project_dir))
+
+    def on_directory_created(self, event):
+        if self._verbose:
+            self.write('mkdir {}'.format(event.path))
+
+    def on_file_rendered(self, event):
+        if self._verbose:
+            self.write('{} {}'.format(self._LABELS[event.kind], event.path))
+
+    on_file_copied = on_file_rendered
+
+    def on_file_conflict(self, event):
+        if self._verbose:
+            self.write('CONFLICT {} has been modified - not overwriting it'.format(event.path))
+
+    def on_file_obsolete(self, event):
+        if self._verbose:
+            self.write('obsolete {}'.format(event.path))
+
+    def on_file_removed(self, event):
+        if self._verbose:
+            self.write('removed  {}'.format(event.path))
+
+    def on_generation_finished(self, event):
+        if self._verbose and (event.bytes_copied or event.bytes_shared):
+            self.write('\n'
+                       'Copied files ({}): {} copied, {} shared'.format(
+                           event.copy_mode, format_size(event.bytes_copied),
+                           format_size(event.bytes_shared)))
+
+        if self._verbose and (event.filter_cache_hits or event.filter_cache_misses):
+            self.write('\n'
+                       'Filter cache: {} hits, {} misses'.format(
+                           event.filter_cache_hits, event.filter_cache_misses))
+
+    def on_debug(self, event):
+        self.write(event.message)
+
+class JsonObserver(_BufferedObserver):
+    """Print the events as json objects - one per line.
+    """
+
+    def __call__(self, event):
+        self.write(json.dumps(event.to_dict(), sort_keys=True, default=str))
+
+class ProgressObserver(Observer):
+    """Print the number of generated files, the throughput and the
+    estimated time left - on a single updated line of a terminal, or
+    every few seconds on a line of its own otherwise.  The progress is
+    printed to the given file - by default to sys.stderr.
+    """
+
+    def __init__(self, file=None, interval=PROGRESS_INTERVAL):
+        self._file     = file
+        self._interval = interval
+        self._reset()
+
+    def _reset(self, total=0):
+        self._total   = total
+        self._done    = 0
+        self._bytes   = 0
+        self._start   = time.monotonic()
+        self._printed = None
+
+    def _get_file(self):
+        return self._file or sys.stderr
+
+    def on_tasks_planned(self, event):
+        self._reset(event.files)
+
+    def on_file_rendered(self, event):
+        self._done  += 1
+        self._bytes += event.bytes
+
+        now = time.monotonic()
+        interval = self._interval if self._is_terminal() else _PROGRESS_LOG_INTERVAL
+        if self._printed is None or now - self._printed >= interval:
+            self._print(now)
+
+    on_file_copied = on_file_rendered
+
+    def on_generation_finished(self, event):
+        self._print(time.monotonic(), final=True)
+
+    def _is_terminal(self):
+        isatty = getattr(self._get_file(), 'isatty', None)
+        return bool(isatty and isatty())
+
+    def _print(self, now, final=False):
+        self._printed = now
+
+        elapsed = now - self._start
+        rate = self._done / elapsed if elapsed > 0 else 0
+
+        if final:
+            eta = 'done in {}'.format(_format_seconds(elapsed))
+        elif rate and self._total:
+            eta = 'ETA {}'.format(_format_seconds((self._total - self._done) / rate))
+        else:
+            eta = 'ETA -'
+
+        total = self._total or '?'
+        share = '{:.0%}'.format(self._done / self._total) if self._total else '-'
+        line = '[{}/{}] {} {:.1f} files/s {:.1f} MB/s {}'.format(
+            self._done, total, share, rate, self._bytes / (1024 * 1024) / elapsed if elapsed else 0,
+            eta)
+
+        file = self._get_file()
+        if self._is_terminal():
+            file.write('\r\x1b[K' + line + ('\n' if final else ''))
+        else:
+            file.write(line + '\n')
+        file.flush()
+
+class ObserverGroup(Observer):
+    """Pass the events to several observers.
+    """
+
+    def __init__(self, observers):
+        self._observers = list(observers)
+
+    def get_observers(self):
+        return self._observers
+
+    def __call__(self, event):
+        for observer in self._observers:
+            observer(event)
+
+    def flush(self):
+        for observer in self._observers:
+            flush_observer(observer)
+
+## =========================================================
+## Utilities
+## ---------------------------------------------------------
+
+def flush_observer(observer):
+    """Flush the output of the given observer - when it has a flush() method.
+    """
+    flush = getattr(observer, 'flush', None)
+    if flush is not None:
+        flush()
+
+def _format_seconds(seconds):
+    """Format a duration as h:mm:ss.
+    """
+    seconds = int(round(seconds))
+    return '{}:{:02}:{:02}'.format(seconds // 3600, seconds // 60 % 60, seconds % 60)
+
+## =========================================================
+## =========================================================
+
+## fin.
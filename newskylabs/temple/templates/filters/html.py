@@ -20,18 +20,26 @@ A Jinja2 filter for rendering markdown as html.
 
 """
 
-from jinja2 import environmentfilter
+from jinja2 import contextfilter
 from newskylabs.temple.templates.filters.text_filter_html import TextFilterHTML
 
 ## =========================================================
 ## jinja tools
 ## ---------------------------------------------------------
 
-@environmentfilter
-def html_filter(env, value):
+@contextfilter
+def html_filter(context, value):
 
     # Get my variable context
-    variables = env.temple['variables']
+    variables = context.parent
+
+    # Return the cached result
+    # when the text has been filtered with the same variables before
+    cache = context.environment.temple.get('filter_cache')
+    if cache:
+        htmlstr = cache.get('html', value, variables)
+        if htmlstr is not None:
+            return htmlstr
 
     # Instantiate the HTML filter
     text_filter = TextFilterHTML(value, variables)
@@ -52,6 +60,9 @@ def html_filter(env, value):
     # DEBUG
     #| htmlstr = '!!!!!!!! "{}" -> "{}"\n'.format(value, htmlstr)
 
+    if cache:
+        cache.put('html', value, variables, text_filter.get_dereferenced_paths(), htmlstr)
+
     return htmlstr
 
 ## =========================================================
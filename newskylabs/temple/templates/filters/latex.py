@@ -20,18 +20,26 @@ A Jinja2 filter for rendering markdown as latex.
 
 """
 
-from jinja2 import environmentfilter
+from jinja2 import contextfilter
 from newskylabs.temple.templates.filters.text_filter_latex import TextFilterLaTeX
 
 ## =========================================================
 ## jinja tools
 ## ---------------------------------------------------------
 
-@environmentfilter
-def latex_filter(env, value):
+@contextfilter
+def latex_filter(context, value):
 
     # Get my variable context
-    variables = env.temple['variables']
+    variables = context.parent
+
+    # Return the cached result
+    # when the text has been filtered with the same variables before
+    cache = context.environment.temple.get('filter_cache')
+    if cache:
+        latexstr = cache.get('latex', value, variables)
+        if latexstr is not None:
+            return latexstr
 
     # Instantiate the LaTeX filter
     text_filter = TextFilterLaTeX(value, variables)
@@ -45,6 +53,9 @@ def latex_filter(env, value):
     # DEBUG
     #| latexstr = '!!!!!!!! "{}" -> "{}"\n'.format(value, latexstr)
 
+    if cache:
+        cache.put('latex', value, variables, text_filter.get_dereferenced_paths(), latexstr)
+
     return latexstr
 
 ## =========================================================
@@ -65,9 +65,14 @@ class LaTeXPrinter():
         # Return the generated string
         return string
 
-    def _write(self, string):
+    def write(self, string):
         self._strbuf.write(string)
 
+    def getvalue(self):
+        """Return the string written so far.
+        """
+        return self._strbuf.getvalue()
+
     def tree_to_string(self, elem, print_tags=True):
 
         # Only the text content of the text tag 
@@ -87,7 +92,7 @@ class LaTeXPrinter():
             self.start_tag_to_string(elem, is_empty)
 
         # Print text
-        self._write(text)
+        self.write(text)
             
         # Print child elements
         for child in elem:
@@ -98,20 +103,20 @@ class LaTeXPrinter():
             self.end_tag_to_string(elem, is_empty)
 
         # Print tail
-        self._write(tail)
+        self.write(tail)
             
     def start_tag_to_string(self, elem, is_empty):
 
-        self._write('\\{}{{'.format(elem.tag))
+        self.write('\\{}{{'.format(elem.tag))
         self.attribs_to_string(elem)
 
     def attribs_to_string(self, elem):
         for key, value in sorted(elem.attrib.items()):
-            self._write(' {}="{}"'.format(key, value))
+            self.write(' {}="{}"'.format(key, value))
 
     def end_tag_to_string(self, elem, is_empty):
         if not is_empty:
-            self._write('}')
+            self.write('}')
 
 ## =========================================================
 ## =========================================================
@@ -20,7 +20,18 @@ A Jinja2 filter for rendering markdown as markdown.
 
 """
 
-from jinja2 import environmentfilter
+import threading
+
+from functools import lru_cache
+from collections.abc import Mapping, Sequence
+from jinja2 import contextfilter, TemplateError
+
+from newskylabs.temple.templates.engine import TempleException
+
+try:
+    import markdown
+except ImportError:
+    markdown = None
 
 #| import re
 #| from jinja2 import evalcontextfilter, Markup, escape
@@ -35,51 +46,153 @@ from jinja2 import environmentfilter
 #|         result = Markup(result)
 #|     return result
 
+## =========================================================
+## Markdown settings
+## ---------------------------------------------------------
+
+# Markdown extensions used by default
+# 
+# Can be overwritten with the 'extensions' entry 
+# of the 'markdown' settings.
+# 
+# See:
+# 
+#   - Python Markdown Extension
+#     https://python-markdown.github.io/extensions/
+# 
+DEFAULT_EXTENSIONS = [
+    #| 'markdown.extensions.attr_list',    # Attribute Lists
+    #| 'markdown.extensions.legacy_attr',   # Legacy Attributes
+]
+
+# Number of converted texts kept in memory
+MARKDOWN_CACHE_SIZE = 1024
+
+# The variables the converted text depends on
+_DEREFERENCED_PATHS = ['markdown.extensions']
+
+## =========================================================
+## Exceptions
+## ---------------------------------------------------------
+
+class MarkdownSettingsError(TempleException):
+    """Exception raised when the markdown settings are invalid.
+
+    Attributes:
+        setting -- the path of the invalid setting
+        message -- explanation of the error
+    """
+
+    def __init__(self, setting, message):
+        super().__init__(setting, message)
+        self.setting = setting
+        self.message = "Invalid setting '{}': {}".format(setting, message)
+
+    def __str__(self):
+        return self.message
+
+## =========================================================
+## Converters
+## ---------------------------------------------------------
+
+# The converters of each thread - by extensions.
+# Markdown instances are not thread-safe
+# but can be reused after a reset().
+_converters = threading.local()
+
+def get_converter(extensions):
+    """Return the markdown converter of the current thread
+    using the given tuple of extensions.
+    """
+    converters = getattr(_converters, 'converters', None)
+    if converters is None:
+        converters = _converters.converters = {}
+
+    converter = converters.get(extensions)
+    if converter is None:
+        try:
+            converter = markdown.Markdown(extensions=list(extensions))
+        except (ImportError, AttributeError, TypeError) as e:
+            msg = 'Unable to load the markdown extensions {}: {}'.format(
+                ', '.join(extensions), e)
+            raise MarkdownSettingsError('markdown.extensions', msg) from None
+        converters[extensions] = converter
+
+    return converter
+
+@lru_cache(maxsize=MARKDOWN_CACHE_SIZE)
+def convert(text, extensions=()):
+    """Convert markdown text to html using the given tuple of extensions.
+
+    The results are cached - so that repeated texts
+    like footers and boilerplate are only converted once.
+    """
+    if markdown is None:
+        raise TemplateError(u"Cannot load the markdown library")
+
+    converter = get_converter(extensions)
+    try:
+        return converter.convert(text)
+    finally:
+        converter.reset()
+
+def _get_extensions(variables):
+    """Return the tuple of extensions defined in the 'markdown'
+    settings - or the default extensions.
+
+    The extensions have to be given by their import strings;
+    a MarkdownSettingsError names the first invalid entry.
+    """
+    settings = variables.get('markdown')
+    if not (isinstance(settings, Mapping) and settings.get('extensions') is not None):
+        return tuple(DEFAULT_EXTENSIONS)
+
+    extensions = settings['extensions']
+    if isinstance(extensions, str) or not isinstance(extensions, Sequence):
+        msg = "A list of extensions like ['markdown.extensions.toc'] is expected - not {!r}" \
+            .format(extensions)
+        raise MarkdownSettingsError('markdown.extensions', msg)
+
+    # Extensions with configurations
+    # - like {'toc': {'permalink': True}} - are not supported
+    for position, extension in enumerate(extensions):
+        if not isinstance(extension, str):
+            msg = "An extension has to be given by its import string " \
+                "like 'markdown.extensions.toc' - not {!r}".format(extension)
+            raise MarkdownSettingsError('markdown.extensions[{}]'.format(position), msg)
+
+    return tuple(extensions)
+
 ## =========================================================
 ## jinja tools
 ## ---------------------------------------------------------
 
-@environmentfilter
-def markdown_filter(env, value):
+@contextfilter
+def markdown_filter(context, value):
     #| result = do_something(value)
     #| if env.autoescape:
     #|     result = Markup(result)
     #| return result
     #| environmentfilter
 
-    #| marked = md.Markdown(**d)
+    # Get my variable context
+    variables = context.parent
 
-    try:
-        import markdown
+    text = str(value)
+    extensions = _get_extensions(variables)
 
-    except ImportError:
-        log.error(u"Cannot load the markdown library.")
-        raise TemplateError(u"Cannot load the markdown library")
+    # The persistent filter cache
+    # - the result depends on the markdown extensions
+    cache = context.environment.temple.get('filter_cache')
+    if cache:
+        marked = cache.get('markdown', text, variables)
+        if marked is not None:
+            return marked
+
+    marked = convert(text, extensions)
 
-    # Markdown extensions to be used
-    # 
-    # See:
-    # 
-    #   - Python Markdown Extension
-    #     https://python-markdown.github.io/extensions/
-    # 
-    extensions = [
-        #| 'markdown.extensions.attr_list',    # Attribute Lists
-        #| 'markdown.extensions.legacy_attr',   # Legacy Attributes
-    ]
-    #| 
-    #| d = dict()
-    #| d['extensions'] = list()
-    #| d['extensions'].extend(extensions)
-    #| 
-
-    md = markdown.Markdown(extensions=extensions)
-    #| md = markdown.Markdown(extensions=['markdown'])
-    #| out = md.convert(text)
-
-    #| md = markdown.Markdown(**d)
-    #str = value.strip()
-    marked = md.convert(value)
+    if cache:
+        cache.put('markdown', text, variables, _DEREFERENCED_PATHS, marked)
 
     return marked
 
@@ -120,117 +120,195 @@ More general examples:
   '<temple var="also.a.path" />'
   'value'
 
+Each path is parsed only once: compile_path() compiles it into a cached
+PathResolver which only evaluates the nested paths when the value is
+retrieved.  Paths nested deeper than MAX_NESTING_DEPTH levels are
+rejected.
+
+The values are looked up in the flat index of the variables passed
+as 'temple.index' - see template_variables() - and only searched in
+the nested variables when they are not indexed, like the variables
+describing the template file.
+
+The index is built once for all templates from the variables the
+project is generated with: the values of paths below a top-level
+variable are the original ones - modifications of a template, like
+{% do nav.append('about') %}, are not seen.  This was the case for
+'{% set %}' assignments before as well: the filters look up the
+variables the template is rendered with, not the ones it defines.
+
 """
 
-import sys, re
+import re
+
+from functools import lru_cache
+
+from jinja2 import TemplateRuntimeError
 
 from newskylabs.utils.generic import get_recursively
 
 ## =========================================================
-## get_path_value(variables, path)
+## Exceptions
 ## ---------------------------------------------------------
 
-def _parse_path_string(variables, path):
+# The exceptions are jinja2 template errors - so that they are reported
+# as errors of the template being rendered
+
+class PathError(TemplateRuntimeError):
+    """Exception raised when a path is ill-formed.
     """
-    Parse the longest prefix of 'path'
-    made of any characters beyond '{' and '}'.
+
+class UndefinedPathError(PathError):
+    """Exception raised when a path is not defined.
     """
 
-    pattern = re.compile(r"([^{}]*)(.*)")
-    match = pattern.match(path)
-    if match:
-        string = match.group(1)
-        rest   = match.group(2)
+## =========================================================
+## Path settings
+## ---------------------------------------------------------
 
-        return string, rest
+# Maximal depth of recursively nested paths
+MAX_NESTING_DEPTH = 32
 
-    else:
-        # Should never happen
-        raise Exception("_parse_path_string(): Unable to parse the path '{}'!".format(path))
+# Number of compiled paths kept in memory
+PATH_CACHE_SIZE = 4096
 
-def _parse_nested_path(variables, path):
-    """Parse a nested path included in '{' and '}' and return its value.
-    Nested paths are allowed to be recursive - a nested path might
-    itself contain other nested paths.
+# The tokens of a path:
+# strings made of any characters beyond '{' and '}', '{', and '}'
+_PATH_TOKEN_RE = re.compile(r'[^{}]+|[{}]')
+
+## =========================================================
+## Utilities
+## ---------------------------------------------------------
 
+def _get_index(variables):
+    """Return the flat index of the given variables
+    - or None when they are not indexed.
     """
+    temple = variables.get('temple')
+    if isinstance(temple, dict):
+        return temple.get('index')
+    return None
 
-    # Read leading '{'
-    if path[0] != '{':
-        # Ill-formed path
-        raise Exception("_parse_nested_path(): A nested path has to start with '{{': {}" \
-                        .format(path))
-    path = path[1:]
+## =========================================================
+## class PathResolver
+## ---------------------------------------------------------
 
-    # Parse the nested path 
-    # and get its value
-    value, rest = _parse_path(variables, path)
+class PathResolver():
+    """A compiled path - which might contain recursive nested paths.
 
-    # Read trailing '}'
-    if rest[0] != '}':
-        # Ill-formed path
-        raise Exception("_parse_nested_path(): A nested path has to end with '}}': {}" \
-                        .format(path))
-    rest = rest[1:]
+    The path is parsed once: its parts are the static strings of the
+    path - with hyphens already converted to underlines - and the
+    resolvers of its nested paths.  Only the nested paths are
+    evaluated when the value of the path is retrieved.
+    """
 
-    return value, rest
+    def __init__(self, parts):
+        """
+        """
+        self._parts = parts
+
+        # The keychain of a path without nested paths
+        if all(isinstance(part, str) for part in parts):
+            self._keychain = ''.join(parts)
+        else:
+            self._keychain = None
+
+    def get_keychain(self, variables):
+        """Return the keychain of the path
+        with the nested paths substituted by their values.
+        """
+        if self._keychain is not None:
+            return self._keychain
+
+        keychain = ''
+        for part in self._parts:
+            if isinstance(part, str):
+                keychain += part
+            else:
+                keychain += part.resolve(variables)
+
+        # Hyphens in the values of nested paths
+        # are converted to underlines as well
+        return keychain.replace('-', '_')
+
+    def resolve(self, variables):
+        """Return the value of the path.
+        """
+        keychain = self.get_keychain(variables)
+
+        # Retrive the value of the path:
+        # from the flat index of the variables, when indexed
+        index = _get_index(variables)
+        value = index.get(keychain) if index is not None else None
+        if value is None:
+            value = get_recursively(variables, keychain)
+
+        # DEBUG
+        #| print("DEBUG get_recursively(variables, '{}'): {}".format(keychain, value))
+
+        # Ensure that the path is defined
+        if value is None:
+            raise UndefinedPathError('Undefined data path: {}'.format(keychain))
+
+        return value
+
+## =========================================================
+## compile_path(path)
+## ---------------------------------------------------------
 
-def _parse_path(variables, path):
-    """Parse a path - which might contain recusive nested paths - and
-    return its value.
+@lru_cache(maxsize=PATH_CACHE_SIZE)
+def compile_path(path):
+    """Compile the given path
+    (which might contain recursive nested paths)
+    into a PathResolver.
 
+    The compiled paths are cached.
     """
 
-    # Parse the longest prefix
-    # made of any characters beyond '{' and '}'
-    path, rest = _parse_path_string(variables, path)
-
-    # Parse any number of 
-    # a nested path followed by a path string
-    while rest != '' and rest[0] != '}' and rest[0] == '{':
-        
-        # Parse a nested path
-        value, rest = _parse_nested_path(variables, rest)
-        path += value
-        
-        # Parse a path string
-        # (A string containing either '{' nor '}')
-        string, rest = _parse_path_string(variables, rest)
-        path += string
-
-    # Hyphens in paths are converted to underlines
-    # Substitute all hyphens ('-') in the path with underlines '_'
-    path = path.replace('-', '_')
-    
-    # Retrive the value of the path
-    value = get_recursively(variables, path)
-
-    # DEBUG
-    #| print("DEBUG get_recursively(variables, '{}'): {}".format(path, value))
-
-    # Ensure that the file exists
-    if value == None:
-        print('ERROR Undefined data path: {}'.format(path))
-        sys.exit(1)
-
-    return value, rest
+    # The parts of the path and of the nested paths being parsed
+    stack = [[]]
 
-def get_path_value(variables, path):
-    """Get the value of the given path (which might contain recursive
-    nested paths).
+    for token in _PATH_TOKEN_RE.findall(path):
 
-    """
+        if token == '{':
+
+            # Start a nested path
+            if len(stack) > MAX_NESTING_DEPTH:
+                raise PathError("Nested paths are nested deeper than {} levels: {}" \
+                                .format(MAX_NESTING_DEPTH, path))
+            stack.append([])
+
+        elif token == '}':
+
+            # End a nested path
+            if len(stack) == 1:
+                # Ill-formed path
+                raise PathError("Ill-formed path - '}}' without '{{': {}".format(path))
+            parts = stack.pop()
+            stack[-1].append(PathResolver(parts))
+
+        else:
+
+            # Hyphens in paths are converted to underlines
+            stack[-1].append(token.replace('-', '_'))
 
-    # Get the value of the given path
-    value, rest = _parse_path(variables, path)
-    
-    # Ensure that the whole path has been parsed
-    if rest != '':
+    if len(stack) > 1:
         # Ill-formed path
-        raise Exception("get_path_value(): Ill-formed path: {}" \
+        raise PathError("Ill-formed path - a nested path has to end with '}}': {}" \
                         .format(path))
 
-    return value
+    return PathResolver(stack[0])
+
+## =========================================================
+## get_path_value(variables, path)
+## ---------------------------------------------------------
+
+def get_path_value(variables, path):
+    """Get the value of the given path (which might contain recursive
+    nested paths).
+
+    """
+    return compile_path(path).resolve(variables)
        
 ## =========================================================
 ## =========================================================
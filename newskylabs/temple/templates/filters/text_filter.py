@@ -19,6 +19,26 @@
 A base filter class for generating html, latex, or other code from the
 temple xml-based text representation.
 
+The text is compiled in a single pass: it is fed to an XMLParser whose
+target compiles the start, data and end events and writes the output
+while they arrive - without building a tree of the input or of the
+output and without recursion.
+
+Subclasses define compile_<tag>() methods for the tags they render
+differently (hyphens in tags are replaced by underscores).  A
+compile_<tag>() method is called when the start tag has been parsed.
+It gets a shallow copy of the input element - with its tag and
+attributes - and returns the output element.  The text and tail of the
+input element are not known yet; they can only be passed on to the
+output element:
+
+  elem_out.text = elem_in.text
+  elem_out.tail = elem_in.tail
+
+add_child_elements() marks where the compiled child elements of the
+input element are written.  When it is not called, the child elements
+are dropped.
+
 """
 
 import xml.etree.ElementTree as ET
@@ -28,17 +48,240 @@ from xml.etree.ElementTree import Element
 ## Utilities
 ## ---------------------------------------------------------
 
+# Number of characters fed to the parser at once
+_FEED_SIZE = 64 * 1024
+
+# The dispatch tables of the filter classes:
+# the compile_<tag>() methods by tag
+_dispatch_tables = {}
+
 def _prefix(indent):
     return ' ' * indent * 2
 
+class _Placeholder():
+    """The text or tail of an input element
+    which is not known yet when its start tag is compiled.
+    """
+
+    def __init__(self, name):
+        self._name = name
+
+    def __repr__(self):
+        return '<{} of the input element>'.format(self._name)
+
+_TEXT = _Placeholder('text')
+_TAIL = _Placeholder('tail')
+
+class _ShallowElement():
+    """The shallow copy of an input element
+    passed to the compile_<tag>() methods.
+
+    While the element is compiled,
+    it keeps the state of its output element as well.
+    """
+
+    __slots__ = ['tag', 'attrib', 'children_at',
+                 'elem_out', 'print_tags', 'opened', 'preceding_written']
+
+    text = _TEXT
+    tail = _TAIL
+
+    def __init__(self, tag, attrib):
+        self.tag    = tag
+        self.attrib = attrib
+
+        # Where to write the compiled child elements
+        # - None when they are dropped
+        self.children_at = None
+
+        # The output element and whether to print its tags
+        self.elem_out   = None
+        self.print_tags = False
+
+        # Has the start tag been written?
+        self.opened = False
+
+        # Have the output child elements
+        # preceding the compiled child elements been written?
+        self.preceding_written = False
+
+    def get(self, key, default=None):
+        return self.attrib.get(key, default)
+
+    def keys(self):
+        return self.attrib.keys()
+
+    def items(self):
+        return self.attrib.items()
+
+## =========================================================
+## class _Compiler
+## ---------------------------------------------------------
+
+class _Compiler():
+    """The parser target compiling the parse events of a text filter
+    and writing the output with the printer of the filter.
+
+    The text is written while it is parsed - the text of an element
+    right after its start tag, its tail right after its end tag.
+    """
+
+    def __init__(self, text_filter, printer):
+        self._filter    = text_filter
+        self._table     = text_filter.get_dispatch_table()
+        self._text_tag  = text_filter._temple_text_tag
+        self._printer   = printer
+        self._write     = printer.write
+        self._start_tag = printer.start_tag_to_string
+
+        # The open input elements
+        self._stack = []
+
+        # The receiver of the parsed text:
+        # the element whose text is parsed,
+        # _TAIL when the tail of an element is parsed
+        # - or None when the text is dropped
+        self._receiver = None
+
+        # Depth in a subtree whose elements are dropped
+        self._skipping = 0
+
+    def data(self, data):
+        frame = self._receiver
+        if frame is None:
+            return
+
+        # Text following the start tag
+        if frame is not _TAIL and not frame.opened:
+            frame.opened = True
+            if frame.print_tags:
+                self._start_tag(frame.elem_out, False)
+
+        self._write(data)
+
+    def start(self, tag, attrib):
+        stack = self._stack
+        if stack:
+            parent = stack[-1]
+
+            # Drop the child elements
+            # when add_child_elements() has not been called
+            if self._skipping or parent.children_at is None:
+                self._skipping += 1
+                self._receiver = None
+                return
+
+            if not parent.preceding_written:
+                self._begin_children(parent)
+
+        # Compile the start tag
+        elem_in = _ShallowElement(tag, attrib)
+        try:
+            method = self._table[tag]
+        except KeyError:
+            method = self._filter._get_method(self._table, tag)
+        if method:
+            elem_out = method(self._filter, elem_in)
+        else:
+            elem_out = self._filter.compile_element(elem_in)
+
+        # The root tag is not printed
+        # - it has only been added to parse the text
+        frame = elem_in
+        frame.elem_out   = elem_out
+        frame.print_tags = bool(stack) and elem_out.tag != self._text_tag
+        stack.append(frame)
+
+        # The text of the element:
+        # the parsed text or a text set by the compile method
+        text = elem_out.text
+        if text is _TEXT:
+            self._receiver = frame
+        else:
+            self._receiver = None
+            if text:
+                self._open(frame)
+                self._write(text)
+
+    def end(self, tag):
+        if self._skipping:
+            self._skipping -= 1
+            self._receiver = None
+            return
+
+        frame = self._stack.pop()
+        if len(frame.elem_out) or not frame.opened:
+            self._end_element(frame)
+        elif frame.print_tags:
+            self._printer.end_tag_to_string(frame.elem_out, False)
+
+        # The tail of the element:
+        # the parsed tail or a tail set by the compile method
+        tail = frame.elem_out.tail
+        if tail is _TAIL:
+            self._receiver = _TAIL
+        else:
+            self._receiver = None
+            if tail:
+                self._write(tail)
+
+    def close(self):
+        pass
+
+    def _open(self, frame, is_empty=False):
+        """Write the start tag of an element - when not done yet.
+        """
+        if not frame.opened:
+            frame.opened = True
+            if frame.print_tags:
+                self._start_tag(frame.elem_out, is_empty)
+
+    def _begin_children(self, frame):
+        """Write the start tag of an element and its output child
+        elements preceding the compiled child elements.
+        """
+        self._open(frame)
+        frame.preceding_written = True
+        for child in frame.elem_out[:frame.children_at]:
+            self._printer.tree_to_string(child)
+
+    def _end_element(self, frame):
+        """Write the end tag of an element
+        - preceded by the output child elements not written yet.
+        """
+        elem_out = frame.elem_out
+
+        if len(elem_out):
+            if frame.preceding_written:
+                children = elem_out[frame.children_at:]
+            else:
+                children = list(elem_out)
+
+            if children:
+                self._open(frame)
+            for child in children:
+                self._printer.tree_to_string(child)
+
+        # The start tag has not been written yet
+        # when the element has neither text nor child elements
+        is_empty = not frame.opened
+        if is_empty:
+            self._open(frame, is_empty=True)
+
+        if frame.print_tags:
+            self._printer.end_tag_to_string(elem_out, is_empty)
+
 ## =========================================================
 ## class TextFilter
 ## ---------------------------------------------------------
-        
+
 class TextFilter():
     """
     """
 
+    # The printer class used to write the output elements
+    printer_class = None
+
     def __init__(self, text):
         """
         """
@@ -48,61 +291,75 @@ class TextFilter():
         self._root_start_tag = '<{}>'.format(self._root_tag)
         self._root_end_tag = '</{}>'.format(self._root_tag)
 
-        text = '{}{}{}'.format(self._root_start_tag, text, self._root_end_tag)
+        self._text = text
+        self._output = None
 
-        self._root_in = ET.fromstring(text)
-        self._root_out = None
-            
-    def compile(self):
-        elem_in = self._root_in
+        # The paths of the variables dereferenced while compiling
+        self._dereferenced_paths = []
 
-        # Compile
-        elem_out = self.compile_tree(elem_in)
+    def get_dereferenced_paths(self):
+        """Return the paths of the variables dereferenced
+        while compiling the text.
+        """
+        return self._dereferenced_paths
 
-        self._root_out = elem_out
+    @classmethod
+    def get_dispatch_table(cls):
+        """Return the dispatch table of the class:
+        a dictionary mapping tags to compile_<tag>() methods
+        - or None for the tags without a method.
 
-    def compile_tree(self, elem_in):
+        The table is built from the methods of the class
+        and filled with the tags found while compiling.
+        """
+        table = _dispatch_tables.get(cls)
+        if table is None:
+            table = _dispatch_tables[cls] = {
+                name[len('compile_'):]: getattr(cls, name)
+                for name in dir(cls) if name.startswith('compile_')
+            }
+        return table
 
-        # Is there a special method to deal with elements of the current type?
-        tag = elem_in.tag.replace('-', '_')
-        method_name = 'compile_{}'.format(tag)
-        if hasattr(self, method_name):
+    def compile(self):
+        """Compile the text.
+        """
+        printer = self.printer_class(None, text_tag=self._temple_text_tag)
+        parser  = ET.XMLParser(target=_Compiler(self, printer))
 
-            # There is a special method to deal with elements of the current type.
-            # Using it
-            #| print('DEBUG Method {}() is defined - using it for rendering...' \
-            #|       .format(method_name))
-            
-            method = getattr(self, method_name)
-            elem_out = method(elem_in)
-            
+        text = self._text if isinstance(self._text, str) else str(self._text)
+
+        # Feed the text wrapped into the root tags
+        # - long texts in chunks
+        if len(text) <= _FEED_SIZE:
+            parser.feed('{}{}{}'.format(self._root_start_tag, text, self._root_end_tag))
         else:
+            parser.feed(self._root_start_tag)
+            for start in range(0, len(text), _FEED_SIZE):
+                parser.feed(text[start:start + _FEED_SIZE])
+            parser.feed(self._root_end_tag)
+        parser.close()
+
+        self._output = printer.getvalue()
+
+    def _get_method(self, table, tag):
+        """Return the compile_<tag>() method of the given tag
+        - or None when there is none - and add it to the
+        dispatch table.
+        """
+        method = table[tag] = table.get(tag.replace('-', '_'))
+        return method
 
-            # There is no special method to deal with elements of the current type.
-            # Copy over the element
-            #| print('DEBUG Method {}() is NOT defined - using default rendering...' \
-            #|     .format(method_name))
-        
-            elem_out = Element(elem_in.tag, attrib=elem_in.attrib)
-
-            #| attribs = elem.attrib
-            #| for key, value in sorted(attribs.items()):
-            #|     print(' {}="{}"'.format(key, value), end='')
-
-            #| # Add leading text
-            #| self.add_leading_text(elem_in, elem_out)
-            #| 
-            #| # Add child elements
-            #| self.add_child_elements(elem_in, elem_out)
-            #| 
-            #| # Add trailing text
-            #| self.add_trailing_text(elem_in, elem_out)
-
-            # Add leading text, child elements, and trailing text 
-            self.add_temple_text_and_child_elements(elem_in, elem_out)
+    def compile_element(self, elem_in):
+        """Compile an element without compile_<tag>() method:
+        copy it over.
+        """
+        elem_out = Element(elem_in.tag, attrib=elem_in.attrib)
+
+        # Add leading text, child elements, and trailing text
+        self.add_temple_text_and_child_elements(elem_in, elem_out)
 
         return elem_out
-        
+
     def add_temple_text_and_child_elements(self, elem_in, elem_out):
 
         # Add leading text
@@ -121,26 +378,36 @@ class TextFilter():
 
     def add_child_elements(self, elem_in, elem_out):
 
-        # Add child elements
-        for child in elem_in:
-            child_elem = self.compile_tree(child)
-            elem_out.append(child_elem)
-            
+        # The child elements are compiled when they are parsed:
+        # Remember where to write them
+        elem_in.children_at = len(elem_out)
+
     def add_trailing_text(self, elem_in, elem_out):
 
         # Add trailing text
         elem_out.tail = elem_in.tail
 
+    def to_string(self):
+        """Return the compiled text.
+        """
+        return self._output
+
+    def print(self):
+        """Print the compiled text.
+        """
+        print(self.to_string(), end='')
+
     def dump(self):
         indent = 0
-        elem = self._root_in
+        elem = ET.fromstring('{}{}{}'.format(self._root_start_tag, self._text,
+                                             self._root_end_tag))
         self.dump_tree(indent, elem)
 
     def dump_tree(self, indent, elem):
         self.dump_elem(indent, elem)
         for child in elem:
             self.dump_tree(indent + 2, child)
-    
+
     def dump_elem(self, indent, elem):
         prefix = _prefix(indent)
         print('{}{}.tag: {}'.format(prefix, elem, elem.tag))
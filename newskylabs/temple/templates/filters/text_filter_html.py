@@ -34,24 +34,12 @@ class TextFilterHTML(TextFilter):
     """
     """
 
+    printer_class = HTMLPrinter
+
     def __init__(self, text, variables):
         super().__init__(text)
         self._variables = variables
 
-    def print(self):
-        """
-        """
-        root = self._root_out
-        printer = self.to_string()
-        printer.print()
-            
-    def to_string(self):
-        """
-        """
-        root = self._root_out
-        printer = HTMLPrinter(root, text_tag=self._temple_text_tag)
-        return printer.to_string()
-            
     def compile_sc(self, elem_in):
 
         # The small cups tags <sc>text</sc>
@@ -79,6 +67,10 @@ class TextFilterHTML(TextFilter):
         path = elem_in.get('var')
         value = get_path_value(variables, path)
 
+        # Remember the path:
+        # the filter result depends on its value
+        self._dereferenced_paths.append(path)
+
         # Add leading text
         elem_out.text = value
 
@@ -34,24 +34,12 @@ class TextFilterLaTeX(TextFilter):
     """
     """
 
+    printer_class = LaTeXPrinter
+
     def __init__(self, text, variables):
         super().__init__(text)
         self._variables = variables
 
-    def print(self):
-        """
-        """
-        root = self._root_out
-        printer = self.to_string()
-        printer.print()
-            
-    def to_string(self):
-        """
-        """
-        root = self._root_out
-        printer = LaTeXPrinter(root, text_tag=self._temple_text_tag)
-        return printer.to_string()
-            
     def compile_i(self, elem_in):
 
         # The small cups tags <i>text</i>
@@ -156,6 +144,10 @@ class TextFilterLaTeX(TextFilter):
         path = elem_in.get('var')
         value = get_path_value(variables, path)
 
+        # Remember the path:
+        # the filter result depends on its value
+        self._dereferenced_paths.append(path)
+
         # Add leading text
         elem_out.text = value
 
@@ -21,19 +21,372 @@ Jinja utilities for generating files from templates using jinja2.
 """
 
 import os, sys
-from jinja2 import Template, Environment, FileSystemLoader
+import time
+import posixpath
+import importlib
 
-from newskylabs.temple.templates.filters.markdown import markdown_filter
-from newskylabs.temple.templates.filters.latex    import latex_filter
-from newskylabs.temple.templates.filters.html     import html_filter
-from newskylabs.temple.templates.filters.html_paragraphs import html_paragraph_filter
+from hashlib import sha1
+from pprint import pformat
+from jinja2 import Template, Environment, FileSystemLoader, ModuleLoader
+from jinja2.utils import LRUCache
+
+from newskylabs.temple.templates.events import ConsoleObserver, FileRendered, DebugMessage, \
+    flush_observer
+from newskylabs.temple.utils import profiling
+from newskylabs.temple.utils.views import copy_on_write, to_plain, json_default
 
 ## =========================================================
-## jinja tools
+## Environment settings
+## ---------------------------------------------------------
+
+# Jinja2 extensions
+JINJA_EXTENSIONS = [
+    # Expression Statement Extension
+    # http://jinja.pocoo.org/docs/2.10/extensions/#expression-statement
+    # 
+    # The “do” aka expression-statement extension adds a
+    # simple do tag to the template engine that works like a
+    # variable expression but ignores the return value.
+    # 
+    # Example: 
+    # 
+    #   {% do navigation.append('a string') %}
+    # 
+    'jinja2.ext.do',
+]
+
+# Delimiter profiles
+# 
+# Each profile defines the delimiters used by the templates
+# rendered with the corresponding jinja2 environment.
+DELIMITER_PROFILES = {
+
+    # In all other cases 
+    # use the default jinja2 delimiters:
+    # 
+    #   {% ... %} for Statements
+    #   {{ ... }} for Expressions to print to the template output
+    #   {# ... #} for Comments not included in the template output
+    # 
+    'default': {},
+
+    # When rendering LaTeX files
+    # use the following delimiters:
+    # 
+    #   <% ... %> for Statements
+    #   << ... >> for Expressions to print to the template output
+    #   <# ... #> for Comments not included in the template output
+    #
+    'latex': {
+        'block_start_string':    '<%', 'block_end_string':    '%>',
+        'variable_start_string': '<<', 'variable_end_string': '>>',
+        'comment_start_string':  '<#', 'comment_end_string':  '#>',
+    },
+}
+
+# The profile used for files 
+# with an extension not mapped to any other profile
+DEFAULT_PROFILE = 'default'
+
+# Default mapping of file extensions (without the leading '.')
+# to delimiter profiles.
+# Can be extended or overwritten with the 'delimiter-profiles' 
+# entry of the project type settings.
+DEFAULT_EXTENSION_PROFILES = {
+    'tex': 'latex',
+}
+
+# Number of compiled templates kept by each environment
+TEMPLATE_CACHE_SIZE = 10000
+
+# Number of compiled template strings - like path names -
+# kept by each environment
+STRING_CACHE_SIZE = 4096
+
+# The temple filters:
+# the modules defining them and the names of the filter functions.
+# A filter module is only imported 
+# when a template using the filter is compiled or loaded.
+TEMPLE_FILTERS = {
+    'markdown':        ('newskylabs.temple.templates.filters.markdown', 'markdown_filter'),
+    'latex':           ('newskylabs.temple.templates.filters.latex', 'latex_filter'),
+    'html':            ('newskylabs.temple.templates.filters.html', 'html_filter'),
+    'html_paragraphs': ('newskylabs.temple.templates.filters.html_paragraphs',
+                        'html_paragraph_filter'),
+}
+
+## =========================================================
+## Rendering settings
 ## ---------------------------------------------------------
 
-def read_template(template_path, variables):
+# Rendered output up to this number of characters is kept in memory
+# and written at once; larger output is streamed to the file
+STREAM_THRESHOLD = 1024 * 1024
+
+# Size of the write buffer used when streaming the output
+STREAM_BUFFER_SIZE = 64 * 1024
+
+## =========================================================
+## class TempleEnvironment
+## ---------------------------------------------------------
+
+class TempleEnvironment(Environment):
+    """A jinja2 environment loading all templates of a template tree.
+
+    Template names are paths relative to the template base directory.
+    Includes, imports and extends are resolved relative to the
+    directory of the including template - as with the former loaders
+    rooted in the directory of each template file.
     """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        # The compiled template strings - see from_string_cached()
+        self._string_templates = LRUCache(STRING_CACHE_SIZE)
+
+    def join_path(self, template, parent):
+        """Resolve 'template' relative to the directory of 'parent'."""
+        return posixpath.join(posixpath.dirname(parent), template)
+
+    def from_string_cached(self, source):
+        """Return the template of a template string - like a path name
+        containing jinja delimiters.
+
+        The templates are kept in an LRU cache of STRING_CACHE_SIZE
+        entries - so each path is compiled only once by an environment
+        and reused by the updates of watch mode and the requests
+        of the server.
+        """
+        template = self._string_templates.get(source)
+        if template is None:
+            template = self._string_templates[source] = self.from_string(source)
+
+        return template
+
+    def compile(self, source, name=None, filename=None, raw=False, defer_init=False):
+        """Compile a template - recorded as profiling phase.
+
+        The template strings compiled by from_string() - like the
+        path names containing jinja delimiters - have no name and are
+        recorded as phase 'compile-string'.
+        """
+        with profiling.phase('compile' if name is not None else 'compile-string', name):
+            return super().compile(source, name=name, filename=filename, raw=raw,
+                                   defer_init=defer_init)
+
+## =========================================================
+## class LazyFilters
+## ---------------------------------------------------------
+
+class LazyFilters(dict):
+    """The filters of an environment
+    importing the modules of the temple filters on first use.
+
+    jinja2 looks up the filters when compiling a template and when
+    loading a compiled template - so the filter functions, with their
+    jinja2 decorators, are available as usual.
+    """
+
+    def __init__(self, filters, lazy_filters):
+        super().__init__(filters)
+
+        # The filters which have not been imported yet
+        self._lazy_filters = dict(lazy_filters)
+
+    def _load(self, name):
+        """Import the filter of the given name.
+        """
+        module_name, function_name = self._lazy_filters.pop(name)
+        function = getattr(importlib.import_module(module_name), function_name)
+
+        # When profiling, record the calls of the filter
+        function = profiling.profiled('filters', name, function)
+
+        self[name] = function
+        return function
+
+    def __missing__(self, name):
+        if name in self._lazy_filters:
+            return self._load(name)
+        raise KeyError(name)
+
+    def get(self, name, default=None):
+        if name in self._lazy_filters:
+            return self._load(name)
+        return super().get(name, default)
+
+    def __contains__(self, name):
+        return super().__contains__(name) or name in self._lazy_filters
+
+    def copy(self):
+        return LazyFilters(self, self._lazy_filters)
+
+def pprint_filter(value):
+    """Pretty print a value - like the jinja2 'pprint' filter,
+    with the views of the variables printed like the dictionaries
+    and lists they stand for.
+    """
+    return pformat(to_plain(value))
+
+## =========================================================
+## class EnvironmentRegistry
+## ---------------------------------------------------------
+
+class EnvironmentRegistry():
+    """A registry of jinja2 environments - one per delimiter profile.
+
+    The environments are created on demand and shared by all the
+    files of a template tree during a generation run.  This way the
+    compiled templates are cached and reused instead of being thrown
+    away after rendering each single file.
+    """
+
+    def __init__(self, template_base_path,
+                 extension_profiles=None,
+                 auto_reload=False,
+                 cache_size=TEMPLATE_CACHE_SIZE,
+                 bytecode_cache=None,
+                 module_path=None,
+                 filter_cache=None):
+        """When 'module_path' is given, the templates are loaded from
+        the precompiled template modules found there (a directory or a
+        directory in a zip file) instead of being compiled from source.
+
+        'filter_cache' is an optional FilterCache used by the html,
+        latex and markdown filters.
+        """
+        self._template_base_path = str(template_base_path)
+        self._module_path        = module_path
+        self._loader             = None
+        self._auto_reload        = auto_reload
+        self._cache_size         = cache_size
+        self._bytecode_cache     = bytecode_cache
+        self._filter_cache       = filter_cache
+        self._environments       = {}
+
+        # Mapping of file extensions to delimiter profiles:
+        # The default mapping overwritten by the given one
+        profiles = dict(DEFAULT_EXTENSION_PROFILES)
+        if extension_profiles:
+            for extension, profile in extension_profiles.items():
+                profiles[extension.lstrip('.').lower()] = profile
+        
+        # Ensure that all profiles are defined
+        for extension, profile in profiles.items():
+            if profile not in DELIMITER_PROFILES:
+                raise ValueError("Undefined delimiter profile '{}' for extension '{}'!" \
+                                 .format(profile, extension))
+
+        self._extension_profiles = profiles
+
+    def __getstate__(self):
+        """The environments are not pickled 
+        but recreated on demand - e.g. in worker processes.
+        """
+        state = self.__dict__.copy()
+        state['_environments'] = {}
+        state['_loader']       = None
+        return state
+
+    def profile_for(self, template_path):
+        """Return the name of the delimiter profile 
+        used to render the given template file.
+        """
+        file_extension = os.path.splitext(template_path)[1][1:].lower()
+        return self._extension_profiles.get(file_extension, DEFAULT_PROFILE)
+
+    def get_environment(self, profile=DEFAULT_PROFILE):
+        """Return the environment of the given delimiter profile.
+        """
+        env = self._environments.get(profile)
+        if env is None:
+            with profiling.phase('environment', profile):
+                env = self._create_environment(profile)
+            self._environments[profile] = env
+
+        return env
+
+    def _get_loader(self):
+        """Return the loader shared by all environments.
+        """
+        if self._loader is None:
+            if self._module_path:
+                self._loader = ModuleLoader(self._module_path)
+            else:
+                self._loader = FileSystemLoader(self._template_base_path)
+
+        return self._loader
+
+    def _create_environment(self, profile):
+        """
+        """
+        env = TempleEnvironment(
+            loader                = self._get_loader(),
+            keep_trailing_newline = True, # Keep newline at end of template
+            trim_blocks           = True, # Remove first newline after block
+            auto_reload           = self._auto_reload,
+            cache_size            = self._cache_size,
+            bytecode_cache        = self._bytecode_cache,
+            extensions            = JINJA_EXTENSIONS,
+            **DELIMITER_PROFILES[profile]
+        )
+
+        # Add data required by templs
+        env.temple = {
+            'profile':      profile,
+            'filter_cache': self._filter_cache,
+        }
+
+        # Add filters
+        # - imported when first used
+        env.filters = LazyFilters(env.filters, TEMPLE_FILTERS)
+
+        # The variables are views - see utils/views.py -
+        # which are printed and serialized like the dictionaries and lists
+        # they stand for
+        env.filters['pprint'] = pprint_filter
+        env.policies['json.dumps_kwargs'] = {'sort_keys': True, 'default': json_default}
+
+        return env
+
+    def get_bytecode_cache(self):
+        return self._bytecode_cache
+
+    def get_filter_cache(self):
+        return self._filter_cache
+
+    def template_name(self, template_path):
+        """Return the name of a template file 
+        relative to the template base directory.
+        """
+        rel_path = os.path.relpath(template_path, self._template_base_path)
+        return rel_path.replace(os.sep, '/')
+
+    def get_template(self, template_path):
+        """Return the compiled template of the given template file.
+        """
+        env = self.get_environment(self.profile_for(template_path))
+        return env.get_template(self.template_name(template_path))
+
+## =========================================================
+## jinja tools
+## ---------------------------------------------------------
+
+def template_variables(template_path, variables, index=None):
+    """Return the variables used to render the given template file:
+    The given variables extended with the 'temple' variables 
+    describing the template file.
+
+    The flat index of the variables - see FlatIndex - is passed as
+    'temple.index' when given.  It is shared by all templates: its
+    values are read-only and do not reflect the modifications of the
+    template.
+
+    The variables are a copy-on-write view of the given variables -
+    see utils/views.py: the modifications of a template, for example
+    with the 'do' statement, are not seen by the templates rendered
+    later or concurrently.
     """
 
     # Get filename and extension
@@ -43,7 +396,23 @@ def read_template(template_path, variables):
     # Ex: '.html' -> 'html'
     if len(file_extension) > 0 and file_extension[0] == '.':
         file_extension = file_extension[1:] 
-    
+
+    # Add the file extension to the variables
+    template_variables = copy_on_write(variables)
+    template_variables['temple'] = {
+        'template': {
+            'file_extension': file_extension,
+        },
+    }
+    if index is not None:
+        template_variables['temple']['index'] = index
+
+    return template_variables
+
+def read_template(template_path, registry=None):
+    """
+    """
+
     # Simplest version to generate a file from a template:
     # 
     #| with open(template_path) as fh: # Use file to refer to the file object
@@ -52,86 +421,14 @@ def read_template(template_path, variables):
     #| template = Template(template_str)
     # 
     # However, here I am generating the template from a Jinja2 Environment
-    # as this allows for more customization:
-
-    # Jinja2 extensions
-    jinja_extensions = [
-        # Expression Statement Extension
-        # http://jinja.pocoo.org/docs/2.10/extensions/#expression-statement
-        # 
-        # The “do” aka expression-statement extension adds a
-        # simple do tag to the template engine that works like a
-        # variable expression but ignores the return value.
-        # 
-        # Example: 
-        # 
-        #   {% do navigation.append('a string') %}
-        # 
-        'jinja2.ext.do',
-    ]
-    
-    # Am I rendering a LaTeX file?
-    #| if template_path[-4:].lower() == '.tex' or \
-    #|    template_path[-4:].lower() == '.sty':
-    if template_path[-4:].lower() == '.tex':
-
-        # LaTeX files
-        language = 'latex'
-
-        # When rendering LaTeX files
-        # use the following delimiters:
-        # 
-        #   <% ... %> for Statements
-        #   << ... >> for Expressions to print to the template output
-        #   <# ... #> for Comments not included in the template output
-        #
-        env = Environment(
-            loader                = FileSystemLoader(os.path.dirname(template_path)), 
-            block_start_string    = '<%', block_end_string    = '%>',
-            variable_start_string = '<<', variable_end_string = '>>',
-            comment_start_string  = '<#', comment_end_string  = '#>',
-            keep_trailing_newline = True, # Keep newline at end of template
-            trim_blocks           = True, # Remove first newline after block
-            extensions            = jinja_extensions,
-        )
-
-    else:
-        # 
-        # Not a LaTeX files
-        # 
-        # In all other cases 
-        # use the default jinja2 delimiters:
-        # 
-        #   {% ... %} for Statements
-        #   {{ ... }} for Expressions to print to the template output
-        #   {# ... #} for Comments not included in the template output
-        # 
-        env = Environment(
-            loader                = FileSystemLoader(os.path.dirname(template_path)), 
-            keep_trailing_newline = True, # Keep newline at end of template
-            trim_blocks           = True, # Remove first newline after block
-            extensions            = jinja_extensions,
-        )
-
-    # Add the file extension to the variables
-    variables['temple'] = {
-        'template': {
-            'file_extension': file_extension,
-        },
-    }
-
-    # Add data required by templs
-    env.temple = {
-        'variables': variables,
-    }
+    # as this allows for more customization.
+    # 
+    # When no registry is given
+    # use a registry for the directory of the template file only
+    if registry is None:
+        registry = EnvironmentRegistry(os.path.dirname(template_path))
 
-    # Add filters
-    env.filters['markdown']        = markdown_filter
-    env.filters['latex']           = latex_filter
-    env.filters['html']            = html_filter
-    env.filters['html_paragraphs'] = html_paragraph_filter
-    
-    template = env.get_template(os.path.basename(template_path))
+    template = registry.get_template(template_path)
 
     return template
 
@@ -141,24 +438,120 @@ def save_file(file_path, content):
     with open(file_path, "w") as fh:
         fh.write(content)
 
-def jinja(filename, template, variables):
+def stream_file(fh, chunks, head=None, buffer_size=STREAM_BUFFER_SIZE):
+    """Write the given string chunks to the text file object 'fh'
+    - without joining them into a single string.
+
+    The chunks are collected into blocks of about 'buffer_size'
+    characters which are hashed and written at once.
+    'head' is an optional list of chunks to write first.
+
+    Return the sha1 digest of the utf-8 encoded content
+    and its size in bytes.
     """
+    digest = sha1()
+    size = 0
+
+    def flush(block):
+        nonlocal size
+        with profiling.phase('write'):
+            data = ''.join(block)
+            encoded = data.encode('utf-8')
+            digest.update(encoded)
+            size += len(encoded)
+            fh.write(data)
+
+    block = list(head or [])
+    length = sum(len(chunk) for chunk in block)
+    for chunk in chunks:
+        block.append(chunk)
+        length += len(chunk)
+        if length >= buffer_size:
+            flush(block)
+            block = []
+            length = 0
+    flush(block)
+
+    return digest, size
+
+def open_text_file(file_path, buffer_size=-1):
+    """Open a file for writing text with the given buffer size.
+    """
+    return open(file_path, "w", buffering=buffer_size)
+
+def jinja(filename, template, variables, registry=None,
+          stream_threshold=STREAM_THRESHOLD, buffer_size=STREAM_BUFFER_SIZE,
+          open_file=open_text_file, index=None):
+    """Render the given template to the file 'filename'
+    - see render_file().
+
+    Return the sha1 hex digest of the utf-8 encoded output.
     """
+    return render_file(filename, template, variables, registry=registry,
+                       stream_threshold=stream_threshold, buffer_size=buffer_size,
+                       open_file=open_file, index=index)[0]
 
-    templateobj = read_template(template, variables)
+def render_file(filename, template, variables, registry=None,
+                stream_threshold=STREAM_THRESHOLD, buffer_size=STREAM_BUFFER_SIZE,
+                open_file=open_text_file, index=None):
+    """Render the given template to the file 'filename'.
 
-    rendered_template = templateobj.render(**variables)
+    The output is generated chunk by chunk: as long as it does not
+    exceed 'stream_threshold' characters, it is collected and written
+    at once; larger output is streamed to the file through a write
+    buffer of 'buffer_size' bytes - so huge files never have to be
+    kept in memory as a whole.
+
+    The file is opened with 'open_file(filename, buffer_size)' which
+    has to return a text file object - see the output sinks.
+
+    'index' is the optional flat index of the variables.
+
+    Return the sha1 hex digest of the utf-8 encoded output
+    and its size in bytes.
+    """
+
+    with profiling.phase('load'):
+        templateobj = read_template(template, registry=registry)
+
+    with profiling.phase('render'):
+        chunks = templateobj.generate(**template_variables(template, variables, index=index))
+
+        # Collect the output of small files
+        head = []
+        length = 0
+        for chunk in chunks:
+            head.append(chunk)
+            length += len(chunk)
+            if length > stream_threshold:
+
+                # Stream large files
+                # - the blocks written are recorded as 'write' phases
+                with open_file(filename, buffer_size) as fh:
+                    digest, size = stream_file(fh, chunks, head=head, buffer_size=buffer_size)
+                    return digest.hexdigest(), size
+
+        rendered_template = ''.join(head)
 
     # DEBUG
     #| print('DEBUG rendered_template:', rendered_template)
 
-    save_file(filename, rendered_template)
+    with profiling.phase('write'):
+        with open_file(filename, buffer_size) as fh:
+            fh.write(rendered_template)
 
-def jinja_str(template_str, variables):
+        encoded = rendered_template.encode('utf-8')
+        return sha1(encoded).hexdigest(), len(encoded)
+
+def jinja_str(template_str, variables, registry=None):
     """Render a template string with Jinja2 using the given variables.
     """
-    template = Template(template_str)
-    rendered_str = template.render(**variables)
+    if registry is None:
+        template = Template(template_str)
+    else:
+        template = registry.get_environment().from_string_cached(template_str)
+
+    rendered_str = template.render(**copy_on_write(variables))
 
     return rendered_str
 
@@ -167,23 +560,30 @@ def jinja_str(template_str, variables):
 ## ---------------------------------------------------------
 
 def generate_file_from_template(filename, template, variables, 
-                                verbose=False, debug=False):
-    """
+                                verbose=False, debug=False, registry=None, observer=None):
+    """Render the given template to the file 'filename'
+    and report it to the given observer - see events.py.
+
+    By default the file is printed by a ConsoleObserver
+    when 'verbose' is True.
     """
-    
+    if observer is None:
+        observer = ConsoleObserver(verbose=verbose)
+
     # DEBUG
+    # - only the names of the variables are reported
     if debug:
-        print('DEBUG generate_file_from_template():\n'
-              '  - filename:  {}\n'.format(filename) +
-              '  - template:  {}\n'.format(template) +
-              '  - variables: {}\n'.format(variables))
-                
-    # INFO
-    if verbose:
-        print('jinja {}'.format(filename))
-                
+        observer(DebugMessage('DEBUG generate_file_from_template():\n'
+                              '  - filename:  {}\n'.format(filename) +
+                              '  - template:  {}\n'.format(template) +
+                              '  - variables: {}\n'.format(', '.join(sorted(variables)))))
+
     # Generate the file from the template
-    jinja(filename, template, variables)
+    start = time.perf_counter()
+    output_hash, size = render_file(filename, template, variables, registry=registry)
+
+    observer(FileRendered(filename, template, size, time.perf_counter() - start))
+    flush_observer(observer)
 
 ## =========================================================
 ## =========================================================
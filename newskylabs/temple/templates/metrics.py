@@ -0,0 +1,234 @@
+## =========================================================
+## Copyright 2019 Dietrich Bollmann
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##      http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+## ---------------------------------------------------------
+
+"""newskylabs/temple/templates/metrics.py:
+
+Statistics of a generation written as Prometheus textfile - see
+'temple generate --metrics-file'.
+
+A MetricsObserver counts the rendered, copied and skipped files, the
+bytes written and the render latency of the files from the generation
+events - see events.py.  The number of template compilations and the
+latency of the filter calls are taken from a Profiler created with
+get_latencies() - so they include the calls of the worker processes:
+
+  profiler = Profiler(latencies=get_latencies())
+  metrics = MetricsObserver(profiler)
+  engine.generate(profiler=profiler, observer=metrics)
+  metrics.save('temple.prom')
+
+The file is written in the Prometheus text exposition format read
+by the textfile collector of the node exporter.  As the file is
+replaced by each run, the numbers of files etc. are exported as
+gauges with the values of the last run - and the histograms restart
+with each run.
+
+"""
+
+import os
+import bisect
+
+from newskylabs.temple.templates.events import Observer
+
+## =========================================================
+## Metrics settings
+## ---------------------------------------------------------
+
+# The prefix of the metric names
+METRICS_PREFIX = 'temple_'
+
+# Upper bounds of the buckets of the render latency of a file in seconds
+RENDER_LATENCY_BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                          1.0, 2.5, 5.0, 10.0]
+
+# Upper bounds of the buckets of the latency of a filter call in seconds
+FILTER_LATENCY_BUCKETS = [0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+                          0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0]
+
+## =========================================================
+## Utilities
+## ---------------------------------------------------------
+
+def get_latencies():
+    """Return the 'latencies' of the Profiler collecting the
+    latencies of the filter calls - see utils/profiling.py.
+    """
+    return {'filters': FILTER_LATENCY_BUCKETS}
+
+def _format_value(value):
+    """Format a sample value.
+    """
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+def _format_labels(labels):
+    """Format the labels of a sample - escaping the label values.
+    """
+    if not labels:
+        return ''
+    return '{' + ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"')
+                         .replace('\n', '\\n'))
+        for name, value in labels) + '}'
+
+## =========================================================
+## class MetricsObserver
+## ---------------------------------------------------------
+
+class MetricsObserver(Observer):
+    """Count the generated files and their render latency
+    and write them - with the compile counts and filter latencies
+    recorded by the given Profiler - as Prometheus textfile.
+    """
+
+    def __init__(self, profiler=None):
+        self._profiler = profiler
+
+        self._files = {'rendered': 0, 'copied': 0, 'skipped': 0}
+        self._bytes = {'rendered': 0, 'copied': 0}
+
+        # The render latency histogram:
+        # [bucket counts..., +Inf count, sum in seconds]
+        self._render_latency = [0] * (len(RENDER_LATENCY_BUCKETS) + 2)
+
+        self._finished = None
+
+    ## -----------------------------------------------------
+    ## Events
+    ## -----------------------------------------------------
+
+    def on_tasks_planned(self, event):
+        self._files['skipped'] += event.skipped
+
+    def on_file_rendered(self, event):
+        self._files['rendered'] += 1
+        self._bytes['rendered'] += event.bytes
+
+        histogram = self._render_latency
+        histogram[bisect.bisect_left(RENDER_LATENCY_BUCKETS, event.duration)] += 1
+        histogram[-1] += event.duration
+
+    def on_file_copied(self, event):
+        self._files['copied'] += 1
+        self._bytes['copied'] += event.bytes
+
+    def on_generation_finished(self, event):
+        self._finished = event
+
+    ## -----------------------------------------------------
+    ## Exposition
+    ## -----------------------------------------------------
+
+    def _metric(self, lines, name, type, help, samples):
+        """Add the lines of a metric with the given
+        (suffix, labels, value) samples.
+        """
+        name = METRICS_PREFIX + name
+        lines.append('# HELP {} {}'.format(name, help))
+        lines.append('# TYPE {} {}'.format(name, type))
+        for suffix, labels, value in samples:
+            lines.append('{}{}{} {}'.format(name, suffix, _format_labels(labels),
+                                            _format_value(value)))
+
+    def _histogram(self, buckets, histogram, labels=()):
+        """Return the samples of a histogram.
+        """
+        counts, total = histogram[:-1], histogram[-1]
+        labels = list(labels)
+
+        samples = []
+        count = 0
+        for bound, bucket_count in zip(buckets + [float('inf')], counts):
+            count += bucket_count
+            le = '+Inf' if bound == float('inf') else repr(float(bound))
+            samples.append(('_bucket', labels + [('le', le)], count))
+        samples.append(('_sum', labels, float(total)))
+        samples.append(('_count', labels, count))
+        return samples
+
+    def format(self):
+        """Return the metrics in the Prometheus text exposition format.
+        """
+        lines = []
+
+        # The files and bytes
+        self._metric(lines, 'files', 'gauge',
+                     'Files rendered, copied and skipped by the last run.',
+                     [('', [('action', action)], count)
+                      for action, count in sorted(self._files.items())])
+        self._metric(lines, 'written_bytes', 'gauge',
+                     'Bytes written by rendering and copying files in the last run.',
+                     [('', [('action', action)], count)
+                      for action, count in sorted(self._bytes.items())])
+
+        # The render latency
+        self._metric(lines, 'file_render_duration_seconds', 'histogram',
+                     'Seconds needed to render and write a file - '
+                     'of the last run.',
+                     self._histogram(RENDER_LATENCY_BUCKETS, self._render_latency))
+
+        # The compilations and the filter latency
+        profiler = self._profiler
+        if profiler:
+            self._metric(lines, 'template_compiles', 'gauge',
+                         'Templates compiled by the last run instead of being loaded from '
+                         'the bytecode cache (kind "file") and template strings like path '
+                         'names compiled (kind "string").',
+                         [('', [('kind', 'file')], profiler.get_calls('compile')),
+                          ('', [('kind', 'string')], profiler.get_calls('compile-string'))])
+
+            samples = []
+            for name, (counts, total) in sorted(profiler.get_histograms('filters').items()):
+                samples.extend(self._histogram(FILTER_LATENCY_BUCKETS, counts + [total],
+                                               [('filter', name)]))
+            self._metric(lines, 'filter_call_duration_seconds', 'histogram',
+                         'Seconds needed by a filter call - of the last run.', samples)
+
+        # The generation
+        finished = self._finished
+        if finished:
+            if finished.filter_cache_hits is not None:
+                self._metric(lines, 'filter_cache_requests', 'gauge',
+                             'Hits and misses of the filter cache in the last run.',
+                             [('', [('result', 'hit')], finished.filter_cache_hits),
+                              ('', [('result', 'miss')], finished.filter_cache_misses)])
+
+            self._metric(lines, 'generation_duration_seconds', 'gauge',
+                         'Seconds needed to render and copy the files.',
+                         [('', [], float(finished.duration))])
+            self._metric(lines, 'generation_timestamp_seconds', 'gauge',
+                         'Time the generation finished - in seconds since the epoch.',
+                         [('', [], float(finished.time))])
+
+        return '\n'.join(lines) + '\n'
+
+    def save(self, metrics_file):
+        """Write the metrics to the given file.
+
+        The file is replaced atomically - so a collector never reads
+        a partially written file.
+        """
+        metrics_file = str(metrics_file)
+        temporary_file = '{}.{}.tmp'.format(metrics_file, os.getpid())
+        with open(temporary_file, 'w') as fh:
+            fh.write(self.format())
+        os.replace(temporary_file, metrics_file)
+
+## =========================================================
+## =========================================================
+
+## fin.
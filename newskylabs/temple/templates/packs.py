@@ -0,0 +1,241 @@
+## =========================================================
+## Copyright 2019 Dietrich Bollmann
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##      http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+## ---------------------------------------------------------
+
+"""newskylabs/temple/templates/packs.py:
+
+Template packs: template trees compiled ahead of time.
+
+A template pack is a zip file containing
+
+  - temple-pack.json: the manifest of the pack - the directories of
+    the template tree and the copy / render / skip decisions, the
+    sizes and the jinja delimiter flags of its files,
+
+  - templates/: the compiled Python modules of the rendered templates
+    and of the skipped '.jinja' templates they include, import or
+    extend - loaded with a jinja2 ModuleLoader,
+
+  - assets/: the files which are copied.
+
+A pack can be used everywhere a template directory can be used - for
+example as 'template-dir' of a project type.
+
+"""
+
+import os
+import json
+import shutil
+import zipfile
+
+from jinja2 import ModuleLoader
+
+from newskylabs.temple.templates.jinja import EnvironmentRegistry
+from newskylabs.temple.templates.tree import TemplateDirectory, \
+    ACTION_COPY, ACTION_RENDER, ACTION_SKIP
+
+## =========================================================
+## Pack layout
+## ---------------------------------------------------------
+
+# Version of the pack format
+PACK_FORMAT_VERSION = 1
+
+# Name of the manifest
+PACK_MANIFEST = 'temple-pack.json'
+
+# Directories of the compiled templates and of the copied files
+PACK_TEMPLATES_DIR = 'templates'
+PACK_ASSETS_DIR    = 'assets'
+
+def is_template_pack(path):
+    """Is the given path a template pack?
+    """
+    if not os.path.isfile(path) or not zipfile.is_zipfile(path):
+        return False
+
+    with zipfile.ZipFile(path) as pack:
+        return PACK_MANIFEST in pack.namelist()
+
+## =========================================================
+## compile_pack()
+## ---------------------------------------------------------
+
+def compile_pack(template_dir, pack_file, extension_profiles=None, verbose=True):
+    """Compile the templates of the given template directory
+    and write them together with the files to be copied
+    into the template pack 'pack_file'.
+    """
+    tree = TemplateDirectory(template_dir)
+    registry = tree.create_registry(extension_profiles=extension_profiles)
+
+    directories, files = tree.walk()
+
+    with zipfile.ZipFile(pack_file, 'w', compression=zipfile.ZIP_DEFLATED) as pack:
+
+        for action, path, size, templated in files:
+
+            template_file = tree.template_file(path)
+
+            # The skipped '.jinja' templates are not rendered themselves
+            # but can be included, imported or extended by other templates
+            # - so they are compiled as well
+            if action in (ACTION_RENDER, ACTION_SKIP):
+
+                # INFO
+                if verbose:
+                    print('compile {}'.format(path))
+
+                # Compile the template
+                # with the environment of its delimiter profile
+                env = registry.get_environment(registry.profile_for(template_file))
+                source, filename, uptodate = env.loader.get_source(env, path)
+                code = env.compile(source, path, filename, raw=True, defer_init=True)
+
+                module_file = '{}/{}'.format(PACK_TEMPLATES_DIR,
+                                             ModuleLoader.get_module_filename(path))
+                pack.writestr(module_file, code)
+
+            elif action == ACTION_COPY:
+
+                # INFO
+                if verbose:
+                    print('add     {}'.format(path))
+
+                pack.write(template_file, '{}/{}'.format(PACK_ASSETS_DIR, path))
+
+        # Write the manifest
+        manifest = {
+            'version':     PACK_FORMAT_VERSION,
+            'directories': directories,
+            'files':       [list(entry) for entry in files],
+        }
+        pack.writestr(PACK_MANIFEST, json.dumps(manifest, indent=2))
+
+## =========================================================
+## class TemplatePack
+## ---------------------------------------------------------
+
+class TemplatePack():
+    """A template tree compiled ahead of time into a zip file.
+
+    Provides the same interface as TemplateDirectory.
+    """
+
+    def __init__(self, pack_file):
+        """
+        """
+        self._base_path = str(pack_file)
+
+        with zipfile.ZipFile(self._base_path) as pack:
+            manifest = json.loads(pack.read(PACK_MANIFEST).decode('utf-8'))
+
+        if manifest.get('version') != PACK_FORMAT_VERSION:
+            raise ValueError("Unsupported version of the template pack '{}': {}" \
+                             .format(pack_file, manifest.get('version')))
+
+        self._directories = manifest['directories']
+        self._files       = [tuple(entry) for entry in manifest['files']]
+
+    def get_base_path(self):
+        return self._base_path
+
+    def walk(self):
+        """Return the list of the directories
+        and the list of (action, path, size, templated) tuples 
+        of the files as recorded in the manifest of the pack.
+        """
+        return list(self._directories), list(self._files)
+
+    def template_file(self, path):
+        """Return the (virtual) path of the template file
+        with the given relative path.
+        """
+        return os.path.join(self._base_path, *path.split('/'))
+
+    def source_stamp(self, path):
+        """Return a stamp of the file with the given relative
+        path which changes when the file is modified.
+        """
+        with zipfile.ZipFile(self._base_path) as pack:
+            info = pack.getinfo('{}/{}'.format(PACK_ASSETS_DIR, path))
+            return [info.file_size, info.CRC]
+
+    def file_size(self, path):
+        """Return the size of the file with the given relative path.
+        """
+        with zipfile.ZipFile(self._base_path) as pack:
+            return pack.getinfo('{}/{}'.format(PACK_ASSETS_DIR, path)).file_size
+
+    def open_file(self, path):
+        """Open the file with the given relative path for reading
+        and return a binary file object.
+        """
+        pack = zipfile.ZipFile(self._base_path)
+        try:
+            return pack.open('{}/{}'.format(PACK_ASSETS_DIR, path))
+        finally:
+            # The opened member keeps the pack file open
+            # until it is closed itself
+            pack.close()
+
+    def copy_file(self, path, target_file, mode=None):
+        """Extract the file with the given relative path
+        to the given target file.
+
+        The files of a pack are always extracted
+        - the copy mode is ignored.
+
+        Return the tuple (bytes_copied, bytes_shared).
+        """
+        with zipfile.ZipFile(self._base_path) as pack:
+            info = pack.getinfo('{}/{}'.format(PACK_ASSETS_DIR, path))
+
+            # Replace the target file - it might be a link
+            if os.path.lexists(target_file):
+                os.remove(target_file)
+
+            with pack.open(info) as src, \
+                 open(target_file, 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+
+        return info.file_size, 0
+
+    def registry_key(self):
+        """Return a key identifying the environments
+        able to render the templates of the pack.
+        """
+        # A modified pack requires new environments
+        return ('pack', self._base_path, os.stat(self._base_path).st_mtime_ns)
+
+    def create_registry(self, extension_profiles=None, bytecode_cache=None, auto_reload=False,
+                        filter_cache=None):
+        """Create a registry of environments
+        loading the compiled templates of the pack.
+
+        The delimiter profiles have been applied when compiling the
+        pack, compiled templates do not need a bytecode cache and a
+        modified pack has a different registry key - so these
+        arguments are ignored.  The filters of the compiled templates
+        use the given filter cache.
+        """
+        module_path = os.path.join(self._base_path, PACK_TEMPLATES_DIR)
+        return EnvironmentRegistry(self._base_path, module_path=module_path,
+                                   filter_cache=filter_cache)
+
+## =========================================================
+## =========================================================
+
+## fin.
@@ -0,0 +1,412 @@
+## =========================================================
+## Copyright 2019 Dietrich Bollmann
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##      http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+## ---------------------------------------------------------
+
+"""newskylabs/temple/templates/server.py:
+
+A long-running temple server and its client.
+
+The server keeps the settings, the jinja2 environments and the
+compiled templates in memory.  The settings are loaded again when one
+of the settings files has been modified; modified templates are
+compiled again.
+
+The server listens on a unix socket or on a localhost HTTP port and
+accepts the following requests:
+
+  GET  /status    - the status of the server as JSON
+
+  POST /generate  - generate a project;
+                    the body is a JSON object with the entries of a
+                    batch manifest entry ('type' or 'data', 'name',
+                    'settings') and optionally
+
+                      'cwd':            the working directory used to
+                                        resolve relative paths,
+                      'options':        keyword arguments of
+                                        TemplateEngine.generate()
+                                        ('jobs', 'copy_mode', ...),
+                      'archive_format': return the project as archive
+                                        instead of writing it to disk.
+
+The response of a generate request is a JSON object with the entries
+'success', 'message' and 'output' - or the archive.
+
+As generate requests write files, they have to be sent with the
+content type 'application/json' and requests coming from a web page
+- sending an 'Origin' header or a 'Host' header other than localhost -
+are rejected.  The unix socket is created accessible by the user only.
+
+"""
+
+import os
+import io
+import sys
+import json
+import time
+import socket
+import socketserver
+import http.client
+
+from contextlib import redirect_stdout
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+from newskylabs.temple.templates.batch import generate_project
+from newskylabs.temple.templates.sinks import ArchiveSink, ARCHIVE_FORMATS
+from newskylabs.temple.defaults import DEFAULT_HOST, DEFAULT_PORT
+
+## =========================================================
+## Server settings
+## ---------------------------------------------------------
+
+# Options of TemplateEngine.generate() which can be given in requests
+_REQUEST_OPTIONS = ['jobs', 'copy_mode', 'bytecode_cache', 'filter_cache', 'tree_index']
+
+# The hosts accepted in the 'Host' header of a request
+_LOCAL_HOSTS = ['localhost', '127.0.0.1', '[::1]']
+
+## =========================================================
+## class TempleService
+## ---------------------------------------------------------
+
+class TempleService():
+    """Generates projects using warm settings and environments.
+
+    'load_settings' is a function returning freshly loaded settings;
+    'settings_files' are the files it reads - the settings are loaded
+    again when any of them has been modified.
+    """
+
+    def __init__(self, load_settings, settings_files):
+        """
+        """
+        self._load_settings  = load_settings
+        self._settings_files = [str(path) for path in settings_files]
+        self._settings       = None
+        self._stamps         = None
+        self._registries     = {}
+        self._started        = time.time()
+        self._requests       = 0
+
+    def _get_stamps(self):
+        stamps = []
+        for path in self._settings_files:
+            try:
+                stat = os.stat(path)
+                stamps.append((stat.st_size, stat.st_mtime_ns))
+            except OSError:
+                stamps.append(None)
+        return stamps
+
+    def get_settings(self):
+        """Return the settings
+        - loading them again when a settings file has been modified.
+        """
+        stamps = self._get_stamps()
+        if self._settings is None or stamps != self._stamps:
+            self._settings = self._load_settings()
+            self._stamps   = stamps
+        return self._settings
+
+    def status(self):
+        """Return the status of the service.
+        """
+        return {
+            'pid':        os.getpid(),
+            'uptime':     time.time() - self._started,
+            'requests':   self._requests,
+            'registries': len(self._registries),
+        }
+
+    def generate(self, request):
+        """Handle a generate request.
+
+        Return the result as a dictionary - and the archive when
+        requested.
+        """
+        self._requests += 1
+
+        entry = {key: request[key] for key in ['type', 'data', 'name', 'settings']
+                 if request.get(key) is not None}
+
+        options = {key: value for key, value in (request.get('options') or {}).items()
+                   if key in _REQUEST_OPTIONS}
+
+        archive_format = request.get('archive_format')
+        if archive_format is not None and archive_format not in ARCHIVE_FORMATS:
+            return {'success': False,
+                    'message': "Unknown archive format '{}'".format(archive_format),
+                    'output':  ''}, None
+
+        archive = io.BytesIO() if archive_format else None
+        if archive:
+            options['sink'] = ArchiveSink(archive, archive_format)
+
+        if not ('type' in entry or 'data' in entry):
+            return {'success': False,
+                    'message': "A request has to define a 'type' or 'data' file",
+                    'output':  ''}, None
+
+        # Relative paths are resolved
+        # in the working directory of the client
+        cwd = os.getcwd()
+        output = io.StringIO()
+        try:
+            os.chdir(request.get('cwd') or cwd)
+            with redirect_stdout(output):
+                result = generate_project(self.get_settings(), entry, os.getcwd(),
+                                          registries=self._registries,
+                                          auto_reload=True, **options)
+
+        except Exception as e:
+            # Never let a single request kill the server
+            return {'success': False,
+                    'message': str(e) or e.__class__.__name__,
+                    'output':  output.getvalue()}, None
+
+        finally:
+            os.chdir(cwd)
+
+        result = {
+            'success': result.success,
+            'message': result.message,
+            'output':  output.getvalue(),
+        }
+
+        return result, archive.getvalue() if archive and result['success'] else None
+
+## =========================================================
+## HTTP request handler
+## ---------------------------------------------------------
+
+class TempleRequestHandler(BaseHTTPRequestHandler):
+    """Handles the HTTP requests to the temple server.
+    """
+
+    server_version = 'temple'
+
+    def address_string(self):
+        # Unix sockets have no client address
+        if isinstance(self.client_address, tuple):
+            return self.client_address[0]
+        else:
+            return 'unix'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status, data):
+        self._send(status, json.dumps(data).encode('utf-8'), 'application/json')
+
+    def _is_local_request(self):
+        """Was the request sent by a local client - and not by a
+        web page, forging requests from the browser of the user?
+        """
+        if self.headers.get('Origin') is not None:
+            return False
+
+        host = self.headers.get('Host')
+        if host is None:
+            return True
+
+        # Strip the port
+        host = host.strip().lower()
+        if host.startswith('['):
+            host = host[:host.find(']') + 1]
+        else:
+            host = host.partition(':')[0]
+
+        return host in _LOCAL_HOSTS
+
+    def _read_body(self):
+        """Read the body of the request
+        - return None when its length is invalid.
+        """
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+        except ValueError:
+            return None
+        return self.rfile.read(max(length, 0))
+
+    def do_GET(self):
+        if not self._is_local_request():
+            self._send_json(403, {'success': False, 'message': 'Forbidden'})
+        elif self.path == '/status':
+            self._send_json(200, self.server.service.status())
+        else:
+            self._send_json(404, {'success': False, 'message': 'Not found'})
+
+    def do_POST(self):
+        # Read the body before answering - a client sending it
+        # after the headers gets a broken pipe otherwise
+        # when the connection is closed
+        body = self._read_body()
+
+        if not self._is_local_request():
+            self._send_json(403, {'success': False, 'message': 'Forbidden'})
+            return
+
+        if self.path != '/generate':
+            self._send_json(404, {'success': False, 'message': 'Not found'})
+            return
+
+        # Browsers can send form data without preflight
+        # but no JSON to other origins
+        content_type = self.headers.get('Content-Type', '').partition(';')[0]
+        if content_type.strip().lower() != 'application/json':
+            self._send_json(415, {'success': False,
+                                  'message': "The request has to be of type 'application/json'"})
+            return
+
+        try:
+            if body is None:
+                raise ValueError('Invalid Content-Length')
+            request = json.loads(body.decode('utf-8'))
+            if not isinstance(request, dict):
+                raise ValueError('The request has to be a JSON object')
+
+        except ValueError as e:
+            self._send_json(400, {'success': False, 'message': 'Bad request: {}'.format(e)})
+            return
+
+        result, archive = self.server.service.generate(request)
+
+        if archive is not None:
+            self._send(200, archive, 'application/octet-stream')
+        else:
+            self._send_json(200 if result['success'] else 422, result)
+
+class TempleHTTPServer(HTTPServer):
+    """The temple server listening on a TCP port.
+    """
+
+    def __init__(self, service, host=DEFAULT_HOST, port=DEFAULT_PORT, verbose=True):
+        self.service = service
+        self.verbose = verbose
+        super().__init__((host, port), TempleRequestHandler)
+
+class TempleUnixServer(socketserver.UnixStreamServer):
+    """The temple server listening on a unix socket.
+    """
+
+    def __init__(self, service, socket_path, verbose=True):
+        self.service = service
+        self.verbose = verbose
+
+        # Remove the socket of a previous server
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+
+        # Create the socket accessible by the user only
+        directory = os.path.dirname(socket_path)
+        if directory:
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+
+        umask = os.umask(0o177)
+        try:
+            super().__init__(socket_path, TempleRequestHandler)
+        finally:
+            os.umask(umask)
+
+    def server_close(self):
+        super().server_close()
+        try:
+            os.remove(self.server_address)
+        except OSError:
+            pass
+
+def serve(service, host=DEFAULT_HOST, port=DEFAULT_PORT, socket_path=None, verbose=True):
+    """Serve requests until interrupted.
+
+    The server listens on the given unix socket - or on the given
+    host and port when no socket is given.  The requests are handled
+    one after the other.
+    """
+    if socket_path:
+        socket_path = os.path.expanduser(socket_path)
+        server = TempleUnixServer(service, socket_path, verbose=verbose)
+        address = socket_path
+    else:
+        server = TempleHTTPServer(service, host, port, verbose=verbose)
+        address = 'http://{}:{}'.format(*server.server_address[:2])
+
+    print('temple server listening on {}'.format(address))
+    sys.stdout.flush()
+
+    try:
+        server.serve_forever()
+
+    except KeyboardInterrupt:
+        pass
+
+    finally:
+        server.server_close()
+
+## =========================================================
+## Client
+## ---------------------------------------------------------
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    """An HTTP connection over a unix socket.
+    """
+
+    def __init__(self, socket_path, timeout=None):
+        super().__init__('localhost', timeout=timeout)
+        self._socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self._socket_path)
+
+def request_generate(request, host=DEFAULT_HOST, port=DEFAULT_PORT, socket_path=None,
+                     timeout=None):
+    """Send a generate request to a temple server.
+
+    Return the result as a dictionary - and the archive when
+    requested.  Raises OSError when the server cannot be reached.
+    """
+    if socket_path:
+        socket_path = os.path.expanduser(socket_path)
+        connection = _UnixHTTPConnection(socket_path, timeout=timeout)
+    else:
+        connection = http.client.HTTPConnection(host, port, timeout=timeout)
+
+    try:
+        body = json.dumps(request).encode('utf-8')
+        connection.request('POST', '/generate', body,
+                           {'Content-Type': 'application/json'})
+        response = connection.getresponse()
+        data = response.read()
+
+        if response.getheader('Content-Type') == 'application/octet-stream':
+            return {'success': True, 'message': None, 'output': ''}, data
+        else:
+            return json.loads(data.decode('utf-8')), None
+
+    finally:
+        connection.close()
+
+## =========================================================
+## =========================================================
+
+## fin.
@@ -0,0 +1,350 @@
+## =========================================================
+## Copyright 2019 Dietrich Bollmann
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##      http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+## ---------------------------------------------------------
+
+"""newskylabs/temple/templates/sinks.py:
+
+Output sinks: where the files of a generated project are written to.
+
+  - FileSystemSink: the project directory on disk (default),
+
+  - MemorySink: a dictionary mapping the paths of the files
+    to their content,
+
+  - ArchiveSink: a tar or zip archive - written to a file or streamed
+    to any binary file object, for example to stdout.
+
+The paths in memory and in archives are given relative to the
+project dir - the directory the project is generated in - using '/'
+as separator.
+
+"""
+
+import os
+import io
+import stat
+import time
+import shutil
+import tarfile
+import zipfile
+import tempfile
+
+from newskylabs.temple.defaults import ARCHIVE_FORMATS, DEFAULT_ARCHIVE_FORMAT
+
+## =========================================================
+## Archive formats
+## ---------------------------------------------------------
+
+# Extensions of archive files and their formats
+_ARCHIVE_EXTENSIONS = [
+    ('.tar.gz',  'tar.gz'),
+    ('.tgz',     'tar.gz'),
+    ('.tar.bz2', 'tar.bz2'),
+    ('.tar.xz',  'tar.xz'),
+    ('.tar',     'tar'),
+    ('.zip',     'zip'),
+]
+
+# Rendered files up to this size are buffered in memory
+# before being added to a tar archive - larger ones on disk
+_SPOOL_SIZE = 1024 * 1024
+
+# The permissions of the files and directories in archives
+_FILE_MODE      = 0o644
+_DIRECTORY_MODE = 0o755
+
+def archive_format_for(path):
+    """Return the archive format corresponding to the extension
+    of the given path - or None when it has none of the known
+    archive extensions.
+    """
+    path_lower = str(path).lower()
+    for extension, archive_format in _ARCHIVE_EXTENSIONS:
+        if path_lower.endswith(extension):
+            return archive_format
+    return None
+
+## =========================================================
+## class OutputSink
+## ---------------------------------------------------------
+
+class OutputSink():
+    """The interface of output sinks.
+
+    The paths passed to a sink are the paths of the project
+    directories and files as they would be created on disk.
+    """
+
+    # Does the sink write to the filesystem?
+    # Only projects written to the filesystem record their state
+    # for 'temple update' and are written by parallel workers
+    writes_to_filesystem = False
+
+    def open(self, root):
+        """Start writing a project into the directory 'root'.
+        """
+        self._root = str(root)
+
+    def close(self):
+        """Finish writing the project.
+        """
+
+    def exists(self, path):
+        """Does the given path exist already?
+        """
+        return False
+
+    def mkdir(self, path, parents=False):
+        """Create the given directory.
+        """
+        raise NotImplementedError()
+
+    def open_file(self, path, buffer_size=-1):
+        """Return a text file object to write the given file.
+        """
+        raise NotImplementedError()
+
+    def copy_file(self, tree, tree_path, path, mode=None):
+        """Copy the file 'tree_path' of the given template tree
+        to the given path.
+
+        Return the tuple (bytes_copied, bytes_shared).
+        """
+        raise NotImplementedError()
+
+    def _name(self, path):
+        """Return the name of a path relative to the root
+        using '/' as separator.
+        """
+        return os.path.relpath(str(path), self._root).replace(os.sep, '/')
+
+    def _parents(self, path):
+        """Return the names of the given directory and its parent
+        directories below the root - the outermost first.
+        """
+        names = []
+        name = self._name(path)
+        while name and name != '.':
+            names.insert(0, name)
+            name = os.path.dirname(name)
+        return names
+
+## =========================================================
+## class FileSystemSink
+## ---------------------------------------------------------
+
+class FileSystemSink(OutputSink):
+    """Writes the project to the filesystem.
+    """
+
+    writes_to_filesystem = True
+
+    def exists(self, path):
+        return os.path.exists(str(path))
+
+    def mkdir(self, path, parents=False):
+        if parents:
+            os.makedirs(str(path))
+        else:
+            os.mkdir(str(path))
+
+    def open_file(self, path, buffer_size=-1):
+        return open(str(path), 'w', buffering=buffer_size)
+
+    def copy_file(self, tree, tree_path, path, mode=None):
+        return tree.copy_file(tree_path, str(path), mode=mode)
+
+## =========================================================
+## class MemorySink
+## ---------------------------------------------------------
+
+class _MemoryFile(io.StringIO):
+    """A text file storing its content in a MemorySink when closed.
+    """
+
+    def __init__(self, files, name):
+        super().__init__()
+        self._files = files
+        self._name  = name
+
+    def close(self):
+        if not self.closed:
+            self._files[self._name] = self.getvalue().encode('utf-8')
+        super().close()
+
+class MemorySink(OutputSink):
+    """Keeps the project in memory.
+
+    After the generation, get_files() returns a dictionary mapping
+    the names of the files to their content as bytes and
+    get_directories() the list of the names of the directories.
+    """
+
+    def __init__(self):
+        """
+        """
+        self._directories = []
+        self._files       = {}
+
+    def get_directories(self):
+        return self._directories
+
+    def get_files(self):
+        return self._files
+
+    def mkdir(self, path, parents=False):
+        for name in self._parents(path) if parents else [self._name(path)]:
+            if name not in self._directories:
+                self._directories.append(name)
+
+    def open_file(self, path, buffer_size=-1):
+        return _MemoryFile(self._files, self._name(path))
+
+    def copy_file(self, tree, tree_path, path, mode=None):
+        with tree.open_file(tree_path) as fh:
+            content = fh.read()
+        self._files[self._name(path)] = content
+        return len(content), 0
+
+## =========================================================
+## class ArchiveSink
+## ---------------------------------------------------------
+
+class _TarFile(io.TextIOWrapper):
+    """A text file adding its content to a tar archive when closed.
+    """
+
+    def __init__(self, sink, name):
+        self._buffer = tempfile.SpooledTemporaryFile(max_size=_SPOOL_SIZE)
+        super().__init__(self._buffer, encoding='utf-8')
+        self._sink = sink
+        self._name = name
+
+    def close(self):
+        if not self.closed:
+            self.flush()
+            size = self._buffer.tell()
+            self._buffer.seek(0)
+            self._sink._add_tar_member(self._name, self._buffer, size)
+        super().close()
+
+class ArchiveSink(OutputSink):
+    """Streams the project into a tar or zip archive.
+
+    'target' is the path of the archive file or a binary file object -
+    which can be a non-seekable stream like stdout.  When no
+    'archive_format' is given, it is derived from the extension of the
+    path or defaults to DEFAULT_ARCHIVE_FORMAT.
+    """
+
+    def __init__(self, target, archive_format=None):
+        """
+        """
+        if archive_format is None:
+            if isinstance(target, (str, os.PathLike)):
+                archive_format = archive_format_for(target)
+            archive_format = archive_format or DEFAULT_ARCHIVE_FORMAT
+
+        if archive_format not in ARCHIVE_FORMATS:
+            raise ValueError("Unknown archive format '{}' - use one of: {}" \
+                             .format(archive_format, ', '.join(ARCHIVE_FORMATS)))
+
+        self._target         = target
+        self._archive_format = archive_format
+        self._fileobj        = None
+        self._archive        = None
+
+    def open(self, root):
+        super().open(root)
+
+        # Open the archive file
+        if isinstance(self._target, (str, os.PathLike)):
+            self._fileobj = open(self._target, 'wb')
+        else:
+            self._fileobj = self._target
+
+        if self._archive_format == 'zip':
+            self._archive = zipfile.ZipFile(self._fileobj, 'w',
+                                            compression=zipfile.ZIP_DEFLATED)
+        else:
+            self._archive = tarfile.open(fileobj=self._fileobj,
+                                         mode=ARCHIVE_FORMATS[self._archive_format])
+
+    def close(self):
+        self._archive.close()
+
+        # Only close archive files opened by the sink
+        if self._fileobj is not self._target:
+            self._fileobj.close()
+        else:
+            self._fileobj.flush()
+
+    def _zip_info(self, name, directory=False):
+        """Return the zip entry of a file or directory
+        - with the current time and the permissions set
+        as in tar archives.
+        """
+        if directory:
+            info = zipfile.ZipInfo(name + '/', time.localtime()[:6])
+            info.external_attr = ((stat.S_IFDIR | _DIRECTORY_MODE) << 16) | 0x10
+        else:
+            info = zipfile.ZipInfo(name, time.localtime()[:6])
+            info.external_attr = (stat.S_IFREG | _FILE_MODE) << 16
+            info.compress_type = zipfile.ZIP_DEFLATED
+        return info
+
+    def mkdir(self, path, parents=False):
+        for name in self._parents(path) if parents else [self._name(path)]:
+            if self._archive_format == 'zip':
+                self._archive.writestr(self._zip_info(name, directory=True), b'')
+            else:
+                info = tarfile.TarInfo(name)
+                info.type  = tarfile.DIRTYPE
+                info.mode  = _DIRECTORY_MODE
+                info.mtime = int(time.time())
+                self._archive.addfile(info)
+
+    def open_file(self, path, buffer_size=-1):
+        name = self._name(path)
+        if self._archive_format == 'zip':
+            return io.TextIOWrapper(self._archive.open(self._zip_info(name), 'w'),
+                                    encoding='utf-8')
+        else:
+            return _TarFile(self, name)
+
+    def copy_file(self, tree, tree_path, path, mode=None):
+        name = self._name(path)
+        size = tree.file_size(tree_path)
+        with tree.open_file(tree_path) as src:
+            if self._archive_format == 'zip':
+                with self._archive.open(self._zip_info(name), 'w', force_zip64=True) as dst:
+                    shutil.copyfileobj(src, dst)
+            else:
+                self._add_tar_member(name, src, size)
+        return size, 0
+
+    def _add_tar_member(self, name, fileobj, size):
+        """Add a regular file to the tar archive.
+        """
+        info = tarfile.TarInfo(name)
+        info.size  = size
+        info.mode  = _FILE_MODE
+        info.mtime = int(time.time())
+        self._archive.addfile(info, fileobj)
+
+## =========================================================
+## =========================================================
+
+## fin.
@@ -0,0 +1,370 @@
+## =========================================================
+## Copyright 2019 Dietrich Bollmann
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##      http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+## ---------------------------------------------------------
+
+"""newskylabs/temple/templates/state.py:
+
+The generation state of a project: for each generated file the inputs
+it has been generated from and the hash of the generated output.
+
+The state is used by 'temple update' to re-render only the files whose
+inputs have changed since the last generation.
+
+"""
+
+import os
+import json
+import tempfile
+
+from hashlib import sha1
+
+from jinja2 import meta, nodes
+
+from newskylabs.temple.utils.views import json_default
+
+## =========================================================
+## State settings
+## ---------------------------------------------------------
+
+# Name of the state file in the project base directory
+STATE_FILE = '.temple-state.json'
+
+# Version of the state format
+_STATE_FORMAT_VERSION = 1
+
+# Version of the format of the cached template analyses
+_ANALYSIS_FORMAT_VERSION = 1
+
+# Marker of templates depending on all variables
+ALL_VARIABLES = '*'
+
+# Filters which dereference arbitrary variables via <temple var="..." />
+_DEREFERENCING_FILTERS = ['html', 'latex']
+
+# Filters reading settings variables
+_FILTER_VARIABLES = {
+    'markdown': ['markdown'],
+}
+
+# Variables which are not taken into account:
+# the 'temple' variables only depend on the template file itself
+_IGNORED_VARIABLES = ['temple']
+
+## =========================================================
+## Hashing
+## ---------------------------------------------------------
+
+def hash_string(string):
+    """Return the hash of a string.
+    """
+    return sha1(string.encode('utf-8')).hexdigest()
+
+def hash_file(path):
+    """Return the hash of the content of a file.
+    Return None when the file does not exist.
+    """
+    digest = sha1()
+    try:
+        with open(path, 'rb') as fh:
+            for chunk in iter(lambda: fh.read(1024 * 1024), b''):
+                digest.update(chunk)
+
+    except OSError:
+        return None
+
+    return digest.hexdigest()
+
+def stamp_file(path):
+    """Return a cheap stamp of a file - its size and modification time.
+    Return None when the file does not exist.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+
+    return [stat.st_size, stat.st_mtime_ns]
+
+## =========================================================
+## Template analysis
+## ---------------------------------------------------------
+
+def _analyse_source(env, name, source, filename, source_hash):
+    """Return the analysis of the source of a single template: a
+    dictionary with the sorted list of the 'variables' it reads and
+    the list of the templates it 'references' - None when it
+    references templates by dynamic names.
+
+    The analyses are cached by template name and source hash: in the
+    environment - so templates included by many templates are parsed
+    once - and, when enabled, in the bytecode cache - so later runs
+    do not have to parse the templates either.
+    """
+    analyses = env.temple.setdefault('analyses', {})
+    analysis = analyses.get((name, source_hash))
+    if analysis is not None:
+        return analysis
+
+    # The analysis cached with the bytecode of the template
+    cache = env.bytecode_cache
+    if cache is not None and hasattr(cache, 'load_analysis'):
+        analysis = cache.load_analysis(env, name, filename, source)
+        if analysis is not None and analysis.get('version') != _ANALYSIS_FORMAT_VERSION:
+            analysis = None
+
+    if analysis is None:
+        ast = env.parse(source, name, filename)
+
+        # The variables read by the template
+        variables = set(meta.find_undeclared_variables(ast))
+
+        # The filters dereferencing <temple var="..." /> paths
+        # might read any variable - other filters read settings
+        for node in ast.find_all(nodes.Filter):
+            if node.name in _DEREFERENCING_FILTERS:
+                variables.add(ALL_VARIABLES)
+            variables.update(_FILTER_VARIABLES.get(node.name, []))
+
+        # The templates included, imported or extended
+        references = []
+        for reference in meta.find_referenced_templates(ast):
+            if reference is None:
+                # Dynamic template name
+                references = None
+                break
+            references.append(env.join_path(reference, name))
+
+        analysis = {
+            'version':    _ANALYSIS_FORMAT_VERSION,
+            'variables':  sorted(variables),
+            'references': references,
+        }
+
+        if cache is not None and hasattr(cache, 'dump_analysis'):
+            cache.dump_analysis(env, name, filename, source, analysis)
+
+    analyses[(name, source_hash)] = analysis
+    return analysis
+
+def analyse_template(env, name):
+    """Analyse the template with the given name.
+
+    Return a dictionary with
+
+      - 'template_hash': the hash of the template source,
+
+      - 'dependencies': the hashes of the sources of all templates
+        included, imported or extended - directly or indirectly,
+
+      - 'variables': the sorted list of the variables read by the
+        template and its dependencies - or [ALL_VARIABLES] when the
+        template might read any variable.
+
+    Return None when the template cannot be analysed: when its source
+    is not available (precompiled templates) or when it references
+    templates by dynamic names.
+    """
+    if not env.loader.has_source_access:
+        return None
+
+    template_hash = None
+    dependencies = {}
+    variables = set()
+
+    pending = [name]
+    seen = set()
+    while pending:
+        current = pending.pop()
+        if current in seen:
+            continue
+        seen.add(current)
+
+        source, filename, uptodate = env.loader.get_source(env, current)
+        source_hash = hash_string(source)
+        if current == name:
+            template_hash = source_hash
+        else:
+            dependencies[current] = source_hash
+
+        analysis = _analyse_source(env, current, source, filename, source_hash)
+        if analysis['references'] is None:
+            return None
+
+        variables.update(analysis['variables'])
+        pending.extend(analysis['references'])
+
+    if ALL_VARIABLES in variables:
+        variables = [ALL_VARIABLES]
+    else:
+        variables = sorted(variables - set(_IGNORED_VARIABLES))
+
+    return {
+        'template_hash': template_hash,
+        'dependencies':  dependencies,
+        'variables':     variables,
+    }
+
+def get_analysis(record):
+    """Return the analysis of a template recorded in the given state record
+    - see analyse_template().
+    """
+    return {
+        'template_hash': record['template_hash'],
+        'dependencies':  record['dependencies'],
+        'variables':     record['variables'],
+    }
+
+def dependencies_changed(env, dependencies):
+    """Have the sources of any of the given dependencies changed?
+    """
+    for name, source_hash in dependencies.items():
+        try:
+            source, filename, uptodate = env.loader.get_source(env, name)
+        except Exception:
+            return True
+        if hash_string(source) != source_hash:
+            return True
+
+    return False
+
+## =========================================================
+## class VariablesFingerprint
+## ---------------------------------------------------------
+
+class VariablesFingerprint():
+    """Computes fingerprints of the values of variables.
+    The fingerprints of single variables are memoized.
+    """
+
+    def __init__(self, variables):
+        self._variables = variables
+        self._hashes = {}
+
+    def _hash_variable(self, name):
+        value_hash = self._hashes.get(name)
+        if value_hash is None:
+            if name == ALL_VARIABLES:
+                value = {key: value for key, value in self._variables.items()
+                         if key not in _IGNORED_VARIABLES}
+            else:
+                value = self._variables.get(name)
+            value_hash = hash_string(json.dumps(value, sort_keys=True, default=json_default))
+            self._hashes[name] = value_hash
+
+        return value_hash
+
+    def fingerprint(self, names):
+        """Return the fingerprint of the values of the given variables.
+        """
+        return hash_string(' '.join(self._hash_variable(name) for name in names))
+
+## =========================================================
+## class ProjectState
+## ---------------------------------------------------------
+
+class ProjectState():
+    """The generation state of a project.
+
+    Maps the paths of the template files (relative to the template
+    directory) to records describing the generated files.
+
+    The records of the files which are not generated any more - as
+    their templates have been removed or their paths have changed -
+    are kept as obsolete records by the paths of the files (relative
+    to the project base directory) until the files are removed.
+    """
+
+    def __init__(self, project_base_path, records=None, obsolete=None):
+        """
+        """
+        self._project_base_path = str(project_base_path)
+        self._records = records or {}
+        self._obsolete = obsolete or {}
+
+    @classmethod
+    def exists(cls, project_base_path):
+        """Return True when the state of the given project has been recorded.
+        """
+        return os.path.isfile(os.path.join(str(project_base_path), STATE_FILE))
+
+    @classmethod
+    def load(cls, project_base_path):
+        """Load the state of the given project.
+        Return an empty state when the project has no state.
+        """
+        state_file = os.path.join(str(project_base_path), STATE_FILE)
+        try:
+            with open(state_file) as fh:
+                state = json.load(fh)
+
+        except (OSError, ValueError):
+            return cls(project_base_path)
+
+        if state.get('version') != _STATE_FORMAT_VERSION:
+            return cls(project_base_path)
+
+        return cls(project_base_path, state.get('files'), state.get('obsolete'))
+
+    def save(self):
+        """Save the state to the state file of the project.
+        """
+        state = {
+            'version':  _STATE_FORMAT_VERSION,
+            'files':    self._records,
+            'obsolete': self._obsolete,
+        }
+
+        # Write to a temporary file first
+        # and rename it afterwards
+        fd, tmp_path = tempfile.mkstemp(dir=self._project_base_path, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as fh:
+                json.dump(state, fh, indent=1, sort_keys=True)
+            os.replace(tmp_path, os.path.join(self._project_base_path, STATE_FILE))
+
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def get_record(self, path):
+        return self._records.get(path)
+
+    def set_record(self, path, record):
+        self._records[path] = record
+
+    def remove_record(self, path):
+        self._records.pop(path, None)
+
+    def get_paths(self):
+        return list(self._records.keys())
+
+    def add_obsolete(self, record):
+        self._obsolete[record['project_file']] = record
+
+    def remove_obsolete(self, project_file):
+        self._obsolete.pop(project_file, None)
+
+    def get_obsolete(self):
+        """Return the obsolete records by the paths of their files.
+        """
+        return dict(self._obsolete)
+
+## =========================================================
+## =========================================================
+
+## fin.
@@ -0,0 +1,349 @@
+## =========================================================
+## Copyright 2019 Dietrich Bollmann
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##      http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+## ---------------------------------------------------------
+
+"""newskylabs/temple/templates/tree.py:
+
+Walking template trees and classifying their files.
+
+"""
+
+import os
+import json
+import time
+import tempfile
+
+from hashlib import sha1
+from pathlib import Path
+
+from newskylabs.temple.templates.jinja import EnvironmentRegistry
+from newskylabs.temple.templates.cache import CACHE_BASE_DIR
+from newskylabs.temple.templates.state import stamp_file
+from newskylabs.temple.utils.file_utilities import copy_file, DEFAULT_COPY_MODE
+
+## =========================================================
+## Tree index settings
+## ---------------------------------------------------------
+
+# The directory of the persisted tree indices
+TREE_INDEX_DIR = CACHE_BASE_DIR / 'index'
+
+# Version of the index format
+_INDEX_FORMAT_VERSION = 1
+
+# Directories modified within this interval before indexing
+# are re-scanned on the next walk
+_RACY_INTERVAL_NS = 2 * 1000 * 1000 * 1000
+
+## =========================================================
+## Classification of template files
+## ---------------------------------------------------------
+
+# Actions to generate a project file from a template file
+ACTION_COPY   = 'copy'
+ACTION_RENDER = 'render'
+ACTION_SKIP   = 'skip'
+
+# Dirs and files to exclude
+EXCLUDE_DIRS  = ['.git', 'backup']
+EXCLUDE_FILES = []
+
+# Files which are copied instead of rendered
+COPY_FILENAMES  = ['vita.make']
+COPY_EXTENSIONS = ['.png', '.jpg', '.jpeg', '.sty', '.pdf', '.make']
+
+def is_temporary_file(filename):
+    """Is the given file a temporary file?
+    """
+    return (filename[0] == '#' or
+            filename[-1] == '~' or
+            (len(filename) >= 2 and filename[:2] == '.#'))
+
+def classify_file(filename):
+    """Return the action used to generate a project file
+    from the template file with the given name.
+    """
+
+    # Get the extension
+    extension = os.path.splitext(filename)[1].lower()
+
+    # Skip files with a name containing '.jinja.' or ending on '.jinja'
+    filename_lower = filename.lower()
+    if filename_lower[-6:] == '.jinja' or \
+       '.jinja' in filename_lower:
+        return ACTION_SKIP
+
+    # Some files should just be copied
+    elif filename_lower in COPY_FILENAMES or \
+         extension in COPY_EXTENSIONS:
+        return ACTION_COPY
+
+    else:
+        return ACTION_RENDER
+
+## =========================================================
+## class TemplateDirectory
+## ---------------------------------------------------------
+
+class TemplateDirectory():
+    """A tree of template files in a directory.
+
+    Paths in the tree are given relative to the template base
+    directory, using '/' as separator.
+
+    When an index directory is given, the result of walking the tree
+    is persisted there as index.  Later walks only stat the directories
+    of the tree and re-scan the directories which have been modified
+    since the index has been written.
+    """
+
+    def __init__(self, base_path, index_dir=None):
+        """
+        """
+        self._base_path = str(base_path)
+        self._index_dir = Path(index_dir).expanduser() if index_dir else None
+
+    def get_base_path(self):
+        return self._base_path
+
+    def walk(self):
+        """Walk the template tree.
+
+        Return the list of the directories and the list of 
+        (action, path, size, templated) tuples of the files - where
+        'templated' tells if the path contains jinja delimiters.
+        Directories and files are walked in sorted order
+        to keep the generation deterministic.
+        """
+
+        # The index of the previous walk
+        index = self._load_index()
+        indexed_at_ns = index.get('indexed_at_ns', 0)
+        index_entries = index.get('directories', {})
+
+        now_ns = time.time_ns()
+
+        tree_directories = []
+        tree_files = []
+        entries = {}
+        modified = (len(index_entries) == 0)
+
+        # Walk the templates in depth-first order - as os.walk() does
+        stack = ['']
+        while stack:
+            rel_path = stack.pop()
+            template_path = self.template_file(rel_path) if rel_path else self._base_path
+
+            # Reuse the index entry of the directory
+            # when the directory has not been modified since.
+            # Modifications shortly before indexing might not be
+            # reflected by the modification time: don't trust the
+            # entries of directories modified shortly before indexing.
+            mtime_ns = os.stat(template_path).st_mtime_ns
+            entry = index_entries.get(rel_path)
+            if entry is None \
+               or entry['mtime_ns'] != mtime_ns \
+               or mtime_ns >= indexed_at_ns - _RACY_INTERVAL_NS:
+                entry = self._scan_directory(template_path, mtime_ns)
+                modified = True
+            entries[rel_path] = entry
+
+            prefix = rel_path + '/' if rel_path else ''
+
+            for directory, is_link in entry['directories']:
+                tree_directories.append(prefix + directory)
+
+            for action, filename, size in entry['files']:
+                path = prefix + filename
+                tree_files.append((action, path, size, '{' in path))
+
+            # Descend into the subdirectories - but not into
+            # symbolic links to directories
+            stack.extend(reversed([prefix + directory
+                                   for directory, is_link in entry['directories']
+                                   if not is_link]))
+
+        # Persist the index
+        if modified or len(entries) != len(index_entries):
+            self._save_index({
+                'version':       _INDEX_FORMAT_VERSION,
+                'base_path':     self._base_path,
+                'indexed_at_ns': now_ns,
+                'directories':   entries,
+            })
+
+        return tree_directories, tree_files
+
+    def _scan_directory(self, template_path, mtime_ns):
+        """Scan a single directory of the template tree
+        and return its index entry.
+        """
+        directories = []
+        files = []
+
+        with os.scandir(template_path) as it:
+            for dir_entry in it:
+                name = dir_entry.name
+
+                if dir_entry.is_dir():
+
+                    # Skip the directories in the exclude list
+                    if name not in EXCLUDE_DIRS:
+                        directories.append([name, dir_entry.is_symlink()])
+
+                # Skip the files in the exclude list
+                # and temporary files
+                elif name not in EXCLUDE_FILES and not is_temporary_file(name):
+                    try:
+                        size = dir_entry.stat().st_size
+                    except OSError:
+                        size = 0
+                    files.append([classify_file(name), name, size])
+
+        return {
+            'mtime_ns':    mtime_ns,
+            'directories': sorted(directories),
+            'files':       sorted(files, key=lambda file: file[1]),
+        }
+
+    def _get_index_file(self):
+        key = sha1(self._base_path.encode('utf-8')).hexdigest()
+        return self._index_dir / '{}.json'.format(key)
+
+    def _load_index(self):
+        """Load the persisted index of the tree.
+        Return an empty index when there is none.
+        """
+        if self._index_dir is None:
+            return {}
+
+        try:
+            with open(self._get_index_file()) as fh:
+                index = json.load(fh)
+
+        except (OSError, ValueError):
+            return {}
+
+        if index.get('version') != _INDEX_FORMAT_VERSION \
+           or index.get('base_path') != self._base_path:
+            return {}
+
+        return index
+
+    def _save_index(self, index):
+        """Persist the index of the tree.
+        """
+        if self._index_dir is None:
+            return
+
+        try:
+            self._index_dir.mkdir(parents=True, exist_ok=True)
+
+            # Write to a temporary file first
+            # and rename it afterwards
+            fd, tmp_path = tempfile.mkstemp(dir=str(self._index_dir), suffix='.tmp')
+
+        except OSError:
+            # The index is an optimization only
+            return
+
+        try:
+            with os.fdopen(fd, 'w') as fh:
+                json.dump(index, fh)
+            os.replace(tmp_path, str(self._get_index_file()))
+
+        except OSError:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    def template_file(self, path):
+        """Return the path of the template file with the given relative path.
+        """
+        return os.path.join(self._base_path, *path.split('/'))
+
+    def source_stamp(self, path):
+        """Return a stamp of the template file with the given relative
+        path which changes when the file is modified.
+        """
+        return stamp_file(self.template_file(path))
+
+    def file_size(self, path):
+        """Return the size of the template file with the given relative path.
+        """
+        return os.stat(self.template_file(path)).st_size
+
+    def open_file(self, path):
+        """Open the template file with the given relative path for reading
+        and return a binary file object.
+        """
+        return open(self.template_file(path), 'rb')
+
+    def copy_file(self, path, target_file, mode=DEFAULT_COPY_MODE):
+        """Copy the template file with the given relative path
+        to the given target file using the given copy mode.
+
+        Return the tuple (bytes_copied, bytes_shared).
+        """
+        return copy_file(self.template_file(path), target_file, mode=mode)
+
+    def registry_key(self):
+        """Return a key identifying the environments
+        able to render the templates of the tree.
+        """
+        return ('directory', self._base_path)
+
+    def create_registry(self, extension_profiles=None, bytecode_cache=None, auto_reload=False,
+                        filter_cache=None):
+        """Create a registry of environments
+        rendering the templates of the tree.
+
+        When 'auto_reload' is True, templates modified on disk
+        are compiled again.
+        """
+        return EnvironmentRegistry(self._base_path,
+                                   extension_profiles=extension_profiles,
+                                   auto_reload=auto_reload,
+                                   bytecode_cache=bytecode_cache,
+                                   filter_cache=filter_cache)
+
+## =========================================================
+## Tree index utilities
+## ---------------------------------------------------------
+
+def tree_index_stats(index_dir=TREE_INDEX_DIR):
+    """Return a dictionary with statistics about the persisted tree indices.
+    """
+    index_files = list(Path(index_dir).expanduser().glob('*.json'))
+    return {
+        'directory': str(Path(index_dir).expanduser()),
+        'entries':   len(index_files),
+        'size':      sum(index_file.stat().st_size for index_file in index_files),
+    }
+
+def clear_tree_indices(index_dir=TREE_INDEX_DIR):
+    """Remove all persisted tree indices.
+    """
+    for index_file in Path(index_dir).expanduser().glob('*.json'):
+        try:
+            index_file.unlink()
+        except OSError:
+            pass
+
+## =========================================================
+## =========================================================
+
+## fin.
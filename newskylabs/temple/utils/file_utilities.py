@@ -0,0 +1,205 @@
+## =========================================================
+## Copyright 2019 Dietrich Bollmann
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##      http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+## ---------------------------------------------------------
+
+"""newskylabs/temple/utils/file_utilities.py:
+
+File utilities: copying files with different strategies.
+
+"""
+
+import os
+import errno
+import shutil
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows
+    fcntl = None
+
+# The copy modes are defined with the other defaults
+from newskylabs.temple.defaults import COPY_MODE_COPY, COPY_MODE_REFLINK, \
+    COPY_MODE_COPY_FILE_RANGE, COPY_MODE_SENDFILE, COPY_MODE_HARDLINK, \
+    COPY_MODE_SYMLINK, COPY_MODE_AUTO, COPY_MODES, DEFAULT_COPY_MODE
+
+## =========================================================
+## Copy modes
+## ---------------------------------------------------------
+
+# The strategies tried - in this order - for each copy mode
+_FALLBACKS = {
+    COPY_MODE_AUTO:            [COPY_MODE_REFLINK, COPY_MODE_COPY_FILE_RANGE,
+                                COPY_MODE_SENDFILE, COPY_MODE_COPY],
+    COPY_MODE_COPY:            [COPY_MODE_COPY],
+    COPY_MODE_REFLINK:         [COPY_MODE_REFLINK, COPY_MODE_COPY],
+    COPY_MODE_COPY_FILE_RANGE: [COPY_MODE_COPY_FILE_RANGE, COPY_MODE_SENDFILE, COPY_MODE_COPY],
+    COPY_MODE_SENDFILE:        [COPY_MODE_SENDFILE, COPY_MODE_COPY],
+    COPY_MODE_HARDLINK:        [COPY_MODE_HARDLINK, COPY_MODE_REFLINK,
+                                COPY_MODE_COPY_FILE_RANGE, COPY_MODE_SENDFILE, COPY_MODE_COPY],
+    COPY_MODE_SYMLINK:         [COPY_MODE_SYMLINK, COPY_MODE_COPY],
+}
+
+# Strategies sharing the data with the source file
+# instead of copying it
+_SHARING_STRATEGIES = [COPY_MODE_REFLINK, COPY_MODE_HARDLINK, COPY_MODE_SYMLINK]
+
+# Errors telling that a strategy is not supported
+# for the given files - and that the next one should be tried
+_UNSUPPORTED_ERRORS = set(getattr(errno, name) for name in [
+    'EXDEV', 'EOPNOTSUPP', 'ENOTSUP', 'ENOTTY', 'EINVAL', 'ENOSYS',
+    'EPERM', 'EACCES', 'EBADF', 'EMLINK',
+] if hasattr(errno, name))
+
+# ioctl request to clone a file (linux/fs.h: FICLONE)
+_FICLONE = 0x40049409
+
+# Maximal number of bytes transferred by a single kernel call
+_CHUNK_SIZE = 1024 * 1024 * 1024
+
+class CopyStrategyNotSupported(Exception):
+    """Exception raised when a copy strategy is not available
+    on the current platform.
+    """
+
+## =========================================================
+## Copy strategies
+## ---------------------------------------------------------
+
+def _copy_reflink(source, target):
+    """Clone the data blocks of the source file.
+    """
+    if fcntl is None:
+        raise CopyStrategyNotSupported(COPY_MODE_REFLINK)
+
+    with open(source, 'rb') as src, open(target, 'wb') as dst:
+        fcntl.ioctl(dst.fileno(), _FICLONE, src.fileno())
+
+def _copy_file_range(source, target):
+    """Copy the data inside the kernel with copy_file_range(2).
+    """
+    if not hasattr(os, 'copy_file_range'):
+        raise CopyStrategyNotSupported(COPY_MODE_COPY_FILE_RANGE)
+
+    with open(source, 'rb') as src, open(target, 'wb') as dst:
+        while os.copy_file_range(src.fileno(), dst.fileno(), _CHUNK_SIZE) > 0:
+            pass
+
+def _copy_sendfile(source, target):
+    """Copy the data inside the kernel with sendfile(2).
+    """
+    if not hasattr(os, 'sendfile'):
+        raise CopyStrategyNotSupported(COPY_MODE_SENDFILE)
+
+    with open(source, 'rb') as src, open(target, 'wb') as dst:
+        offset = 0
+        while True:
+            sent = os.sendfile(dst.fileno(), src.fileno(), offset, _CHUNK_SIZE)
+            if sent == 0:
+                break
+            offset += sent
+
+def _copy_hardlink(source, target):
+    """Link the target to the source file.
+    """
+    os.link(source, target)
+
+def _copy_symlink(source, target):
+    """Make the target a symbolic link to the source file.
+    """
+    os.symlink(os.path.abspath(source), target)
+
+def _copy_copy(source, target):
+    """Copy the data with the generic python implementation.
+    """
+    shutil.copyfile(source, target)
+
+_STRATEGIES = {
+    COPY_MODE_REFLINK:         _copy_reflink,
+    COPY_MODE_COPY_FILE_RANGE: _copy_file_range,
+    COPY_MODE_SENDFILE:        _copy_sendfile,
+    COPY_MODE_HARDLINK:        _copy_hardlink,
+    COPY_MODE_SYMLINK:         _copy_symlink,
+    COPY_MODE_COPY:            _copy_copy,
+}
+
+## =========================================================
+## copy_file()
+## ---------------------------------------------------------
+
+def _remove(path):
+    """Remove a file - when it exists.
+    """
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def copy_file(source, target, mode=DEFAULT_COPY_MODE):
+    """Copy the source file to the target file using the given copy mode.
+
+    When a strategy is not supported for the given files - for example
+    reflinks on filesystems without copy-on-write or hardlinks across
+    filesystems - the next strategy of the mode is tried.
+
+    An existing target file is replaced - and not written through,
+    as it might be a link to another file.
+
+    Return the tuple (bytes_copied, bytes_shared).
+    """
+    if mode not in _FALLBACKS:
+        raise ValueError("Unknown copy mode '{}' - use one of: {}" \
+                         .format(mode, ', '.join(COPY_MODES)))
+
+    size = os.stat(source).st_size
+
+    strategies = _FALLBACKS[mode]
+    for strategy in strategies:
+        _remove(target)
+        try:
+            _STRATEGIES[strategy](source, target)
+
+        except CopyStrategyNotSupported:
+            continue
+
+        except OSError as e:
+            # Try the next strategy
+            # - unless this was the last one
+            if e.errno in _UNSUPPORTED_ERRORS and strategy != strategies[-1]:
+                continue
+            raise
+
+        if strategy in _SHARING_STRATEGIES:
+            return 0, size
+        else:
+            return size, 0
+
+## =========================================================
+## Formatting
+## ---------------------------------------------------------
+
+def format_size(size):
+    """Format a size in bytes for humans.
+    """
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if size < 1024 or unit == 'GB':
+            break
+        size /= 1024
+    return '{:.1f} {}'.format(size, unit) if unit != 'B' else '{} B'.format(size)
+
+## =========================================================
+## =========================================================
+
+## fin.
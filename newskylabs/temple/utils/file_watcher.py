@@ -0,0 +1,294 @@
+## =========================================================
+## Copyright 2019 Dietrich Bollmann
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##      http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+## ---------------------------------------------------------
+
+"""newskylabs/temple/utils/file_watcher.py:
+
+Watching files and directory trees for modifications.
+
+On linux the kernel's inotify interface is used (via ctypes); on other
+platforms - or when inotify is not available - the watched files are
+polled.
+
+Example:
+
+  watcher = create_watcher(['templates/', 'settings.yaml'])
+  for changed in watch(watcher):
+      print('modified:', changed)
+
+"""
+
+import os
+import sys
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+
+from newskylabs.temple.defaults import DEFAULT_DEBOUNCE
+
+## =========================================================
+## Watcher settings
+## ---------------------------------------------------------
+
+# Seconds between two scans of the polling watcher
+DEFAULT_POLL_INTERVAL = 0.5
+
+# inotify constants (linux/inotify.h)
+_IN_MODIFY      = 0x00000002
+_IN_ATTRIB      = 0x00000004
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM  = 0x00000040
+_IN_MOVED_TO    = 0x00000080
+_IN_CREATE      = 0x00000100
+_IN_DELETE      = 0x00000200
+_IN_DELETE_SELF = 0x00000400
+_IN_MOVE_SELF   = 0x00000800
+_IN_Q_OVERFLOW  = 0x00004000
+_IN_IGNORED     = 0x00008000
+_IN_ISDIR       = 0x40000000
+
+_IN_NONBLOCK    = 0o0004000
+_IN_CLOEXEC     = 0o2000000
+
+_IN_MASK = (_IN_MODIFY | _IN_ATTRIB | _IN_CLOSE_WRITE |
+            _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE |
+            _IN_DELETE_SELF | _IN_MOVE_SELF)
+
+# struct inotify_event: int wd; uint32_t mask, cookie, len; char name[]
+_EVENT_HEADER = struct.Struct('iIII')
+
+## =========================================================
+## class PollingWatcher
+## ---------------------------------------------------------
+
+class PollingWatcher():
+    """Watches files and directory trees by polling them.
+    """
+
+    def __init__(self, paths, interval=DEFAULT_POLL_INTERVAL):
+        """
+        """
+        self._paths    = [os.path.abspath(str(path)) for path in paths]
+        self._interval = interval
+        self._snapshot = self._scan()
+
+    def _scan(self):
+        """Return a dictionary mapping the watched files
+        to their size and modification time.
+        """
+        snapshot = {}
+        for path in self._paths:
+            if os.path.isdir(path):
+                for dirpath, dirnames, filenames in os.walk(path):
+                    for filename in filenames:
+                        self._stat(os.path.join(dirpath, filename), snapshot)
+            else:
+                self._stat(path, snapshot)
+        return snapshot
+
+    def _stat(self, path, snapshot):
+        try:
+            stat = os.stat(path)
+            snapshot[path] = (stat.st_size, stat.st_mtime_ns)
+        except OSError:
+            pass
+
+    def wait(self, timeout=None):
+        """Wait for modifications and return the set of the modified
+        paths - an empty set when no modification happened before the
+        timeout.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            snapshot = self._scan()
+            changed = set(path for path in set(snapshot) | set(self._snapshot)
+                          if snapshot.get(path) != self._snapshot.get(path))
+            self._snapshot = snapshot
+            if changed:
+                return changed
+
+            if deadline is None:
+                time.sleep(self._interval)
+            else:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return set()
+                time.sleep(min(self._interval, remaining))
+
+    def close(self):
+        pass
+
+## =========================================================
+## class InotifyWatcher
+## ---------------------------------------------------------
+
+def _load_libc():
+    """Return the C library when it provides inotify - None otherwise.
+    """
+    if not sys.platform.startswith('linux'):
+        return None
+
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+
+    return libc
+
+class InotifyWatcher():
+    """Watches files and directory trees with inotify.
+
+    Directories are watched recursively - including directories
+    created later.  Single files are watched via their directory, so
+    that files replaced by editors are still watched.
+    """
+
+    def __init__(self, paths, libc=None):
+        """
+        """
+        self._libc = libc or _load_libc()
+        if self._libc is None:
+            raise OSError(errno.ENOSYS, 'inotify is not available')
+
+        self._fd = self._libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self._fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+
+        # The watched directories by watch descriptor
+        self._directories = {}
+
+        # The watched files of non-recursively watched directories
+        self._files = {}
+
+        for path in paths:
+            path = os.path.abspath(str(path))
+            if os.path.isdir(path):
+                self._add_tree(path)
+            else:
+                directory = os.path.dirname(path)
+                self._files.setdefault(directory, set()).add(path)
+                self._add_directory(directory)
+
+    def _add_directory(self, directory):
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), _IN_MASK)
+        if wd >= 0:
+            self._directories[wd] = directory
+
+    def _add_tree(self, directory):
+        for dirpath, dirnames, filenames in os.walk(directory):
+            self._add_directory(dirpath)
+
+    def _is_watched(self, path):
+        files = self._files.get(os.path.dirname(path))
+        return files is None or path in files
+
+    def wait(self, timeout=None):
+        """Wait for modifications and return the set of the modified
+        paths - an empty set when no modification happened before the
+        timeout.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None if deadline is None else max(0, deadline - time.monotonic())
+            readable, _, _ = select.select([self._fd], [], [], remaining)
+            if not readable:
+                return set()
+
+            changed = self._read_events()
+            if changed:
+                return changed
+
+    def _read_events(self):
+        changed = set()
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return changed
+
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+
+            if mask & _IN_Q_OVERFLOW:
+                # Events have been lost:
+                # report all watched directories
+                changed.update(self._directories.values())
+                continue
+
+            directory = self._directories.get(wd)
+            if directory is None:
+                continue
+
+            if mask & _IN_IGNORED:
+                # The directory has been removed
+                del self._directories[wd]
+                continue
+
+            path = os.path.join(directory, os.fsdecode(name)) if name else directory
+
+            # Watch new subdirectories of recursively watched trees
+            if mask & _IN_ISDIR and mask & (_IN_CREATE | _IN_MOVED_TO) \
+               and directory not in self._files:
+                self._add_tree(path)
+
+            if self._is_watched(path):
+                changed.add(path)
+
+        return changed
+
+    def close(self):
+        os.close(self._fd)
+
+## =========================================================
+## create_watcher(), watch()
+## ---------------------------------------------------------
+
+def create_watcher(paths, poll_interval=DEFAULT_POLL_INTERVAL):
+    """Return a watcher for the given files and directory trees
+    - an InotifyWatcher when available, a PollingWatcher otherwise.
+    """
+    try:
+        return InotifyWatcher(paths)
+    except OSError:
+        return PollingWatcher(paths, interval=poll_interval)
+
+def watch(watcher, debounce=DEFAULT_DEBOUNCE):
+    """Yield the sets of the paths modified by bursts of modifications.
+
+    After a modification, further modifications are collected until
+    no modification happened for 'debounce' seconds.
+    """
+    while True:
+        changed = watcher.wait()
+        while True:
+            more = watcher.wait(timeout=debounce)
+            if not more:
+                break
+            changed |= more
+        yield changed
+
+## =========================================================
+## =========================================================
+
+## fin.
@@ -0,0 +1,176 @@
+## =========================================================
+## Copyright 2019 Dietrich Bollmann
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##      http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+## ---------------------------------------------------------
+
+"""newskylabs/temple/utils/flat_index.py:
+
+A flat index of nested dictionaries.
+
+The index maps the dotted path of every value of the nested
+dictionaries to the value:
+
+  {'author': {'first-name': 'Ada'}}
+
+is indexed as:
+
+  'author'            -> {'first-name': 'Ada'}
+  'author.first-name' -> 'Ada'
+  'author.first_name' -> 'Ada'
+
+Paths with hyphens are indexed in their underscore form as well - and
+looking up a path with hyphens falls back to its underscore form - so
+both forms can be used with the original settings and with the
+variables whose hyphens have been converted to underscores.
+
+Looking up a path takes a single dictionary lookup - instead of
+splitting the path and walking the nested dictionaries.
+
+The index is built lazily: the paths below a top-level key are only
+indexed when a path below this key is looked up first - so large
+data files cost nothing as long as they are not used in paths.
+
+"""
+
+from collections.abc import Mapping
+
+## =========================================================
+## class FlatIndex
+## ---------------------------------------------------------
+
+class FlatIndex(Mapping):
+    """An index mapping the dotted paths of the values of
+    nested dictionaries to the values.
+
+    The paths below a top-level key are indexed when a path below
+    this key is looked up first - later modifications of the indexed
+    dictionaries are not reflected by the index.
+    """
+
+    def __init__(self, dictionary):
+        """
+        """
+        self._dictionary = dictionary
+
+        # The indexed paths
+        self._paths = {}
+
+        # The top-level keys by their underscore forms
+        # - created when first needed
+        self._keys = None
+
+        # The underscore forms of the indexed top-level keys
+        self._indexed = set()
+
+    def _get_keys(self):
+        keys = self._keys
+        if keys is None:
+            keys = {}
+            for key in self._dictionary:
+
+                # Only string keys without dots can be part of a path
+                if isinstance(key, str) and '.' not in key:
+                    keys.setdefault(key.replace('-', '_'), []).append(key)
+
+            self._keys = keys
+        return keys
+
+    def _index(self, path):
+        """Index the paths below the top-level key of the given path.
+        """
+        top = path.split('.', 1)[0].replace('-', '_')
+        if top in self._indexed:
+            return
+        self._indexed.add(top)
+
+        paths = {}
+        underscore_paths = {}
+
+        # Walk the nested dictionaries without recursion.
+        # Every entry of the stack is the path prefix of a dictionary,
+        # the dictionary, and the ids of the dictionaries containing it
+        # - to stop at dictionaries containing themselves
+        dictionary = self._dictionary
+        stack = [('', {key: dictionary[key] for key in self._get_keys().get(top, ())},
+                  (id(dictionary),))]
+        while stack:
+            prefix, mapping, ancestors = stack.pop()
+            ancestors += (id(mapping),)
+
+            for key, value in mapping.items():
+
+                # Only string keys without dots can be part of a path
+                if not isinstance(key, str) or '.' in key:
+                    continue
+
+                path = prefix + key
+                paths[path] = value
+                if '-' in path:
+                    underscore_paths[path.replace('-', '_')] = value
+
+                if isinstance(value, Mapping) and id(value) not in ancestors:
+                    stack.append((path + '.', value, ancestors))
+
+        # The paths as they are
+        # take precedence over the underscore forms
+        for path, value in underscore_paths.items():
+            paths.setdefault(path, value)
+
+        self._paths.update(paths)
+
+    def _index_all(self):
+        for top in self._get_keys():
+            self._index(top)
+
+    def __getitem__(self, path):
+        self._index(path)
+        try:
+            return self._paths[path]
+        except KeyError:
+            if '-' in path:
+                return self._paths[path.replace('-', '_')]
+            raise
+
+    def get(self, path, default=None):
+        """Return the value of the given dotted path
+        - or 'default' when the path is not defined.
+        """
+        self._index(path)
+        value = self._paths.get(path, self)
+        if value is self:
+            if '-' in path:
+                return self._paths.get(path.replace('-', '_'), default)
+            return default
+        return value
+
+    def __contains__(self, path):
+        self._index(path)
+        return path in self._paths \
+            or ('-' in path and path.replace('-', '_') in self._paths)
+
+    def __iter__(self):
+        self._index_all()
+        return iter(self._paths)
+
+    def __len__(self):
+        self._index_all()
+        return len(self._paths)
+
+    def __repr__(self):
+        return '<FlatIndex of {} indexed paths>'.format(len(self._paths))
+
+## =========================================================
+## =========================================================
+
+## fin.
@@ -24,6 +24,21 @@ Generic utilities...
 ## Generic temple utilities
 ## ---------------------------------------------------------
 
+def merge_dicts(target, source):
+    """Recursively merge the dictionary 'source' into 'target'.
+    Values of 'source' overwrite the values of 'target' - with the
+    exception of dictionaries which are merged recursively.
+    Return 'target'.
+    """
+
+    for key, value in source.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            merge_dicts(target[key], value)
+        else:
+            target[key] = value
+
+    return target
+
 ## =========================================================
 ## =========================================================
 
@@ -0,0 +1,481 @@
+## =========================================================
+## Copyright 2019 Dietrich Bollmann
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##      http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+## ---------------------------------------------------------
+
+"""newskylabs/temple/utils/profiling.py:
+
+Profiling of the generation phases - see 'temple generate --profile'.
+
+The code generating a project marks its phases:
+
+  with profiling.phase('render'):
+      ...
+
+  with profiling.task(path):
+      ...
+
+While a Profiler is active, the wall and CPU time of every phase is
+recorded - in total and for each file (task) - and optionally the
+phases are kept as events of a Chrome trace timeline and the peak of
+the memory allocated while generating each file is measured with
+tracemalloc.
+
+For the phases given as 'latencies' of the Profiler, the duration of
+every call is counted in a histogram as well - for example the calls
+of each filter for 'temple generate --metrics-file'.
+
+The times of the phases are exclusive: the time spent in a phase
+nested in another phase - like the compilation of an included
+template while rendering - is only counted for the nested phase.
+
+While no Profiler is active, phase() and task() return a shared
+context manager doing nothing - the instrumentation costs a function
+call.
+
+"""
+
+import os
+import sys
+import json
+import time
+import bisect
+import functools
+import contextlib
+import tracemalloc
+
+from newskylabs.temple.defaults import DEFAULT_PROFILE_TOP
+
+## =========================================================
+## Profiling settings
+## ---------------------------------------------------------
+
+# The phases of a generation - in the order they are reported
+PHASES = [
+    'prepare',        # Loading the template tree and its index
+    'walk',           # Walking the template tree
+    'path-names',     # Rendering path names containing jinja delimiters
+    'environment',    # Creating the jinja2 environments
+    'load',           # Loading templates - from the bytecode cache or source
+    'compile',        # Compiling templates
+    'compile-string', # Compiling template strings - like path names
+    'render',         # Rendering templates
+    'filters',        # The html, latex and markdown filters
+    'write',          # Writing rendered files
+    'copy',           # Copying files
+    'analyse',        # Analysing the templates for later updates
+    'state',          # Saving the generation state
+]
+
+# The context manager used when no profiler is active
+_NULL = contextlib.nullcontext()
+
+# The active profiler
+_profiler = None
+
+# Resetting the peak of the traced memory needs python 3.9 -
+# with older versions the peak of a file is the peak so far
+_reset_peak = getattr(tracemalloc, 'reset_peak', lambda: None)
+
+## =========================================================
+## Instrumentation
+## ---------------------------------------------------------
+
+def phase(name, detail=None):
+    """Return a context manager recording the phase of the given name
+    - 'detail' is shown in the trace timeline.
+    """
+    if _profiler is None:
+        return _NULL
+    return _Phase(_profiler, name, detail)
+
+def task(path):
+    """Return a context manager recording the generation of
+    the file of the given template path.
+    """
+    if _profiler is None:
+        return _NULL
+    return _Task(_profiler, path)
+
+def profiled(name, detail, function):
+    """Return the given function recording its calls as the phase
+    of the given name - or the function itself when no profiler
+    is active.
+
+    The attributes of the function - like the jinja2 decorators
+    of filter functions - are kept.
+    """
+    if _profiler is None:
+        return function
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        with phase(name, detail):
+            return function(*args, **kwargs)
+
+    return wrapper
+
+def get_profiler():
+    """Return the active profiler - or None.
+    """
+    return _profiler
+
+def activate(profiler):
+    """Make the given profiler the active one and start it.
+    """
+    global _profiler
+    _profiler = profiler
+    profiler.start()
+
+def deactivate():
+    """Stop the active profiler.
+    """
+    global _profiler
+    if _profiler is not None:
+        _profiler.stop()
+        _profiler = None
+
+def merge(data):
+    """Merge the data collected by a worker process
+    into the active profiler.
+    """
+    if _profiler is not None and data:
+        _profiler.merge(data)
+
+## =========================================================
+## Phases and tasks
+## ---------------------------------------------------------
+
+class _Phase():
+    """A phase being recorded.
+    """
+
+    __slots__ = ('_profiler', '_name', '_detail', '_start', '_cpu',
+                 'child_wall', 'child_cpu')
+
+    def __init__(self, profiler, name, detail):
+        self._profiler = profiler
+        self._name     = name
+        self._detail   = detail
+
+    def __enter__(self):
+        self.child_wall = 0
+        self.child_cpu  = 0
+        self._profiler._stack.append(self)
+        self._cpu   = time.thread_time_ns()
+        self._start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        wall = time.perf_counter_ns() - self._start
+        cpu  = time.thread_time_ns() - self._cpu
+
+        profiler = self._profiler
+        stack = profiler._stack
+        stack.pop()
+
+        # The time of the phase is not counted for the enclosing phase
+        if stack:
+            stack[-1].child_wall += wall
+            stack[-1].child_cpu  += cpu
+
+        profiler._record_phase(self._name, self._detail, self._start, wall,
+                               wall - self.child_wall, cpu - self.child_cpu)
+        return False
+
+class _Task():
+    """The generation of a file being recorded.
+    """
+
+    __slots__ = ('_profiler', '_path', '_start', '_cpu', '_memory')
+
+    def __init__(self, profiler, path):
+        self._profiler = profiler
+        self._path     = path
+
+    def __enter__(self):
+        profiler = self._profiler
+        profiler._file = profiler._files.setdefault(
+            self._path, {'path': self._path, 'wall': 0, 'cpu': 0, 'peak': None, 'phases': {}})
+
+        if profiler.memory:
+            self._memory = tracemalloc.get_traced_memory()[0]
+            _reset_peak()
+
+        self._cpu   = time.thread_time_ns()
+        self._start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        wall = time.perf_counter_ns() - self._start
+        cpu  = time.thread_time_ns() - self._cpu
+
+        profiler = self._profiler
+        record = profiler._file
+        profiler._file = None
+
+        record['wall'] += wall
+        record['cpu']  += cpu
+        if profiler.memory:
+            peak = tracemalloc.get_traced_memory()[1] - self._memory
+            record['peak'] = max(record['peak'] or 0, peak)
+
+        if profiler.trace:
+            profiler._events.append(profiler._event(self._path, 'file', self._start, wall))
+        return False
+
+## =========================================================
+## class Profiler
+## ---------------------------------------------------------
+
+class Profiler():
+    """Records the time spent in the phases of a generation
+    - in total and for each file.
+
+    When 'trace' is True, the phases are kept as events of a Chrome
+    trace timeline - see save_trace().  When 'memory' is True, the
+    peak of the memory allocated while generating each file is
+    measured with tracemalloc.
+
+    'latencies' is an optional dictionary mapping phase names to the
+    upper bounds of histogram buckets in seconds: the durations of the
+    calls of these phases are counted in a histogram for each phase
+    detail - see get_histograms().
+    """
+
+    def __init__(self, trace=False, memory=False, latencies=None):
+        """
+        """
+        self.trace     = trace
+        self.memory    = memory
+        self.latencies = latencies or {}
+
+        self._stack  = []
+        self._file   = None
+        self._phases = {}
+        self._files  = {}
+        self._events = []
+
+        # The latency histograms:
+        # phase -> detail -> [bucket counts..., +Inf count, sum in seconds]
+        self._histograms = {}
+
+        self._wall = 0
+        self._cpu  = 0
+        self._started_tracemalloc = False
+
+    def get_options(self):
+        """Return the options used to create the profilers
+        of the worker processes.
+        """
+        return {'trace': self.trace, 'memory': self.memory, 'latencies': self.latencies}
+
+    def start(self):
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+
+        self._cpu_start  = time.process_time_ns()
+        self._wall_start = time.perf_counter_ns()
+
+    def stop(self):
+        self._wall += time.perf_counter_ns() - self._wall_start
+        self._cpu  += time.process_time_ns() - self._cpu_start
+
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+    ## -----------------------------------------------------
+    ## Recording
+    ## -----------------------------------------------------
+
+    def _event(self, name, category, start, wall):
+        """Return a complete event of the Chrome trace format.
+        """
+        # perf_counter() uses a system-wide monotonic clock on most
+        # platforms - so the events of the worker processes
+        # are on the same timeline
+        return {
+            'name': name,
+            'cat':  category,
+            'ph':   'X',
+            'ts':   start / 1000,
+            'dur':  wall / 1000,
+            'pid':  os.getpid(),
+            'tid':  0,
+        }
+
+    def _record_phase(self, name, detail, start, wall, self_wall, self_cpu):
+        totals = self._phases.get(name)
+        if totals is None:
+            totals = self._phases[name] = [0, 0, 0]
+        totals[0] += 1
+        totals[1] += self_wall
+        totals[2] += self_cpu
+
+        if self._file is not None:
+            phases = self._file['phases']
+            phases[name] = phases.get(name, 0) + self_wall
+
+        if name in self.latencies:
+            self._count_latency(name, detail, wall / 1e9)
+
+        if self.trace:
+            event = self._event(detail or name, name, start, wall)
+            if self._file is not None:
+                event['args'] = {'file': self._file['path']}
+            self._events.append(event)
+
+    def _count_latency(self, name, detail, seconds):
+        histograms = self._histograms.setdefault(name, {})
+        histogram = histograms.get(detail)
+        if histogram is None:
+            histogram = histograms[detail] = [0] * (len(self.latencies[name]) + 2)
+
+        # The first bucket with an upper bound >= the duration
+        # - or the +Inf bucket
+        histogram[bisect.bisect_left(self.latencies[name], seconds)] += 1
+        histogram[-1] += seconds
+
+    def collect(self):
+        """Return the data recorded since the last call and forget it
+        - used to pass the data of worker processes to the main process.
+        """
+        data = {'phases': self._phases, 'files': self._files, 'events': self._events,
+                'histograms': self._histograms}
+        self._phases = {}
+        self._files  = {}
+        self._events = []
+        self._histograms = {}
+        return data
+
+    def merge(self, data):
+        """Merge data returned by collect().
+        """
+        for name, (count, wall, cpu) in data['phases'].items():
+            totals = self._phases.setdefault(name, [0, 0, 0])
+            totals[0] += count
+            totals[1] += wall
+            totals[2] += cpu
+
+        for path, record in data['files'].items():
+            if path in self._files:
+                own = self._files[path]
+                own['wall'] += record['wall']
+                own['cpu']  += record['cpu']
+                if record['peak'] is not None:
+                    own['peak'] = max(own['peak'] or 0, record['peak'])
+                for name, wall in record['phases'].items():
+                    own['phases'][name] = own['phases'].get(name, 0) + wall
+            else:
+                self._files[path] = record
+
+        self._events.extend(data['events'])
+
+        for name, histograms in data['histograms'].items():
+            own = self._histograms.setdefault(name, {})
+            for detail, histogram in histograms.items():
+                if detail in own:
+                    own[detail] = [a + b for a, b in zip(own[detail], histogram)]
+                else:
+                    own[detail] = histogram
+
+    ## -----------------------------------------------------
+    ## Reporting
+    ## -----------------------------------------------------
+
+    def get_phases(self):
+        """Return a list of (phase, calls, wall, cpu) tuples
+        with the exclusive times of the phases in seconds.
+        """
+        names = [name for name in PHASES if name in self._phases] + \
+            sorted(name for name in self._phases if name not in PHASES)
+        return [(name, self._phases[name][0],
+                 self._phases[name][1] / 1e9, self._phases[name][2] / 1e9)
+                for name in names]
+
+    def get_calls(self, name):
+        """Return the number of calls of the given phase.
+        """
+        return self._phases[name][0] if name in self._phases else 0
+
+    def get_histograms(self, name):
+        """Return a dictionary mapping the details of the given phase
+        - for example the filter names - to (counts, sum) tuples:
+        the numbers of calls in the buckets given as 'latencies' of
+        the phase and in the last, +Inf bucket and the sum of their
+        durations in seconds.
+        """
+        return {detail: (histogram[:-1], histogram[-1])
+                for detail, histogram in self._histograms.get(name, {}).items()}
+
+    def get_files(self):
+        """Return the records of the files - the slowest first.
+        """
+        return sorted(self._files.values(), key=lambda record: record['wall'], reverse=True)
+
+    def print_report(self, top=DEFAULT_PROFILE_TOP, file=None):
+        """Print the times of the phases and the slowest templates.
+        """
+        file = file or sys.stdout
+
+        wall = self._wall / 1e9
+        cpu  = self._cpu / 1e9
+        files = self.get_files()
+
+        print('Profile: {:.3f} s wall, {:.3f} s CPU, {} files'.format(wall, cpu, len(files)),
+              file=file)
+        print('', file=file)
+
+        # The phases
+        print('  {:<14} {:>8} {:>10} {:>10} {:>7}'.format(
+            'phase', 'calls', 'wall (s)', 'cpu (s)', 'wall'), file=file)
+        for name, calls, phase_wall, phase_cpu in self.get_phases():
+            print('  {:<14} {:>8} {:>10.3f} {:>10.3f} {:>7.1%}'.format(
+                name, calls, phase_wall, phase_cpu, phase_wall / wall if wall else 0),
+                  file=file)
+
+        # The slowest templates
+        if files and top:
+            print('', file=file)
+            print('Slowest templates:', file=file)
+            print('', file=file)
+            print('  {:>10} {:>10} {:>10}  {}'.format(
+                'wall (ms)', 'cpu (ms)', 'peak (KB)', 'template'), file=file)
+            for record in files[:top]:
+                peak = '-' if record['peak'] is None else '{:.1f}'.format(record['peak'] / 1024)
+                phases = sorted(record['phases'].items(), key=lambda item: item[1], reverse=True)
+                print('  {:>10.2f} {:>10.2f} {:>10}  {}  ({})'.format(
+                    record['wall'] / 1e6, record['cpu'] / 1e6, peak, record['path'],
+                    ', '.join('{} {:.2f}'.format(name, phase_wall / 1e6)
+                              for name, phase_wall in phases[:3])), file=file)
+
+    def save_trace(self, trace_file):
+        """Save the recorded phases as Chrome trace-event json
+        - to be opened with chrome://tracing or https://ui.perfetto.dev
+        """
+        events = self._events
+
+        # Start the timeline at 0
+        origin = min((event['ts'] for event in events), default=0)
+        events = [dict(event, ts=event['ts'] - origin) for event in events]
+
+        with open(trace_file, 'w') as fh:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, fh)
+
+## =========================================================
+## =========================================================
+
+## fin.
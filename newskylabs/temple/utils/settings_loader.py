@@ -0,0 +1,227 @@
+## =========================================================
+## Copyright 2019 Dietrich Bollmann
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##      http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+## ---------------------------------------------------------
+
+"""newskylabs/temple/utils/settings_loader.py:
+
+Loading of the temple settings and of project data files.
+
+The settings are merged from a chain of settings files: the default
+settings, the user settings and optionally a project data file.
+Data files are yaml files - parsed with the libyaml C loader when
+available - or json files.
+
+Parsing large data files is expensive, so the merged settings of a
+chain of files are kept as a binary snapshot.  The snapshot is keyed
+by the paths, modification times and sizes of the files and reused as
+long as none of the files has changed.
+
+"""
+
+import os
+import sys
+import json
+import pickle
+import tempfile
+
+from hashlib import sha1
+from pathlib import Path
+
+from newskylabs.temple.defaults import JSON_EXTENSIONS
+from newskylabs.temple.utils.generic import merge_dicts
+
+## =========================================================
+## Settings loader settings
+## ---------------------------------------------------------
+
+# The directory of the settings snapshots
+SETTINGS_SNAPSHOT_DIR = Path.home() / '.newskylabs/temple/cache/settings'
+
+# Maximal number of settings snapshots
+# - the least recently written ones are removed first
+SETTINGS_SNAPSHOT_MAX_ENTRIES = 64
+
+# Extension of the snapshot files
+_SNAPSHOT_EXTENSION = '.pickle'
+
+# Version of the snapshot format:
+# snapshots of other versions are ignored
+_SNAPSHOT_FORMAT_VERSION = 1
+
+## =========================================================
+## Data files
+## ---------------------------------------------------------
+
+def load_data_file(data_file):
+    """Parse the given yaml or json data file
+    and return its data.
+    """
+    data_file = str(data_file)
+
+    if os.path.splitext(data_file)[1].lower() in JSON_EXTENSIONS:
+        with open(data_file, 'rb') as fh:
+            return json.load(fh)
+
+    # yaml is only imported when a yaml file has to be parsed
+    # - the settings are usually loaded from a snapshot
+    import yaml
+
+    # Use the libyaml C loader when available
+    loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+    with open(data_file, 'rb') as fh:
+        return yaml.load(fh, Loader=loader)
+
+def _file_stamp(data_file):
+    """Return the stamp of a data file identifying its version:
+    its modification time and size - or None when it does not exist.
+    """
+    try:
+        stat = os.stat(data_file)
+    except OSError:
+        return None
+
+    return [stat.st_mtime_ns, stat.st_size]
+
+def load_merged_data_files(data_files, snapshot_dir=SETTINGS_SNAPSHOT_DIR):
+    """Return the data of the given data files merged in the given order.
+    Files which do not exist are skipped.
+
+    The merged data is kept as snapshot in 'snapshot_dir' - or not at
+    all when 'snapshot_dir' is None.
+    """
+    data_files = [os.path.abspath(os.path.expanduser(str(data_file)))
+                  for data_file in data_files]
+
+    # The snapshot of the data files
+    # in their current version
+    snapshot_file = None
+    if snapshot_dir is not None:
+        key = json.dumps([_SNAPSHOT_FORMAT_VERSION, sys.version_info[:2],
+                          [[data_file, _file_stamp(data_file)] for data_file in data_files]])
+        snapshot_dir = Path(snapshot_dir).expanduser()
+        snapshot_file = snapshot_dir / (sha1(key.encode('utf-8')).hexdigest() + _SNAPSHOT_EXTENSION)
+
+        try:
+            with open(str(snapshot_file), 'rb') as fh:
+                return pickle.load(fh)
+
+        except Exception:
+            # Missing or unreadable snapshot:
+            # parse the data files
+            pass
+
+    # Merge the data files
+    data = {}
+    for data_file in data_files:
+        if not os.path.isfile(data_file):
+            continue
+        file_data = load_data_file(data_file)
+        if isinstance(file_data, dict):
+            merge_dicts(data, file_data)
+
+    if snapshot_file is not None:
+        _save_snapshot(snapshot_file, data)
+
+    return data
+
+def _save_snapshot(snapshot_file, data):
+    """Save the snapshot of merged data
+    and remove the oldest snapshots.
+    """
+    snapshot_dir = snapshot_file.parent
+    try:
+        snapshot_dir.mkdir(parents=True, exist_ok=True)
+
+        # Write to a temporary file first
+        # and rename it afterwards
+        fd, tmp_path = tempfile.mkstemp(dir=str(snapshot_dir), suffix='.tmp')
+
+    except OSError:
+        # The snapshots are an optimization only
+        return
+
+    try:
+        with os.fdopen(fd, 'wb') as fh:
+            pickle.dump(data, fh, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, str(snapshot_file))
+
+    except (OSError, pickle.PicklingError):
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        return
+
+    # Remove the oldest snapshots
+    snapshot_files = _snapshot_files(snapshot_dir)
+    if len(snapshot_files) > SETTINGS_SNAPSHOT_MAX_ENTRIES:
+        snapshot_files.sort(key=lambda path: path.stat().st_mtime)
+        for path in snapshot_files[:-SETTINGS_SNAPSHOT_MAX_ENTRIES]:
+            try:
+                path.unlink()
+            except OSError:
+                pass
+
+def _snapshot_files(snapshot_dir):
+    return list(Path(snapshot_dir).expanduser().glob('*' + _SNAPSHOT_EXTENSION))
+
+def settings_snapshot_stats(snapshot_dir=SETTINGS_SNAPSHOT_DIR):
+    """Return a dictionary with statistics about the settings snapshots.
+    """
+    snapshot_files = _snapshot_files(snapshot_dir)
+    return {
+        'directory': str(Path(snapshot_dir).expanduser()),
+        'entries':   len(snapshot_files),
+        'size':      sum(snapshot_file.stat().st_size for snapshot_file in snapshot_files),
+    }
+
+def clear_settings_snapshots(snapshot_dir=SETTINGS_SNAPSHOT_DIR):
+    """Remove all settings snapshots.
+    """
+    for snapshot_file in _snapshot_files(snapshot_dir):
+        try:
+            snapshot_file.unlink()
+        except OSError:
+            pass
+
+## =========================================================
+## class TempleSettings
+## ---------------------------------------------------------
+
+class TempleSettings():
+    """The temple settings merged from a chain of settings files
+    - the later files overwriting the earlier ones.
+    """
+
+    def __init__(self, *settings_files, snapshot_dir=SETTINGS_SNAPSHOT_DIR):
+        """
+        """
+        self._snapshot_dir = snapshot_dir
+        self._settings = load_merged_data_files(settings_files, snapshot_dir=snapshot_dir)
+
+    def merge_settings_file(self, settings_file):
+        """Merge the given settings file into the settings.
+        """
+        data = load_merged_data_files([settings_file], snapshot_dir=self._snapshot_dir)
+        merge_dicts(self._settings, data)
+
+    def get_settings(self):
+        return self._settings
+
+## =========================================================
+## =========================================================
+
+## fin.
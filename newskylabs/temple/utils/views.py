@@ -0,0 +1,471 @@
+## =========================================================
+## Copyright 2019 Dietrich Bollmann
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##      http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+## ---------------------------------------------------------
+
+"""newskylabs/temple/utils/views.py:
+
+Copy-on-write views of nested dictionaries and lists.
+
+Templates can modify the variables they are rendered with - for
+example with the 'do' statement:
+
+  {% do navigation.append('a string') %}
+
+So that every template is rendered with its own variables - without
+copying all variables for every file - the templates get
+copy-on-write views of the variables: a view reads the wrapped
+dictionary or list until it is modified; then it copies the entries
+of its own level and modifies the copy.  The wrapped dictionaries and
+lists are never modified.
+
+The views of nested dictionaries and lists are created when first
+accessed and kept - so the modifications of a nested list are seen
+by all later accesses through the same view.
+
+Read-only views raise a TypeError when they are modified.
+
+The views of hyphen_to_underscore_view() translate the keys of the
+dictionaries as well: the hyphens of the keys are converted to
+underscores - like hyphen_to_underscore_in_keys() does - without
+copying the settings.
+
+The views behave like the dictionaries and lists they wrap: they are
+printed, compared and - with json_default() - serialized the same
+way.
+
+"""
+
+from collections.abc import Mapping, MutableMapping, MutableSequence
+
+## =========================================================
+## class _ViewContext
+## ---------------------------------------------------------
+
+class _ViewContext():
+    """The settings shared by the views of the same variables.
+    """
+
+    __slots__ = ['read_only', 'translate', 'key_tables']
+
+    def __init__(self, read_only=False, translate=False, key_tables=None):
+        self.read_only = read_only
+        self.translate = translate
+
+        # The translated keys of the dictionaries by their ids
+        # - see _key_table()
+        self.key_tables = {} if key_tables is None else key_tables
+
+    def derive(self, read_only):
+        """Return a context translating the keys the same way
+        and sharing the key tables.
+        """
+        return _ViewContext(read_only, self.translate, self.key_tables)
+
+def _key_table(dictionary, context):
+    """Return the table mapping the translated keys of the given
+    dictionary to its keys - or None when no key contains a hyphen.
+
+    As with hyphen_to_underscore_in_keys() the position of a
+    translated key is the one of its first key and its value the one
+    of its last key - when two keys only differ in hyphens and
+    underscores.
+
+    The tables are built once for all views of the same variables;
+    the table keeps its dictionary - so its id is not reused.
+    """
+    entry = context.key_tables.get(id(dictionary))
+    if entry is not None and entry[0] is dictionary:
+        return entry[1]
+
+    table = None
+    if any(isinstance(key, str) and '-' in key for key in dictionary):
+        table = {}
+        for key in dictionary:
+            if isinstance(key, str):
+                table[key.replace('-', '_')] = key
+            else:
+                table[key] = key
+
+    context.key_tables[id(dictionary)] = (dictionary, table)
+    return table
+
+## =========================================================
+## class _View
+## ---------------------------------------------------------
+
+class _View():
+    """Base class of the views.
+
+    The views have no public attributes beyond the ones of
+    dictionaries and lists - which would hide the keys of the same
+    name in jinja2 templates.
+    """
+
+    __slots__ = ['_source', '_context', '_views', '_copy']
+
+    def __init__(self, source, context):
+        self._source  = source
+        self._context = context
+
+        # The views of the nested dictionaries and lists
+        # by their keys or indices
+        self._views = {}
+
+        # The modified copy of the entries - once modified
+        self._copy = None
+
+    def _view(self, key, value):
+        """Return the view of the given value found under the given key
+        - or the value itself when it is neither a dictionary nor a list.
+        """
+        view = self._views.get(key)
+        if view is not None:
+            return view
+
+        if isinstance(value, dict):
+            view = MappingView(value, self._context)
+        elif isinstance(value, list):
+            view = SequenceView(value, self._context)
+        elif isinstance(value, tuple):
+            view = tuple(SequenceView(list(value), self._context))
+        else:
+            return value
+
+        self._views[key] = view
+        return view
+
+    def _modifiable(self):
+        """Return the copy of the entries to modify
+        - copying them when modified first.
+        """
+        if self._context.read_only:
+            raise TypeError('{} is read-only'.format(self.__class__.__name__))
+
+        if self._copy is None:
+            self._copy = self._entries()
+        return self._copy
+
+    def __reduce__(self):
+        context = self._context
+        if self._copy is None:
+            return (_restore_view,
+                    (self.__class__, self._source, context.read_only, context.translate))
+
+        # The keys of the copy are translated already
+        return (_restore_view, (self.__class__, self._copy, context.read_only, False))
+
+def _restore_view(view_class, source, read_only, translate):
+    return view_class(source, _ViewContext(read_only, translate))
+
+## =========================================================
+## class MappingView
+## ---------------------------------------------------------
+
+class MappingView(_View, MutableMapping):
+    """A copy-on-write view of a dictionary.
+    """
+
+    __slots__ = ['_keys']
+
+    def __init__(self, source, context):
+        _View.__init__(self, source, context)
+
+        # The translated keys - None when the keys are not translated
+        self._keys = _key_table(source, context) if context.translate else None
+
+    def _entries(self):
+        return {key: self[key] for key in self}
+
+    def __getitem__(self, key):
+        if self._copy is not None:
+            return self._copy[key]
+
+        keys = self._keys
+        if keys is None:
+            return self._view(key, self._source[key])
+        return self._view(key, self._source[keys[key]])
+
+    def __contains__(self, key):
+        if self._copy is not None:
+            return key in self._copy
+        if self._keys is not None:
+            return key in self._keys
+        return key in self._source
+
+    def __iter__(self):
+        if self._copy is not None:
+            return iter(self._copy)
+        if self._keys is not None:
+            return iter(self._keys)
+        return iter(self._source)
+
+    def __len__(self):
+        if self._copy is not None:
+            return len(self._copy)
+        if self._keys is not None:
+            return len(self._keys)
+        return len(self._source)
+
+    def __setitem__(self, key, value):
+        self._modifiable()[key] = value
+
+    def __delitem__(self, key):
+        del self._modifiable()[key]
+
+    # The modifications of dictionaries
+    def clear(self):
+        self._modifiable().clear()
+
+    def pop(self, *args):
+        return self._modifiable().pop(*args)
+
+    def popitem(self):
+        return self._modifiable().popitem()
+
+    def setdefault(self, key, default=None):
+        return self._modifiable().setdefault(key, default)
+
+    def update(self, *args, **kwargs):
+        self._modifiable().update(*args, **kwargs)
+
+    # The dictionary views are the ones of a dictionary
+    # - so they are printed the same way
+    def keys(self):
+        return self._entries().keys()
+
+    def values(self):
+        return self._entries().values()
+
+    def items(self):
+        return self._entries().items()
+
+    def copy(self):
+        return self._entries()
+
+    def __reversed__(self):
+        return reversed(self._entries())
+
+    def __eq__(self, other):
+        if isinstance(other, Mapping):
+            return self._entries() == dict(other.items())
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(self._entries())
+
+## =========================================================
+## class SequenceView
+## ---------------------------------------------------------
+
+class SequenceView(_View, MutableSequence):
+    """A copy-on-write view of a list.
+    """
+
+    __slots__ = []
+
+    def _entries(self):
+        return [self[index] for index in range(len(self._source))]
+
+    def __getitem__(self, index):
+        if self._copy is not None:
+            return self._copy[index]
+
+        source = self._source
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(source)))]
+
+        value = source[index]
+        if index < 0:
+            index += len(source)
+        return self._view(index, value)
+
+    def __len__(self):
+        if self._copy is not None:
+            return len(self._copy)
+        return len(self._source)
+
+    def __iter__(self):
+        # Like the iterator of a list:
+        # the entries appended while iterating are iterated as well
+        index = 0
+        while index < len(self):
+            yield self[index]
+            index += 1
+
+    def __setitem__(self, index, value):
+        self._modifiable()[index] = value
+
+    def __delitem__(self, index):
+        del self._modifiable()[index]
+
+    # The modifications of lists
+    def insert(self, index, value):
+        self._modifiable().insert(index, value)
+
+    def append(self, value):
+        self._modifiable().append(value)
+
+    def extend(self, values):
+        self._modifiable().extend(values)
+
+    def pop(self, index=-1):
+        return self._modifiable().pop(index)
+
+    def remove(self, value):
+        self._modifiable().remove(value)
+
+    def clear(self):
+        self._modifiable().clear()
+
+    def reverse(self):
+        self._modifiable().reverse()
+
+    def sort(self, *, key=None, reverse=False):
+        self._modifiable().sort(key=key, reverse=reverse)
+
+    def __iadd__(self, values):
+        self.extend(values)
+        return self
+
+    def __imul__(self, count):
+        entries = self._modifiable()
+        entries *= count
+        return self
+
+    # The operations returning new lists
+    def copy(self):
+        return list(self)
+
+    def __add__(self, other):
+        if isinstance(other, (list, SequenceView)):
+            return list(self) + list(other)
+        return NotImplemented
+
+    def __radd__(self, other):
+        if isinstance(other, list):
+            return other + list(self)
+        return NotImplemented
+
+    def __mul__(self, count):
+        return list(self) * count
+
+    __rmul__ = __mul__
+
+    # Lists are compared with lists only
+    def _compare(self, other, compare):
+        if isinstance(other, (list, SequenceView)):
+            return compare(list(self), list(other))
+        return NotImplemented
+
+    def __eq__(self, other):
+        return self._compare(other, lambda a, b: a == b)
+
+    def __lt__(self, other):
+        return self._compare(other, lambda a, b: a < b)
+
+    def __le__(self, other):
+        return self._compare(other, lambda a, b: a <= b)
+
+    def __gt__(self, other):
+        return self._compare(other, lambda a, b: a > b)
+
+    def __ge__(self, other):
+        return self._compare(other, lambda a, b: a >= b)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(list(self))
+
+## =========================================================
+## Views
+## ---------------------------------------------------------
+
+def _new_view(dictionary, read_only):
+    """Return a new view of the given dictionary - or of the
+    dictionary wrapped by the given view, translating its keys the
+    same way.
+    """
+    if isinstance(dictionary, MappingView):
+        if dictionary._copy is None:
+            return MappingView(dictionary._source, dictionary._context.derive(read_only))
+
+        # The keys of a modified view are translated already
+        dictionary = to_plain(dictionary)
+
+    return MappingView(dictionary, _ViewContext(read_only))
+
+def copy_on_write(dictionary):
+    """Return a copy-on-write view of the given dictionary - or of
+    the dictionary wrapped by the given view.
+
+    The modifications of the returned view are not seen by the
+    dictionary and by the other views of the dictionary.
+    """
+    return _new_view(dictionary, read_only=False)
+
+def read_only(dictionary):
+    """Return a read-only view of the given dictionary - or of the
+    dictionary wrapped by the given view.
+    """
+    return _new_view(dictionary, read_only=True)
+
+def hyphen_to_underscore_view(dictionary):
+    """Return a read-only view of the given dictionary converting
+    the hyphens in the keys of all nested dictionaries to underscores
+    - like hyphen_to_underscore_in_keys() but without copying the
+    dictionary.
+
+    The copy-on-write and read-only views of the returned view
+    translate the keys as well.
+    """
+    return MappingView(dictionary, _ViewContext(read_only=True, translate=True))
+
+## =========================================================
+## Serialization
+## ---------------------------------------------------------
+
+def to_plain(value):
+    """Return the given value with all views replaced
+    by the dictionaries and lists they stand for.
+    """
+    if isinstance(value, MappingView):
+        return {key: to_plain(item) for key, item in value.items()}
+    if isinstance(value, SequenceView):
+        return [to_plain(item) for item in value]
+    if isinstance(value, dict):
+        return {key: to_plain(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return type(value)(to_plain(item) for item in value)
+    return value
+
+def json_default(value):
+    """The 'default' function used to serialize values to json
+    which cannot be serialized otherwise:
+    the views are serialized like the dictionaries and lists they
+    stand for, other values as strings.
+    """
+    if isinstance(value, MappingView):
+        return value.copy()
+    if isinstance(value, SequenceView):
+        return value.copy()
+    return str(value)
+
+## =========================================================
+## =========================================================
+
+## fin.
@@ -0,0 +1,128 @@
+## =========================================================
+## Copyright 2019 Dietrich Bollmann
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##      http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+## ---------------------------------------------------------
+
+"""tests/test_bytecode_cache.py:
+
+The bytecode cache storing the compiled templates on disk.
+
+"""
+
+import os
+import time
+
+from newskylabs.temple.templates.cache import TempleBytecodeCache
+from newskylabs.temple.templates.jinja import EnvironmentRegistry
+
+## =========================================================
+## Utilities
+## ---------------------------------------------------------
+
+def cached_bucket(cache, template_dir, name, profile='default'):
+    """Return the cache bucket of the given template
+    - as loaded by a fresh environment.
+    """
+    registry = EnvironmentRegistry(template_dir, bytecode_cache=cache)
+    env = registry.get_environment(profile)
+    filename = os.path.join(str(template_dir), name)
+    with open(filename) as fh:
+        source = fh.read()
+    return cache.get_bucket(env, name, filename, source)
+
+def compile_template(cache, template_dir, name, profile='default'):
+    """Compile the given template with a fresh environment
+    using the given cache and return the rendered template.
+    """
+    registry = EnvironmentRegistry(template_dir, bytecode_cache=cache)
+    return registry.get_environment(profile).get_template(name).render(name='temple')
+
+## =========================================================
+## Tests
+## ---------------------------------------------------------
+
+def test_compiled_templates_are_reused(tmp_path):
+    template_dir = tmp_path / 'templates'
+    template_dir.mkdir()
+    (template_dir / 'a.txt').write_text('Hello {{ name }}\n')
+
+    cache = TempleBytecodeCache(tmp_path / 'cache')
+    assert cached_bucket(cache, template_dir, 'a.txt').code is None
+
+    assert compile_template(cache, template_dir, 'a.txt') == 'Hello temple\n'
+    assert cache.stats()['entries'] == 1
+
+    # A fresh environment loads the compiled template
+    assert cached_bucket(cache, template_dir, 'a.txt').code is not None
+    assert compile_template(cache, template_dir, 'a.txt') == 'Hello temple\n'
+    assert cache.stats()['entries'] == 1
+
+def test_modified_templates_are_compiled_again(tmp_path):
+    template_dir = tmp_path / 'templates'
+    template_dir.mkdir()
+    (template_dir / 'a.txt').write_text('Hello {{ name }}\n')
+
+    cache = TempleBytecodeCache(tmp_path / 'cache')
+    compile_template(cache, template_dir, 'a.txt')
+
+    # The key contains the hash of the source
+    (template_dir / 'a.txt').write_text('Bye {{ name }}\n')
+    assert cached_bucket(cache, template_dir, 'a.txt').code is None
+    assert compile_template(cache, template_dir, 'a.txt') == 'Bye temple\n'
+    assert cache.stats()['entries'] == 2
+
+    # ...and the delimiter profile of the environment
+    assert cached_bucket(cache, template_dir, 'a.txt', profile='latex').code is None
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    template_dir = tmp_path / 'templates'
+    template_dir.mkdir()
+    names = ['a.txt', 'b.txt', 'c.txt']
+    for name in names:
+        (template_dir / name).write_text('{} {{{{ name }}}}\n'.format(name))
+
+    cache_dir = tmp_path / 'cache'
+    cache = TempleBytecodeCache(cache_dir)
+    for name in names:
+        compile_template(cache, template_dir, name)
+
+    # Age the entries: a.txt is the oldest
+    entries = {}
+    now = time.time()
+    for name, age in zip(names, [300, 200, 100]):
+        path = str(cache_dir / '{}.cache'.format(cached_bucket(cache, template_dir, name).key))
+        os.utime(path, (now - age, now - age))
+        entries[name] = path
+
+    # Using a.txt makes b.txt the least recently used entry
+    cached_bucket(cache, template_dir, 'a.txt')
+
+    sizes = [os.path.getsize(path) for path in entries.values()]
+    cache = TempleBytecodeCache(cache_dir, max_size=sum(sizes) - 1)
+    assert cache.prune() == 1
+
+    assert os.path.exists(entries['a.txt'])
+    assert not os.path.exists(entries['b.txt'])
+    assert os.path.exists(entries['c.txt'])
+
+    # The cache is within its bounds now
+    assert cache.prune() == 0
+
+    cache.clear()
+    assert cache.stats()['entries'] == 0
+
+## =========================================================
+## =========================================================
+
+## fin.
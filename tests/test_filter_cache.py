@@ -0,0 +1,87 @@
+## =========================================================
+## Copyright 2019 Dietrich Bollmann
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##      http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+## ---------------------------------------------------------
+
+"""tests/test_filter_cache.py:
+
+The cache of the results of the html, latex and markdown filters.
+
+"""
+
+import pickle
+
+from newskylabs.temple.templates.cache import FilterCache
+
+## =========================================================
+## Utilities
+## ---------------------------------------------------------
+
+TEXT = 'Written by <temple var="author.name"/>'
+
+def make_variables(name='Ada Lovelace', company='NewSkyLabs'):
+    return {'author': {'name': name}, 'company': company}
+
+## =========================================================
+## Tests
+## ---------------------------------------------------------
+
+def test_hits_and_misses(tmp_path):
+    cache = FilterCache(tmp_path)
+
+    assert cache.get('html', TEXT, make_variables()) is None
+    cache.put('html', TEXT, make_variables(), ['author.name'], 'Written by Ada Lovelace')
+
+    # Only the values of the dereferenced paths count
+    assert cache.get('html', TEXT, make_variables()) == 'Written by Ada Lovelace'
+    assert cache.get('html', TEXT, make_variables(company='Other')) \
+        == 'Written by Ada Lovelace'
+    assert cache.get('html', TEXT, make_variables(name='Grace Hopper')) is None
+
+    # The filter name is part of the key
+    assert cache.get('latex', TEXT, make_variables()) is None
+
+    assert cache.counters() == {'hits': 2, 'misses': 3}
+
+def test_results_are_kept_on_disk(tmp_path):
+    cache = FilterCache(tmp_path)
+    cache.put('html', TEXT, make_variables(), ['author.name'], 'Written by Ada Lovelace')
+    cache.flush()
+
+    # A fresh cache - and a pickled one as used by worker processes
+    for other in [FilterCache(tmp_path), pickle.loads(pickle.dumps(cache))]:
+        assert other.get('html', TEXT, make_variables()) == 'Written by Ada Lovelace'
+        other.flush()
+
+    stats = FilterCache(tmp_path).stats()
+    assert stats['entries'] == 1
+    assert stats['hits'] == 2
+
+def test_corrupted_database_is_replaced(tmp_path):
+    (tmp_path / 'filters.sqlite').write_bytes(b'not a sqlite database' * 100)
+
+    cache = FilterCache(tmp_path)
+    assert cache.get('html', TEXT, make_variables()) is None
+
+    cache.put('html', TEXT, make_variables(), ['author.name'], 'Written by Ada Lovelace')
+    cache.flush()
+
+    assert FilterCache(tmp_path).get('html', TEXT, make_variables()) \
+        == 'Written by Ada Lovelace'
+    assert FilterCache(tmp_path).stats()['entries'] == 1
+
+## =========================================================
+## =========================================================
+
+## fin.
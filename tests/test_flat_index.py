@@ -0,0 +1,149 @@
+## =========================================================
+## Copyright 2019 Dietrich Bollmann
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##      http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+## ---------------------------------------------------------
+
+"""tests/test_flat_index.py:
+
+The flat index of the variables.
+
+"""
+
+import pytest
+
+from newskylabs.temple.templates.engine import TemplateEngine
+from newskylabs.temple.templates.jinja import EnvironmentRegistry, template_variables
+from newskylabs.temple.utils.flat_index import FlatIndex
+from newskylabs.temple.utils.views import hyphen_to_underscore_view, read_only
+
+## =========================================================
+## Utilities
+## ---------------------------------------------------------
+
+class Settings():
+    """Settings given as dictionary.
+    """
+
+    def __init__(self, settings):
+        self._settings = settings
+
+    def get_settings(self):
+        return self._settings
+
+def render(template, variables):
+    registry = EnvironmentRegistry('/templates')
+    return registry.get_environment().from_string(template).render(**variables)
+
+def make_variables():
+    """Return the variables and their flat index
+    - prepared like by the template engine.
+    """
+    variables = hyphen_to_underscore_view({'demo': {'nav': ['a', 'b'], 'first-page': 'home'}})
+    return variables, FlatIndex(read_only(variables))
+
+## =========================================================
+## Tests
+## ---------------------------------------------------------
+
+def test_lookup():
+    index = FlatIndex({
+        'author':  {'first-name': 'Ada', 'address': {'zip-code': '12345'}},
+        'company': 'NewSkyLabs',
+    })
+
+    assert index['company'] == 'NewSkyLabs'
+    assert index['author']['first-name'] == 'Ada'
+    assert index['author.address.zip-code'] == '12345'
+
+    # Paths with hyphens and underscores
+    assert index['author.first-name'] == 'Ada'
+    assert index['author.first_name'] == 'Ada'
+    assert index.get('author.address.zip_code') == '12345'
+    assert 'author.first_name' in index
+
+def test_undefined_paths():
+    index = FlatIndex({'author': {'first-name': 'Ada'}})
+
+    assert index.get('author.email') is None
+    assert index.get('author.email', 'none') == 'none'
+    assert index.get('unknown.path', 'none') == 'none'
+    assert 'author.email' not in index
+    with pytest.raises(KeyError):
+        index['author.email']
+
+def test_paths_as_they_are_take_precedence():
+    index = FlatIndex({'a': {'b-c': 'hyphen', 'b_c': 'underscore'}})
+
+    assert index['a.b-c'] == 'hyphen'
+    assert index['a.b_c'] == 'underscore'
+
+def test_recursive_dictionaries():
+    dictionary = {'name': 'loop'}
+    dictionary['self'] = dictionary
+    index = FlatIndex({'top': dictionary})
+
+    # The walk stops at the dictionaries containing themselves
+    assert index['top.name'] == 'loop'
+    assert index['top.self'] is dictionary
+    assert 'top.self.name' not in index
+
+def test_get_setting_falls_back_to_the_default_settings(tmp_path):
+    engine = TemplateEngine('demo-project', 'demo', Settings({
+        'author': {'first-name': 'Ada', 'family-name': 'Lovelace'},
+        'demo-project': {
+            'template-dir': str(tmp_path),
+            'project-dir':  str(tmp_path),
+        },
+    }))
+
+    # The user settings
+    assert engine.get_setting('author.first-name') == 'Ada'
+    assert engine.get_setting('author.first_name') == 'Ada'
+    assert engine.get_setting('author.name') == 'Ada Lovelace'
+    assert engine.get_setting('project.name') == 'demo'
+
+    # The default settings
+    assert engine.get_setting('company') == 'NewSkyLabs'
+    assert engine.get_setting('author.email') == 'new.sky@newskylabs.net'
+    assert engine.get_setting('filter-cache.memory-entries') == 4096
+
+    # Neither
+    assert engine.get_setting('undefined.setting') is None
+
+def test_index_keeps_the_original_values():
+    """The index is shared by all templates:
+    the modifications of a template are not seen by the index.
+    """
+    variables, index = make_variables()
+    template = '{% do demo.nav.append("x") %}{{ demo.nav }} {{ temple.index["demo.nav"] }}'
+
+    # Rendering the template twice:
+    # the modification of the first rendering is seen by neither
+    for _ in range(2):
+        output = render(template, template_variables('demo.txt', variables, index=index))
+        assert output == "['a', 'b', 'x'] ['a', 'b']"
+
+    assert index['demo.first-page'] == 'home'
+
+def test_index_values_are_read_only():
+    variables, index = make_variables()
+    template = '{% do temple.index["demo.nav"].append("x") %}'
+
+    with pytest.raises(TypeError):
+        render(template, template_variables('demo.txt', variables, index=index))
+
+## =========================================================
+## =========================================================
+
+## fin.
@@ -0,0 +1,93 @@
+## =========================================================
+## Copyright 2019 Dietrich Bollmann
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##      http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+## ---------------------------------------------------------
+
+"""tests/test_markdown.py:
+
+The markdown filter and its extension settings.
+
+"""
+
+import pytest
+
+from newskylabs.temple.templates.engine import TemplateEngine, TempleException
+from newskylabs.temple.templates.filters.markdown import MarkdownSettingsError
+
+## =========================================================
+## Utilities
+## ---------------------------------------------------------
+
+class Settings():
+    """Settings given as dictionary.
+    """
+
+    def __init__(self, settings):
+        self._settings = settings
+
+    def get_settings(self):
+        return self._settings
+
+def generate(tmp_path, extensions, jobs=1):
+    """Generate a project rendering markdown
+    with the given extensions - and return the rendered page.
+    """
+    template_dir = tmp_path / 'templates'
+    template_dir.mkdir(exist_ok=True)
+    (template_dir / 'README.md').write_text('# {{ project.name }}\n')
+    (template_dir / 'page.html').write_text('{{ "# Title\\n\\ntext" | markdown }}\n')
+
+    project_dir = tmp_path / 'project-{}'.format(len(list(tmp_path.iterdir())))
+    engine = TemplateEngine('demo-project', 'demo', Settings({
+        'author': {'first-name': 'Ada', 'family-name': 'Lovelace'},
+        'markdown': {'extensions': extensions},
+        'demo-project': {
+            'template-dir': str(template_dir),
+            'project-dir':  str(project_dir),
+        },
+    }))
+    engine.generate(verbose=False, jobs=jobs)
+    return (project_dir / 'demo' / 'demo.git' / 'page.html').read_text()
+
+## =========================================================
+## Tests
+## ---------------------------------------------------------
+
+def test_extensions(tmp_path):
+    assert generate(tmp_path, []) == '<h1>Title</h1>\n<p>text</p>\n'
+    assert generate(tmp_path, ['markdown.extensions.toc']) \
+        == '<h1 id="title">Title</h1>\n<p>text</p>\n'
+
+@pytest.mark.parametrize('jobs', [1, 2])
+@pytest.mark.parametrize('extensions, setting', [
+    (['markdown.extensions.toc', {'toc': {'permalink': True}}], 'markdown.extensions[1]'),
+    ('markdown.extensions.toc',                                 'markdown.extensions'),
+    ({'toc': {}},                                               'markdown.extensions'),
+    (['markdown.extensions.unknown'],                           'markdown.extensions'),
+])
+def test_invalid_extensions(tmp_path, extensions, setting, jobs):
+    """Invalid extension settings are reported
+    - naming the invalid entry.
+    """
+    with pytest.raises(TempleException) as info:
+        generate(tmp_path, extensions, jobs=jobs)
+
+    assert isinstance(info.value, MarkdownSettingsError)
+    assert info.value.setting == setting
+    assert info.value.message.startswith("Invalid setting '{}': ".format(setting))
+
+## =========================================================
+## =========================================================
+
+## fin.
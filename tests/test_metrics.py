@@ -0,0 +1,172 @@
+## =========================================================
+## Copyright 2019 Dietrich Bollmann
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##      http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+## ---------------------------------------------------------
+
+"""tests/test_metrics.py:
+
+The statistics of a generation written as Prometheus textfile.
+
+"""
+
+import re
+
+import pytest
+
+from newskylabs.temple.templates import metrics
+from newskylabs.temple.templates.engine import TemplateEngine
+from newskylabs.temple.templates.metrics import MetricsObserver, get_latencies
+from newskylabs.temple.utils.profiling import Profiler
+
+## =========================================================
+## Utilities
+## ---------------------------------------------------------
+
+# A sample line of the text exposition format
+SAMPLE_LINE = re.compile(r'^(?P<name>[a-zA-Z_:][a-zA-Z0-9_:]*)'
+                         r'(?:\{(?P<labels>[^}]*)\})? '
+                         r'(?P<value>\S+)$')
+LABEL = re.compile(r'(?P<name>[a-zA-Z_][a-zA-Z0-9_]*)="(?P<value>(?:[^"\\]|\\.)*)"(?:,|$)')
+
+class Settings():
+    """Settings given as dictionary.
+    """
+
+    def __init__(self, settings):
+        self._settings = settings
+
+    def get_settings(self):
+        return self._settings
+
+def parse_metrics(text):
+    """Parse a Prometheus textfile - checking its format.
+
+    Return a dictionary mapping the metric names to their type
+    and their (name, labels, value) samples.
+    """
+    assert text.endswith('\n')
+
+    parsed = {}
+    metric = None
+    for line in text.splitlines():
+        if line.startswith('# HELP '):
+            metric = line.split(' ')[2]
+            assert metric not in parsed
+            parsed[metric] = {'type': None, 'samples': []}
+        elif line.startswith('# TYPE '):
+            name, type = line.split(' ')[2:]
+            assert name == metric
+            assert type in ('gauge', 'counter', 'histogram')
+            parsed[metric]['type'] = type
+        else:
+            match = SAMPLE_LINE.match(line)
+            assert match, line
+            name = match.group('name')
+            assert name.startswith(metric)
+            labels = dict((label.group('name'), label.group('value'))
+                          for label in LABEL.finditer(match.group('labels') or ''))
+            parsed[metric]['samples'].append((name, labels, float(match.group('value'))))
+    return parsed
+
+def check_histogram(samples, labels=None):
+    """Check the buckets, sum and count of a histogram
+    - and return its count.
+    """
+    labels = labels or {}
+    selected = [(name, sample_labels, value) for name, sample_labels, value in samples
+                if all(sample_labels.get(key) == value for key, value in labels.items())]
+    buckets = [(sample_labels['le'], value) for name, sample_labels, value in selected
+               if name.endswith('_bucket')]
+    count, = [value for name, sample_labels, value in selected if name.endswith('_count')]
+    total, = [value for name, sample_labels, value in selected if name.endswith('_sum')]
+
+    # The buckets are cumulative and end with +Inf
+    bounds = [float(le) for le, value in buckets]
+    assert bounds == sorted(bounds)
+    assert buckets[-1] == ('+Inf', count)
+    values = [value for le, value in buckets]
+    assert values == sorted(values)
+    assert total >= 0
+    return count
+
+def gauge(parsed, metric, **labels):
+    value, = [value for name, sample_labels, value in parsed[metric]['samples']
+              if sample_labels == labels]
+    return value
+
+## =========================================================
+## Tests
+## ---------------------------------------------------------
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_metrics_of_a_generation(tmp_path, jobs):
+    template_dir = tmp_path / 'templates'
+    template_dir.mkdir()
+    (template_dir / 'README.md').write_text('# {{ project.name }}\n')
+    (template_dir / 'page.html').write_text('{{ "*temple*" | markdown }}\n')
+    (template_dir / 'part.jinja').write_text('part\n')
+    (template_dir / 'logo.png').write_bytes(b'\x89PNG' + bytes(range(256)))
+
+    engine = TemplateEngine('demo-project', 'demo', Settings({
+        'author': {'first-name': 'Ada', 'family-name': 'Lovelace'},
+        'demo-project': {
+            'template-dir': str(template_dir),
+            'project-dir':  str(tmp_path / 'project'),
+        },
+    }))
+    profiler = Profiler(latencies=get_latencies())
+    observer = MetricsObserver(profiler)
+    engine.generate(verbose=False, jobs=jobs, profiler=profiler, observer=observer)
+
+    metrics_file = tmp_path / 'temple.prom'
+    observer.save(metrics_file)
+    assert [path.name for path in tmp_path.iterdir() if path.is_file()] == ['temple.prom']
+
+    parsed = parse_metrics(metrics_file.read_text())
+    assert all(metric.startswith('temple_') for metric in parsed)
+
+    # The files
+    assert parsed['temple_files']['type'] == 'gauge'
+    assert gauge(parsed, 'temple_files', action='rendered') == 2
+    assert gauge(parsed, 'temple_files', action='copied') == 1
+    assert gauge(parsed, 'temple_files', action='skipped') == 1
+    assert gauge(parsed, 'temple_written_bytes', action='copied') == 260
+
+    # The histograms - including the filter calls of the worker processes
+    assert parsed['temple_file_render_duration_seconds']['type'] == 'histogram'
+    assert check_histogram(parsed['temple_file_render_duration_seconds']['samples']) == 2
+    assert check_histogram(parsed['temple_filter_call_duration_seconds']['samples'],
+                           {'filter': 'markdown'}) == 1
+
+    # The compilations and the generation
+    assert gauge(parsed, 'temple_template_compiles', kind='file') >= 2
+    assert gauge(parsed, 'temple_generation_duration_seconds') > 0
+    assert gauge(parsed, 'temple_generation_timestamp_seconds') > 0
+
+def test_metrics_without_profiler():
+    parsed = parse_metrics(MetricsObserver().format())
+
+    assert sorted(parsed) == ['temple_file_render_duration_seconds', 'temple_files',
+                              'temple_written_bytes']
+    assert gauge(parsed, 'temple_files', action='rendered') == 0
+    assert check_histogram(parsed['temple_file_render_duration_seconds']['samples']) == 0
+
+def test_label_values_are_escaped():
+    assert metrics._format_labels([('filter', 'a"b\\c\nd')]) == r'{filter="a\"b\\c\nd"}'
+    assert metrics._format_labels([]) == ''
+
+## =========================================================
+## =========================================================
+
+## fin.
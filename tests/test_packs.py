@@ -0,0 +1,59 @@
+## =========================================================
+## Copyright 2019 Dietrich Bollmann
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##      http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+## ---------------------------------------------------------
+
+"""tests/test_packs.py:
+
+Round trip of a template directory through a compiled template pack.
+
+"""
+
+from newskylabs.temple.templates.packs import compile_pack, TemplatePack
+from newskylabs.temple.templates.jinja import render_file
+from newskylabs.temple.templates.tree import ACTION_SKIP
+
+## =========================================================
+## Tests
+## ---------------------------------------------------------
+
+def test_pack_renders_included_jinja_templates(tmp_path):
+    """Templates of a pack can include the skipped '.jinja' templates.
+    """
+    template_dir = tmp_path / 'templates'
+    template_dir.mkdir()
+    (template_dir / 'README.md').write_text('Hello {{ name }}\n'
+                                            '{% include "part.jinja" %}\n')
+    (template_dir / 'part.jinja').write_text('part of {{ name }}\n')
+
+    pack_file = tmp_path / 'pack.zip'
+    compile_pack(str(template_dir), str(pack_file), verbose=False)
+
+    pack = TemplatePack(pack_file)
+
+    # The included template is still not generated itself
+    directories, files = pack.walk()
+    assert ('part.jinja', ACTION_SKIP) in [(path, action) for action, path, size, templated
+                                            in files]
+
+    output_file = tmp_path / 'README.md'
+    render_file(str(output_file), pack.template_file('README.md'), {'name': 'temple'},
+                registry=pack.create_registry())
+
+    assert output_file.read_text() == 'Hello temple\npart of temple\n'
+
+## =========================================================
+## =========================================================
+
+## fin.
@@ -0,0 +1,100 @@
+## =========================================================
+## Copyright 2019 Dietrich Bollmann
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##      http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+## ---------------------------------------------------------
+
+"""tests/test_parallel.py:
+
+Projects rendered by worker processes are identical to the projects
+rendered one file after the other.
+
+"""
+
+import os
+
+from newskylabs.temple.templates.engine import TemplateEngine
+
+## =========================================================
+## Utilities
+## ---------------------------------------------------------
+
+class Settings():
+    """Settings given as dictionary.
+    """
+
+    def __init__(self, settings):
+        self._settings = settings
+
+    def get_settings(self):
+        return self._settings
+
+def make_templates(template_dir):
+    """Create a template tree with a template modifying the variables.
+    """
+    (template_dir / 'sub').mkdir(parents=True)
+
+    (template_dir / 'a.txt').write_text('{% do demo.nav.append("x") %}{{ demo.nav }}\n')
+    (template_dir / 'sub' / 's.txt').write_text('{{ demo.nav }}\n')
+    for number in range(8):
+        (template_dir / 'f{}.txt'.format(number)).write_text('{{ demo.nav | join(",") }}\n')
+
+def generate(template_dir, project_dir, jobs):
+    settings = Settings({
+        'author': {'first-name': 'Ada', 'family-name': 'Lovelace'},
+        'demo': {'nav': ['a', 'b']},
+        'demo-project': {
+            'template-dir': str(template_dir),
+            'project-dir':  str(project_dir),
+        },
+    })
+
+    engine = TemplateEngine('demo-project', 'demo', settings)
+    engine.generate(verbose=False, jobs=jobs)
+
+def read_tree(directory):
+    """Return the files of a directory tree by their relative paths.
+    """
+    files = {}
+    for root, dirs, names in os.walk(str(directory)):
+        for name in names:
+            path = os.path.join(root, name)
+            with open(path, 'rb') as fh:
+                files[os.path.relpath(path, str(directory))] = fh.read()
+    return files
+
+## =========================================================
+## Tests
+## ---------------------------------------------------------
+
+def test_parallel_generation_is_identical(tmp_path):
+    """Templates modifying the variables do not change the output
+    of the templates rendered later - with one or several jobs.
+    """
+    template_dir = tmp_path / 'templates'
+    make_templates(template_dir)
+
+    generate(template_dir, tmp_path / 'sequential', jobs=1)
+    generate(template_dir, tmp_path / 'parallel', jobs=3)
+
+    sequential = read_tree(tmp_path / 'sequential')
+    parallel   = read_tree(tmp_path / 'parallel')
+
+    assert sequential == parallel
+    assert sequential[os.path.join('demo', 'demo.git', 'a.txt')] == b"['a', 'b', 'x']\n"
+    assert sequential[os.path.join('demo', 'demo.git', 'sub', 's.txt')] == b"['a', 'b']\n"
+
+## =========================================================
+## =========================================================
+
+## fin.
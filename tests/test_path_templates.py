@@ -0,0 +1,106 @@
+## =========================================================
+## Copyright 2019 Dietrich Bollmann
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##      http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+## ---------------------------------------------------------
+
+"""tests/test_path_templates.py:
+
+The path names containing jinja delimiters - compiled once
+by each environment.
+
+"""
+
+from newskylabs.temple.templates.engine import TemplateEngine
+from newskylabs.temple.templates.jinja import EnvironmentRegistry, jinja_str
+from newskylabs.temple.utils import profiling
+from newskylabs.temple.utils.profiling import Profiler
+
+## =========================================================
+## Utilities
+## ---------------------------------------------------------
+
+class Settings():
+    """Settings given as dictionary.
+    """
+
+    def __init__(self, settings):
+        self._settings = settings
+
+    def get_settings(self):
+        return self._settings
+
+def count_compiled_strings(function, *args, **kwargs):
+    """Call the given function
+    - and return the number of template strings it compiled.
+    """
+    profiler = Profiler()
+    profiling.activate(profiler)
+    try:
+        function(*args, **kwargs)
+    finally:
+        profiling.deactivate()
+    return profiler.get_calls('compile-string')
+
+## =========================================================
+## Tests
+## ---------------------------------------------------------
+
+def test_path_templates_are_compiled_once(tmp_path):
+    registry = EnvironmentRegistry(tmp_path)
+    path = '/project/{{ page }}/{{ name | upper }}.txt'
+
+    results = []
+    assert count_compiled_strings(
+        lambda: results.extend(jinja_str(path, {'page': page, 'name': 'a'}, registry=registry)
+                               for page in ['one', 'two', 'three'])) == 1
+    assert results == ['/project/one/A.txt', '/project/two/A.txt', '/project/three/A.txt']
+
+    # ...by each environment
+    other_registry = EnvironmentRegistry(tmp_path)
+    assert count_compiled_strings(jinja_str, path, {'page': 'one', 'name': 'b'},
+                                  registry=other_registry) == 1
+
+    # Without a registry
+    assert jinja_str(path, {'page': 'four', 'name': 'c'}) == '/project/four/C.txt'
+
+def test_updates_reuse_the_path_templates(tmp_path):
+    template_dir = tmp_path / 'templates'
+    (template_dir / '{{ page }}').mkdir(parents=True)
+    (template_dir / '{{ page }}' / '{{ page }}.txt').write_text('page {{ page }}\n')
+    (template_dir / 'README.md').write_text('# {{ project.name }}\n')
+
+    engine = TemplateEngine('demo-project', 'demo', Settings({
+        'author': {'first-name': 'Ada', 'family-name': 'Lovelace'},
+        'page': 'one',
+        'demo-project': {
+            'template-dir': str(template_dir),
+            'project-dir':  str(tmp_path / 'project'),
+        },
+    }))
+
+    # The registries are shared like in watch mode
+    options = {'verbose': False, 'registries': {}, 'auto_reload': True}
+    assert count_compiled_strings(engine.generate, state=True, **options) == 2
+
+    (template_dir / 'README.md').write_text('# {{ project.name }} updated\n')
+    assert count_compiled_strings(engine.update, **options) == 0
+
+    base_dir = tmp_path / 'project' / 'demo' / 'demo.git'
+    assert (base_dir / 'one' / 'one.txt').read_text() == 'page one\n'
+    assert (base_dir / 'README.md').read_text() == '# demo updated\n'
+
+## =========================================================
+## =========================================================
+
+## fin.
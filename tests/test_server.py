@@ -0,0 +1,202 @@
+## =========================================================
+## Copyright 2019 Dietrich Bollmann
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##      http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+## ---------------------------------------------------------
+
+"""tests/test_server.py:
+
+The temple server - served over TCP and a unix socket.
+
+"""
+
+import io
+import os
+import json
+import zipfile
+import threading
+import http.client
+
+import pytest
+
+from newskylabs.temple.defaults import DEFAULT_SETTINGS_FILE
+from newskylabs.temple.templates import server as temple_server
+from newskylabs.temple.templates.server import TempleService, TempleHTTPServer, \
+    TempleUnixServer, request_generate
+from newskylabs.temple.utils.settings_loader import TempleSettings
+
+## =========================================================
+## Utilities
+## ---------------------------------------------------------
+
+def write_user_settings(user_settings_file, tmp_path, first_name='Ada'):
+    user_settings_file.write_text('author:\n'
+                                  '  first-name: {}\n'
+                                  '  family-name: Lovelace\n'
+                                  'demo-project:\n'
+                                  '  template-dir: {}\n'
+                                  '  project-dir: {}\n'.format(first_name,
+                                                               tmp_path / 'templates',
+                                                               tmp_path / 'projects'))
+
+def request(address, method, path, body=None, headers=None):
+    """Send a request to the server at the given address.
+    Return the status and the decoded JSON response.
+    """
+    if 'socket_path' in address:
+        connection = temple_server._UnixHTTPConnection(address['socket_path'], timeout=10)
+    else:
+        connection = http.client.HTTPConnection(address['host'], address['port'], timeout=10)
+    try:
+        connection.request(method, path, body, headers or {})
+        response = connection.getresponse()
+        return response.status, json.loads(response.read().decode('utf-8'))
+    finally:
+        connection.close()
+
+@pytest.fixture(params=['tcp', 'unix'])
+def server(request, tmp_path):
+    """A temple server running in a thread.
+
+    Return the user settings file and the address of the server
+    - as keyword arguments of request_generate().
+    """
+    template_dir = tmp_path / 'templates'
+    template_dir.mkdir()
+    (template_dir / 'README.md').write_text('# {{ project.name }}\nby {{ author.name }}\n')
+
+    user_settings_file = tmp_path / 'settings.yaml'
+    write_user_settings(user_settings_file, tmp_path)
+    settings_files = [DEFAULT_SETTINGS_FILE, user_settings_file]
+
+    def load_settings():
+        return TempleSettings(*settings_files, snapshot_dir=None)
+
+    service = TempleService(load_settings, settings_files)
+    if request.param == 'tcp':
+        http_server = TempleHTTPServer(service, '127.0.0.1', 0, verbose=False)
+        address = {'host': '127.0.0.1', 'port': http_server.server_address[1]}
+    else:
+        socket_path = str(tmp_path / 'temple.sock')
+        http_server = TempleUnixServer(service, socket_path, verbose=False)
+        address = {'socket_path': socket_path}
+
+    thread = threading.Thread(target=http_server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield user_settings_file, address
+    finally:
+        http_server.shutdown()
+        http_server.server_close()
+        thread.join()
+
+## =========================================================
+## Tests
+## ---------------------------------------------------------
+
+def test_generate(server, tmp_path):
+    user_settings_file, address = server
+
+    result, archive = request_generate({'type': 'demo-project', 'name': 'one'},
+                                       timeout=10, **address)
+    assert result['success'], result
+    assert archive is None
+    readme = tmp_path / 'projects' / 'one' / 'one.git' / 'README.md'
+    assert readme.read_text() == '# one\nby Ada Lovelace\n'
+
+    # Modified settings are loaded again
+    write_user_settings(user_settings_file, tmp_path, first_name='Augusta')
+    stat = os.stat(str(user_settings_file))
+    os.utime(str(user_settings_file), ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+
+    # The project is returned as archive
+    result, archive = request_generate({'type': 'demo-project', 'name': 'two',
+                                        'archive_format': 'zip'}, timeout=10, **address)
+    assert result['success'], result
+    with zipfile.ZipFile(io.BytesIO(archive)) as archive_file:
+        assert archive_file.read('two/two.git/README.md') == b'# two\nby Augusta Lovelace\n'
+    assert not (tmp_path / 'projects' / 'two').exists()
+
+    # Failures are reported
+    result, archive = request_generate({'type': 'unknown-project', 'name': 'three'},
+                                       timeout=10, **address)
+    assert not result['success']
+    assert 'unknown-project' in result['message']
+
+    result, archive = request_generate({'type': 'demo-project', 'name': 'four',
+                                        'archive_format': 'rar'}, timeout=10, **address)
+    assert not result['success']
+
+def test_status(server):
+    user_settings_file, address = server
+
+    status, data = request(address, 'GET', '/status')
+    assert status == 200
+    assert data['pid'] == os.getpid()
+    assert data['requests'] == 0
+
+    request_generate({'type': 'demo-project', 'name': 'one'}, timeout=10, **address)
+
+    status, data = request(address, 'GET', '/status')
+    assert data['requests'] == 1
+    assert data['registries'] == 1
+
+def test_requests_from_web_pages_are_forbidden(server, tmp_path):
+    user_settings_file, address = server
+    body = json.dumps({'type': 'demo-project', 'name': 'one'})
+
+    for headers in [{'Origin': 'http://example.com'}, {'Host': 'example.com'}]:
+        status, data = request(address, 'GET', '/status', headers=headers)
+        assert status == 403
+
+        headers['Content-Type'] = 'application/json'
+        status, data = request(address, 'POST', '/generate', body, headers)
+        assert status == 403
+        assert data == {'success': False, 'message': 'Forbidden'}
+
+    # Requests to localhost are accepted
+    status, data = request(address, 'GET', '/status', headers={'Host': 'localhost:8080'})
+    assert status == 200
+
+    assert not (tmp_path / 'projects').exists()
+
+def test_bad_requests(server, tmp_path):
+    user_settings_file, address = server
+    body = json.dumps({'type': 'demo-project', 'name': 'one'})
+
+    # Only JSON is accepted
+    # - forms can be sent by web pages without preflight
+    for content_type in ['text/plain', 'application/x-www-form-urlencoded']:
+        status, data = request(address, 'POST', '/generate', body,
+                               {'Content-Type': content_type})
+        assert status == 415
+        assert not data['success']
+
+    status, data = request(address, 'POST', '/generate', '[1, 2]',
+                           {'Content-Type': 'application/json'})
+    assert status == 400
+
+    status, data = request(address, 'POST', '/unknown', body,
+                           {'Content-Type': 'application/json'})
+    assert status == 404
+
+    status, data = request(address, 'POST', '/generate', json.dumps({'name': 'one'}),
+                           {'Content-Type': 'application/json; charset=utf-8'})
+    assert status == 422
+
+    assert not (tmp_path / 'projects').exists()
+
+## =========================================================
+## =========================================================
+
+## fin.
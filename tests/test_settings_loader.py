@@ -0,0 +1,140 @@
+## =========================================================
+## Copyright 2019 Dietrich Bollmann
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##      http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+## ---------------------------------------------------------
+
+"""tests/test_settings_loader.py:
+
+Loading the settings and data files - and their snapshots.
+
+"""
+
+import os
+
+import pytest
+import yaml
+
+from newskylabs.temple.utils import settings_loader
+from newskylabs.temple.utils.settings_loader import load_data_file, load_merged_data_files, \
+    settings_snapshot_stats, clear_settings_snapshots, TempleSettings
+
+## =========================================================
+## Utilities
+## ---------------------------------------------------------
+
+def no_parsing(data_file):
+    raise AssertionError('{} has been parsed'.format(data_file))
+
+## =========================================================
+## Tests
+## ---------------------------------------------------------
+
+def test_data_files(tmp_path, monkeypatch):
+    yaml_file = tmp_path / 'data.yaml'
+    yaml_file.write_text('author:\n  first-name: Ada\nitems: [1, 2]\n')
+    json_file = tmp_path / 'data.json'
+    json_file.write_text('{"author": {"first-name": "Ada"}, "items": [1, 2]}')
+
+    expected = {'author': {'first-name': 'Ada'}, 'items': [1, 2]}
+    assert load_data_file(yaml_file) == expected
+    assert load_data_file(json_file) == expected
+
+    # yaml files are parsed safely
+    unsafe_file = tmp_path / 'unsafe.yaml'
+    unsafe_file.write_text('value: !!python/object/apply:os.getcwd []\n')
+    with pytest.raises(yaml.YAMLError):
+        load_data_file(unsafe_file)
+
+    # The libyaml loader is used when available
+    loaders = []
+
+    class CSafeLoader(yaml.SafeLoader):
+        def __init__(self, stream):
+            loaders.append(self)
+            super().__init__(stream)
+
+    monkeypatch.setattr(yaml, 'CSafeLoader', CSafeLoader, raising=False)
+    assert load_data_file(yaml_file) == expected
+    assert len(loaders) == 1
+
+def test_merged_data_files(tmp_path):
+    (tmp_path / 'defaults.yaml').write_text('author:\n  first-name: New\n  family-name: Sky\n')
+    (tmp_path / 'user.yaml').write_text('author:\n  first-name: Ada\n')
+
+    data = load_merged_data_files([tmp_path / 'defaults.yaml', tmp_path / 'missing.yaml',
+                                   tmp_path / 'user.yaml'], snapshot_dir=None)
+
+    assert data == {'author': {'first-name': 'Ada', 'family-name': 'Sky'}}
+
+def test_snapshots_are_used_until_a_file_changes(tmp_path, monkeypatch):
+    data_file = tmp_path / 'data.yaml'
+    data_file.write_text('name: one\n')
+    snapshot_dir = tmp_path / 'snapshots'
+
+    assert load_merged_data_files([data_file], snapshot_dir=snapshot_dir) == {'name': 'one'}
+    assert settings_snapshot_stats(snapshot_dir)['entries'] == 1
+
+    # The snapshot is used - without parsing the file
+    with monkeypatch.context() as patch:
+        patch.setattr(settings_loader, 'load_data_file', no_parsing)
+        assert load_merged_data_files([data_file], snapshot_dir=snapshot_dir) == {'name': 'one'}
+
+    # Modified files are parsed again
+    data_file.write_text('name: three\n')
+    assert load_merged_data_files([data_file], snapshot_dir=snapshot_dir) == {'name': 'three'}
+
+    # ...even when their size has not changed
+    data_file.write_text('name: seven\n')
+    stat = os.stat(str(data_file))
+    os.utime(str(data_file), ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+    assert load_merged_data_files([data_file], snapshot_dir=snapshot_dir) == {'name': 'seven'}
+
+    # Unreadable snapshots are ignored
+    for snapshot_file in snapshot_dir.iterdir():
+        snapshot_file.write_bytes(b'garbage')
+    assert load_merged_data_files([data_file], snapshot_dir=snapshot_dir) == {'name': 'seven'}
+
+    clear_settings_snapshots(snapshot_dir)
+    assert settings_snapshot_stats(snapshot_dir)['entries'] == 0
+
+def test_oldest_snapshots_are_removed(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings_loader, 'SETTINGS_SNAPSHOT_MAX_ENTRIES', 2)
+    snapshot_dir = tmp_path / 'snapshots'
+
+    for number in range(4):
+        data_file = tmp_path / 'data{}.yaml'.format(number)
+        data_file.write_text('number: {}\n'.format(number))
+        load_merged_data_files([data_file], snapshot_dir=snapshot_dir)
+
+    assert settings_snapshot_stats(snapshot_dir)['entries'] == 2
+
+def test_settings(tmp_path):
+    (tmp_path / 'defaults.yaml').write_text('company: NewSkyLabs\nauthor:\n  first-name: New\n')
+    (tmp_path / 'user.yaml').write_text('author:\n  first-name: Ada\n')
+    (tmp_path / 'project.json').write_text('{"project": {"name": "demo"}}')
+
+    settings = TempleSettings(tmp_path / 'defaults.yaml', tmp_path / 'user.yaml',
+                              snapshot_dir=tmp_path / 'snapshots')
+    settings.merge_settings_file(tmp_path / 'project.json')
+
+    assert settings.get_settings() == {
+        'company': 'NewSkyLabs',
+        'author':  {'first-name': 'Ada'},
+        'project': {'name': 'demo'},
+    }
+
+## =========================================================
+## =========================================================
+
+## fin.
@@ -0,0 +1,194 @@
+## =========================================================
+## Copyright 2019 Dietrich Bollmann
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##      http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+## ---------------------------------------------------------
+
+"""tests/test_sinks.py:
+
+Round trips of a generated project through tar and zip archives
+- written to files and streamed to stdout.
+
+"""
+
+import io
+import tarfile
+import zipfile
+
+import pytest
+from click.testing import CliRunner
+
+from newskylabs.temple.__main__ import cli
+from newskylabs.temple.defaults import ARCHIVE_FORMATS
+from newskylabs.temple.templates.engine import TemplateEngine
+from newskylabs.temple.templates.sinks import ArchiveSink, MemorySink
+
+## =========================================================
+## Utilities
+## ---------------------------------------------------------
+
+# The content of a copied binary file
+LOGO = b'\x89PNG\r\n' + bytes(range(256)) * 4
+
+class Settings():
+    """Settings given as dictionary.
+    """
+
+    def __init__(self, settings):
+        self._settings = settings
+
+    def get_settings(self):
+        return self._settings
+
+class Stream(io.RawIOBase):
+    """A binary stream which cannot seek - like stdout.
+    """
+
+    def __init__(self):
+        self.data = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.data.extend(data)
+        return len(data)
+
+def make_templates(template_dir):
+    (template_dir / 'docs').mkdir(parents=True)
+    (template_dir / 'README.md').write_text('# {{ project.name }}\nby {{ author.name }}\n')
+    (template_dir / 'docs' / 'index.md').write_text('{% for page in ["a", "b"] %}'
+                                                    '- {{ page }}\n{% endfor %}')
+    (template_dir / 'docs' / 'logo.png').write_bytes(LOGO)
+
+def generate(tmp_path, sink):
+    template_dir = tmp_path / 'templates'
+    if not template_dir.exists():
+        make_templates(template_dir)
+
+    engine = TemplateEngine('demo-project', 'demo', Settings({
+        'author': {'first-name': 'Ada', 'family-name': 'Lovelace'},
+        'demo-project': {
+            'template-dir': str(template_dir),
+            'project-dir':  str(tmp_path / 'project'),
+        },
+    }))
+    engine.generate(verbose=False, sink=sink)
+
+def expected_files(tmp_path):
+    """Return the files of the project - generated into memory.
+    """
+    sink = MemorySink()
+    generate(tmp_path, sink)
+    files = dict((path, content.encode('utf-8') if isinstance(content, str) else content)
+                 for path, content in sink.get_files().items())
+    return files, sink.get_directories()
+
+def read_tar(fileobj, archive_format):
+    mode = ARCHIVE_FORMATS[archive_format].replace('w', 'r')
+    files, directories = {}, []
+    with tarfile.open(fileobj=fileobj, mode=mode) as archive:
+        for member in archive:
+            if member.isdir():
+                directories.append(member.name)
+                assert member.mode == 0o755
+            else:
+                files[member.name] = archive.extractfile(member).read()
+                assert member.mode == 0o644
+    return files, directories
+
+def read_zip(fileobj):
+    files, directories = {}, []
+    with zipfile.ZipFile(fileobj) as archive:
+        assert archive.testzip() is None
+        for info in archive.infolist():
+            if info.is_dir():
+                directories.append(info.filename.rstrip('/'))
+            else:
+                files[info.filename] = archive.read(info)
+    return files, directories
+
+def read_archive(fileobj, archive_format):
+    if archive_format == 'zip':
+        return read_zip(fileobj)
+    return read_tar(fileobj, archive_format)
+
+## =========================================================
+## Tests
+## ---------------------------------------------------------
+
+@pytest.mark.parametrize('archive_format', sorted(ARCHIVE_FORMATS))
+def test_archive_files(tmp_path, archive_format):
+    files, directories = expected_files(tmp_path)
+
+    # The format is derived from the extension
+    archive_file = tmp_path / 'project.{}'.format(archive_format)
+    generate(tmp_path, ArchiveSink(str(archive_file)))
+
+    with open(str(archive_file), 'rb') as fh:
+        assert read_archive(fh, archive_format) == (files, directories)
+
+    assert files['demo/demo.git/docs/logo.png'] == LOGO
+    assert files['demo/demo.git/README.md'] == b'# demo\nby Ada Lovelace\n'
+
+    # Nothing is written to the project dir
+    assert not (tmp_path / 'project').exists()
+
+@pytest.mark.parametrize('archive_format', sorted(ARCHIVE_FORMATS))
+def test_archive_streams(tmp_path, archive_format):
+    files, directories = expected_files(tmp_path)
+
+    stream = Stream()
+    generate(tmp_path, ArchiveSink(stream, archive_format))
+
+    # The stream is not closed by the sink
+    assert not stream.closed
+    assert read_archive(io.BytesIO(bytes(stream.data)), archive_format) \
+        == (files, directories)
+
+def test_unknown_archive_format():
+    with pytest.raises(ValueError):
+        ArchiveSink(Stream(), 'rar')
+
+@pytest.mark.parametrize('archive_format', ['tar.gz', 'zip'])
+def test_archive_streamed_to_stdout(tmp_path, monkeypatch, archive_format):
+    """With '--archive -' the archive is written to stdout
+    - and the messages to stderr.
+    """
+    files, directories = expected_files(tmp_path)
+
+    # A project data file
+    monkeypatch.setenv('HOME', str(tmp_path / 'home'))
+    data_file = tmp_path / 'demo.yaml'
+    data_file.write_text('author:\n'
+                         '  first-name: Ada\n'
+                         '  family-name: Lovelace\n'
+                         'project:\n'
+                         '  template-dir: {}\n'
+                         '  project-dir: {}\n'.format(tmp_path / 'templates',
+                                                      tmp_path / 'project'))
+
+    result = CliRunner().invoke(cli, ['generate', str(data_file), 'demo',
+                                      '--archive', '-', '--archive-format', archive_format,
+                                      '--no-bytecode-cache', '--no-filter-cache',
+                                      '--no-tree-index'])
+    assert result.exit_code == 0, result.stderr
+
+    assert read_archive(io.BytesIO(result.stdout_bytes), archive_format) \
+        == (files, directories)
+    assert 'README.md' in result.stderr
+
+## =========================================================
+## =========================================================
+
+## fin.
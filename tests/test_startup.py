@@ -0,0 +1,97 @@
+## =========================================================
+## Copyright 2019 Dietrich Bollmann
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##      http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+## ---------------------------------------------------------
+
+"""tests/test_startup.py:
+
+'python -m newskylabs.temple --help' starts without importing the
+modules implementing the commands - so 'temple --help' and simple
+commands start fast.
+
+"""
+
+import sys
+import subprocess
+
+## =========================================================
+## Settings
+## ---------------------------------------------------------
+
+# The command run to measure the startup
+STARTUP_COMMAND = [sys.executable, '-X', 'importtime', '-m', 'newskylabs.temple', '--help']
+
+# The modules which must not be imported on startup
+HEAVY_MODULES = ['jinja2', 'yaml', 'markdown', 'newskylabs.temple.templates.engine']
+
+# Budget of the cumulative import time of 'temple --help' in seconds.
+# The imports take about 0.07 s on a developer machine - the budget
+# leaves room for slow machines and catches new slow imports;
+# the heavy modules are caught by name.
+STARTUP_BUDGET = 0.25
+
+## =========================================================
+## Utilities
+## ---------------------------------------------------------
+
+def run_with_importtime(command):
+    """Run the given command with '-X importtime'.
+    Return the finished process, the names of the imported modules
+    and the cumulative import time of the top-level imports in seconds.
+    """
+    process = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                             universal_newlines=True)
+
+    # The lines of -X importtime are of the form
+    # 'import time: <self> | <cumulative> | <indented module name>'
+    # with the times in microseconds;
+    # the names of the top-level imports are indented by a single space
+    modules = set()
+    cumulative = 0
+    for line in process.stderr.splitlines():
+        if line.startswith('import time:') and not line.endswith('imported package'):
+            self_time, cumulative_time, name = line[len('import time:'):].split('|')
+            modules.add(name.strip())
+            if not name.startswith('  '):
+                cumulative += int(cumulative_time)
+
+    return process, modules, cumulative / 1e6
+
+## =========================================================
+## Tests
+## ---------------------------------------------------------
+
+def test_help_starts_fast():
+    """'temple --help' imports neither jinja2 and yaml nor the template
+    engine - and stays within the import time budget.
+    """
+    process, modules, cumulative = run_with_importtime(STARTUP_COMMAND)
+
+    assert process.returncode == 0, process.stderr
+    assert 'Usage:' in process.stdout
+    assert 'newskylabs.temple.scripts.temple' in modules
+
+    for heavy in HEAVY_MODULES:
+        assert not [module for module in modules
+                    if module == heavy or module.startswith(heavy + '.')], \
+            '{} is imported on startup'.format(heavy)
+
+    assert cumulative < STARTUP_BUDGET, \
+        "The imports of 'temple --help' took {:.3f} s - the budget is {} s" \
+        .format(cumulative, STARTUP_BUDGET)
+
+## =========================================================
+## =========================================================
+
+## fin.
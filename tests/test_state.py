@@ -0,0 +1,144 @@
+## =========================================================
+## Copyright 2019 Dietrich Bollmann
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##      http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+## ---------------------------------------------------------
+
+"""tests/test_state.py:
+
+Recording the generation state and updating projects.
+
+"""
+
+import pytest
+
+from newskylabs.temple.templates.engine import TemplateEngine, ProjectStateNotFoundError
+from newskylabs.temple.templates.state import STATE_FILE
+
+## =========================================================
+## Utilities
+## ---------------------------------------------------------
+
+class Settings():
+    """Settings given as dictionary.
+    """
+
+    def __init__(self, settings):
+        self._settings = settings
+
+    def get_settings(self):
+        return self._settings
+
+def make_engine(template_dir, project_dir, page='one'):
+    return TemplateEngine('demo-project', 'demo', Settings({
+        'author': {'first-name': 'Ada', 'family-name': 'Lovelace'},
+        'demo': {'nav': ['a', 'b']},
+        'page': page,
+        'demo-project': {
+            'template-dir': str(template_dir),
+            'project-dir':  str(project_dir),
+        },
+    }))
+
+def make_templates(template_dir):
+    template_dir.mkdir()
+    (template_dir / 'README.md').write_text('# {{ project.name }}\n')
+    (template_dir / 'nav.txt').write_text('{{ demo.nav | join(",") }}\n')
+
+    # Templates modifying the variables
+    (template_dir / 'append.txt').write_text('{% do demo.nav.append("x") %}{{ demo.nav }}\n')
+    (template_dir / 'author.txt').write_text('{% do author.update({"name": "A. L."}) %}'
+                                             '{{ author.name }}\n')
+
+## =========================================================
+## Tests
+## ---------------------------------------------------------
+
+def test_state_is_only_recorded_when_asked_for(tmp_path):
+    template_dir = tmp_path / 'templates'
+    make_templates(template_dir)
+
+    make_engine(template_dir, tmp_path / 'plain').generate(verbose=False)
+    assert list((tmp_path / 'plain').rglob('README.md'))
+    assert not list((tmp_path / 'plain').rglob(STATE_FILE))
+
+    # Projects without state cannot be updated
+    with pytest.raises(ProjectStateNotFoundError):
+        make_engine(template_dir, tmp_path / 'plain').update(verbose=False)
+
+    make_engine(template_dir, tmp_path / 'stateful').generate(verbose=False, state=True)
+    assert list((tmp_path / 'stateful').rglob(STATE_FILE))
+
+def test_update_after_generate_changes_nothing(tmp_path):
+    """The variables are fingerprinted as they are given
+    - not as modified by the templates.
+    """
+    template_dir = tmp_path / 'templates'
+    make_templates(template_dir)
+
+    for jobs in (1, 2):
+        project_dir = tmp_path / 'jobs-{}'.format(jobs)
+        make_engine(template_dir, project_dir).generate(verbose=False, jobs=jobs, state=True)
+        outcomes = make_engine(template_dir, project_dir).update(verbose=False, jobs=jobs)
+
+        assert len(outcomes['unchanged']) == 4
+        assert outcomes['updated'] == []
+        assert outcomes['conflict'] == []
+        assert outcomes['obsolete'] == []
+
+def test_obsolete_files_are_reported_until_removed(tmp_path):
+    """Files are obsolete when their templated paths change
+    or their templates are removed.
+    """
+    template_dir = tmp_path / 'templates'
+    make_templates(template_dir)
+    (template_dir / '{{ page }}.txt').write_text('page {{ page }}\n')
+    (template_dir / 'removed.txt').write_text('removed\n')
+
+    project_dir = tmp_path / 'project'
+    make_engine(template_dir, project_dir, page='one').generate(verbose=False, state=True)
+    base_dir = project_dir / 'demo' / 'demo.git'
+    assert (base_dir / 'one.txt').read_text() == 'page one\n'
+
+    # Rename the page and remove a template
+    (template_dir / 'removed.txt').unlink()
+    outcomes = make_engine(template_dir, project_dir, page='two').update(verbose=False)
+
+    assert outcomes['updated'] == [str(base_dir / 'two.txt')]
+    assert outcomes['obsolete'] == [str(base_dir / 'one.txt'), str(base_dir / 'removed.txt')]
+    assert (base_dir / 'one.txt').exists()
+
+    # The obsolete files are reported again
+    # - until they are removed
+    (base_dir / 'removed.txt').write_text('edited\n')
+    outcomes = make_engine(template_dir, project_dir, page='two').update(verbose=False)
+    assert outcomes['obsolete'] == [str(base_dir / 'one.txt'), str(base_dir / 'removed.txt')]
+
+    # Only the unmodified obsolete files are removed
+    outcomes = make_engine(template_dir, project_dir, page='two') \
+        .update(verbose=False, remove_obsolete=True)
+    assert outcomes['removed'] == [str(base_dir / 'one.txt')]
+    assert outcomes['obsolete'] == [str(base_dir / 'removed.txt')]
+    assert not (base_dir / 'one.txt').exists()
+    assert (base_dir / 'removed.txt').read_text() == 'edited\n'
+
+    # Deleted obsolete files are forgotten
+    (base_dir / 'removed.txt').unlink()
+    outcomes = make_engine(template_dir, project_dir, page='two').update(verbose=False)
+    assert outcomes['obsolete'] == []
+    assert outcomes['removed'] == []
+
+## =========================================================
+## =========================================================
+
+## fin.
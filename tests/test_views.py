@@ -0,0 +1,180 @@
+## =========================================================
+## Copyright 2019 Dietrich Bollmann
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##      http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+## ---------------------------------------------------------
+
+"""tests/test_views.py:
+
+The copy-on-write, read-only and translating views of the variables.
+
+"""
+
+import copy
+import json
+import pickle
+
+import pytest
+
+from newskylabs.temple.templates.jinja import EnvironmentRegistry
+from newskylabs.temple.utils.string_utilities import hyphen_to_underscore_in_keys
+from newskylabs.temple.utils.views import copy_on_write, read_only, json_default, to_plain, \
+    hyphen_to_underscore_view
+
+## =========================================================
+## Utilities
+## ---------------------------------------------------------
+
+def make_variables():
+    return {
+        'project': {'name': 'demo', 'tags': ['a', 'b']},
+        'pages':   [{'title': 'One'}, {'title': 'Two'}],
+        'count':   2,
+    }
+
+def make_settings():
+    """Settings with hyphenated keys - at all levels.
+    """
+    return {
+        'author': {'first-name': 'Ada', 'family-name': 'Lovelace', 'name': 'Ada Lovelace'},
+        'demo-project': {
+            'template-dir': '/templates',
+            'nav': ['home', 'about'],
+            'pages': [
+                {'page-title': 'Home', 'tags': ['a', 'b'], 'order': 2},
+                {'page-title': 'About', 'tags': [], 'order': 1},
+            ],
+            'pair': ({'first-item': 1}, 'two'),
+        },
+        # Keys only differing in hyphens and underscores:
+        # the position of the first key and the value of the last key
+        'dup-key': 'first',
+        'other': 0,
+        'dup_key': 'last',
+        'count': 3,
+    }
+
+# Templates rendered with the converted and with the viewed settings
+TEMPLATES = [
+    '{{ author }}',
+    '{{ demo_project }}',
+    '{{ author.first_name }} {{ author["family_name"] }}',
+    '{{ dup_key }} {{ other }}',
+    '{% for key, value in demo_project.items() %}{{ key }}={{ value }};{% endfor %}',
+    '{% for key in demo_project %}{{ key }},{% endfor %}',
+    '{% for key, value in author | dictsort %}{{ key }}={{ value }};{% endfor %}',
+    '{% for page in demo_project.pages %}{{ loop.index }}:{{ page.page_title }}{% endfor %}',
+    '{% for page in demo_project.pages | sort(attribute="order") %}{{ page.page_title }}{% endfor %}',
+    '{{ demo_project.nav | join(", ") }} {{ demo_project.nav | length }}',
+    '{{ demo_project.nav[1:] }} {{ demo_project.nav[-1] }} {{ demo_project.nav | first }}',
+    '{{ demo_project.nav + ["contact"] }} {{ ["start"] + demo_project.nav }}',
+    '{{ demo_project.nav == ["home", "about"] }} {{ demo_project.pages[1].tags == [] }}',
+    '{{ demo_project.pair }} {{ demo_project.pair[0].first_item }}',
+    '{{ "first_name" in author }} {{ "first-name" in author }} {{ author is mapping }}',
+    '{{ demo_project | tojson }}',
+    '{{ demo_project | pprint }}',
+    '{{ demo_project.pages | map(attribute="tags") | list }}',
+    '{% do demo_project.nav.append("x") %}{% do author.update({"age": 36}) %}'
+    '{{ demo_project.nav }} {{ author }}',
+    '{% set pages = demo_project.pages %}{% do pages[0].tags.append("c") %}'
+    '{{ demo_project.pages }}',
+]
+
+def render(template, variables):
+    registry = EnvironmentRegistry('/templates')
+    return registry.get_environment().from_string(template).render(**variables)
+
+## =========================================================
+## Tests
+## ---------------------------------------------------------
+
+def test_views_equal_the_variables():
+    variables = make_variables()
+    view = copy_on_write(variables)
+
+    assert view == variables
+    assert variables == view
+    assert repr(view) == repr(variables)
+    assert json.dumps(view, default=json_default, sort_keys=True) \
+        == json.dumps(variables, sort_keys=True)
+    assert to_plain(view) == variables
+    assert pickle.loads(pickle.dumps(view)) == variables
+
+def test_modifications_are_not_seen_by_the_variables():
+    variables = make_variables()
+    view = copy_on_write(variables)
+
+    view['project']['tags'].append('c')
+    view['pages'][0]['title'] = 'First'
+    view['count'] += 1
+
+    assert view['project']['tags'] == ['a', 'b', 'c']
+    assert view['pages'][0]['title'] == 'First'
+    assert view['count'] == 3
+
+    # Neither the variables nor the other views are modified
+    assert variables == make_variables()
+    assert copy_on_write(variables) == make_variables()
+
+def test_read_only_views_cannot_be_modified():
+    variables = make_variables()
+    view = read_only(variables)
+
+    with pytest.raises(TypeError):
+        view['project']['tags'].append('c')
+    with pytest.raises(TypeError):
+        view['count'] = 3
+
+    assert variables == make_variables()
+
+def test_translated_views_equal_the_converted_settings():
+    settings = make_settings()
+    converted = hyphen_to_underscore_in_keys(settings)
+    view = hyphen_to_underscore_view(settings)
+
+    assert view == converted
+    assert list(view) == list(converted)
+    assert repr(view) == repr(converted)
+    assert to_plain(view) == converted
+    assert pickle.loads(pickle.dumps(view)) == converted
+    assert view['demo_project']['pages'][0]['page_title'] == 'Home'
+    assert 'page-title' not in view['demo_project']['pages'][0]
+
+    # The settings are not copied or modified
+    assert settings == make_settings()
+
+    # The views derived from the view translate the keys as well
+    assert copy_on_write(view) == converted
+    assert read_only(view) == converted
+
+@pytest.mark.parametrize('template', TEMPLATES)
+def test_translated_views_render_like_the_converted_settings(template):
+    """Rendering with the copy-on-write views of the translating view
+    gives the output of rendering with a copy of the converted settings.
+    """
+    settings = make_settings()
+    converted = hyphen_to_underscore_in_keys(settings)
+    view = hyphen_to_underscore_view(settings)
+
+    expected = render(template, copy.deepcopy(converted))
+
+    # The modifications of a template are not seen by the next one
+    assert render(template, copy_on_write(view)) == expected
+    assert render(template, copy_on_write(view)) == expected
+
+    assert settings == make_settings()
+
+## =========================================================
+## =========================================================
+
+## fin.
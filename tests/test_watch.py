@@ -0,0 +1,91 @@
+## =========================================================
+## Copyright 2019 Dietrich Bollmann
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##      http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+## ---------------------------------------------------------
+
+"""tests/test_watch.py:
+
+Watching the templates with 'temple generate --watch'.
+
+"""
+
+import pytest
+from click.testing import CliRunner
+
+from newskylabs.temple.__main__ import cli
+from newskylabs.temple.utils import file_watcher
+
+## =========================================================
+## Utilities
+## ---------------------------------------------------------
+
+class Watcher():
+    """A watcher which is never notified.
+    """
+
+    def close(self):
+        pass
+
+def watch_once(template_file):
+    """Return a replacement of file_watcher.watch() modifying the
+    given template once - and stopping like Ctrl-C afterwards.
+    """
+    def watch(watcher, debounce=None):
+        template_file.write_text('modified {{ project.name }}\n')
+        yield {str(template_file)}
+        raise KeyboardInterrupt()
+    return watch
+
+## =========================================================
+## Tests
+## ---------------------------------------------------------
+
+@pytest.mark.parametrize('quiet', [False, True])
+def test_watch(tmp_path, monkeypatch, quiet):
+    template_dir = tmp_path / 'templates'
+    template_dir.mkdir()
+    template_file = template_dir / 'README.md'
+    template_file.write_text('# {{ project.name }}\n')
+
+    monkeypatch.setenv('HOME', str(tmp_path / 'home'))
+    data_file = tmp_path / 'demo.yaml'
+    data_file.write_text('author:\n'
+                         '  first-name: Ada\n'
+                         '  family-name: Lovelace\n'
+                         'project:\n'
+                         '  template-dir: {}\n'
+                         '  project-dir: {}\n'.format(template_dir, tmp_path / 'project'))
+
+    monkeypatch.setattr(file_watcher, 'create_watcher', lambda paths: Watcher())
+    monkeypatch.setattr(file_watcher, 'watch', watch_once(template_file))
+
+    args = ['generate', str(data_file), 'demo', '--watch', '--no-bytecode-cache',
+            '--no-filter-cache', '--no-tree-index']
+    result = CliRunner().invoke(cli, args + (['--quiet'] if quiet else []))
+    assert result.exit_code == 0, result.output
+
+    # The modified template has been rendered again
+    readme = tmp_path / 'project' / 'demo' / 'demo.git' / 'README.md'
+    assert readme.read_text() == 'modified demo\n'
+
+    # Nothing is printed with --quiet
+    if quiet:
+        assert result.output == ''
+    else:
+        assert result.output.count('Watching {}'.format(template_dir)) == 2
+
+## =========================================================
+## =========================================================
+
+## fin.